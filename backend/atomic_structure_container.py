@@ -1,6 +1,7 @@
 import re
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from atomic_structure_challenges import ATOMIC_STRUCTURE_CHALLENGES
+from engines import ExecutionEngine, register_engine, report_stage
 
 class AtomicStructureContainer:
     """Manages atomic structure challenge execution"""
@@ -158,17 +159,21 @@ class AtomicStructureContainer:
             "score": f"{len(keywords_found)}/{len(expected_keywords)} key concepts mentioned"
         }
 
-class AtomicStructureChallengeManager:
+class AtomicStructureChallengeManager(ExecutionEngine):
     """Manages atomic structure challenge execution and validation"""
     
+    name = "atomic_structure"
+    
     def __init__(self):
         self.container = AtomicStructureContainer()
     
-    def execute_challenge(self, challenge_id: int, user_id: str, user_answer: str) -> Dict[str, Any]:
+    def execute_challenge(self, challenge_id: int, user_id: str, user_answer: str,
+                          timeout_s: Optional[float] = None) -> Dict[str, Any]:
         """Execute an atomic structure challenge with user answer"""
         
         try:
             # Execute the challenge
+            report_stage("executing")
             result = self.container.execute_challenge(challenge_id, user_answer)
             
             # Add standard format expected by the main system
@@ -207,4 +212,5 @@ class AtomicStructureChallengeManager:
         return challenge.get("type", "multiple_choice") if challenge else "unknown"
 
 # Global atomic structure challenge manager instance
-atomic_structure_challenge_manager = AtomicStructureChallengeManager() 
\ No newline at end of file
+atomic_structure_challenge_manager = AtomicStructureChallengeManager()
+register_engine(atomic_structure_challenge_manager)
@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import as_completed, TimeoutError as FutureTimeout
+from typing import Dict, Any, Iterator, List, Tuple
+
+from engine_scheduler import engine_scheduler, EngineScheduler
+from engines import ExecutionEngine, timed_out_result
+
+# Items accepted in one batch request
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+# Items still running when the whole batch exceeds this are reported as timed out
+BATCH_TIMEOUT_S = float(os.getenv("BATCH_TIMEOUT_S", "600"))
+# Graded items are recorded in transactions of this many, as their verdicts stream out
+BATCH_RECORD_CHUNK = int(os.getenv("BATCH_RECORD_CHUNK", "100"))
+
+
+class BatchGrader:
+    """Grades many submissions in one pass on the engine scheduler
+
+    Items are grouped by engine and challenge. Every group's shared state (the
+    SQLite database, the DuckDB template, the Postgres clone) is warmed once,
+    all groups concurrently, and each group's queries are queued as soon as
+    its warm-up finishes. Results are yielded as queries complete, not in
+    request order.
+    """
+
+    def __init__(self, scheduler: EngineScheduler = engine_scheduler, timeout_s: float = BATCH_TIMEOUT_S):
+        self.scheduler = scheduler
+        self.timeout_s = timeout_s
+
+    def grade(self, items: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Yield (item, result) for items with engine, challenge_id, user_id and query"""
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for item in items:
+            groups.setdefault((item["engine"].name, item["challenge_id"]), []).append(item)
+
+        warmups = [self.scheduler.executor.submit(self._warm, group[0]["engine"], challenge_id)
+                   for (_, challenge_id), group in groups.items()]
+        futures = {}
+        for warmup, group in zip(warmups, groups.values()):
+            warmup.result()
+            for item in group:
+                future = self.scheduler.submit(item["engine"], item["challenge_id"], str(item["user_id"]),
+                                               item["query"])
+                futures[future] = item
+
+        pending = set(futures)
+        try:
+            for future in as_completed(futures, timeout=self.timeout_s):
+                pending.discard(future)
+                yield futures[future], future.result()
+        except FutureTimeout:
+            # Engines that cannot cancel keep running in the background; their results are discarded
+            for future in pending:
+                item = futures[future]
+                self.scheduler.metrics_for(item["engine"].name).abandon()
+                yield item, timed_out_result(self.timeout_s)
+
+    def _warm(self, engine: ExecutionEngine, challenge_id: int):
+        try:
+            engine.warm(challenge_id)
+        except Exception as e:
+            # The group still runs; each submission then reports its own setup error
+            print(f"Error warming {engine.name} for challenge {challenge_id}: {e}")
+
+
+def batch_verdict(item: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact per-item verdict for the batch response"""
+    return {
+        "index": item["index"],
+        "user_id": item["user_id"],
+        "challenge_id": item["challenge_id"],
+        "engine": item["engine"].name,
+        "success": result.get("success", False),
+        "passed": bool(result.get("passed", False)),
+        "timed_out": bool(result.get("timed_out", False)),
+        "error": result.get("error"),
+        "row_count": result.get("row_count"),
+        "elapsed_ms": result.get("elapsed_ms"),
+    }
+
+# Global batch grader instance
+batch_grader = BatchGrader()
@@ -0,0 +1,7 @@
+"""
+Benchmark and load-test tooling for the SQL Challenges backend.
+
+Run the modules in this package from the ``backend`` directory, e.g.::
+
+    python -m bench.load_test --scenario all --output load.json
+"""
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Per-engine microbenchmarks for the challenge containers.
+
+For every challenge and engine the reference answer is run through each
+phase of a submission (environment setup, query execution, result
+normalization, validation, cleanup and the manager end to end). Timings
+are medians over --repeats iterations; allocations are measured in a
+separate tracemalloc pass so they don't skew the timings.
+
+Examples (from the backend directory):
+
+    python -m bench.container_bench --save-baseline bench/container_baseline.json
+    python -m bench.container_bench --compare bench/container_baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, List, Optional
+
+import duckdb
+import sqlite3
+
+from challenges import CHALLENGES
+from atomic_structure_challenges import ATOMIC_STRUCTURE_CHALLENGES
+from challenge_container import ChallengeManager
+from duckdb_container import DuckDBChallengeManager
+from atomic_structure_container import AtomicStructureChallengeManager
+
+BENCH_USER_ID = "bench"
+
+
+def _fetch_sqlite(conn: sqlite3.Connection, query: str) -> List[tuple]:
+    return conn.execute(query).fetchall()
+
+
+def _fetch_duckdb(conn: duckdb.DuckDBPyConnection, query: str):
+    return conn.execute(query).fetch_arrow_table()
+
+
+def atomic_reference_answer(challenge: Dict[str, Any]) -> str:
+    """Answer that AtomicStructureContainer grades as correct"""
+    question_type = challenge.get("type", "multiple_choice")
+    if question_type == "multiple_choice":
+        return chr(ord('A') + challenge["correct_answer"])
+    if question_type == "true_false":
+        return "True" if challenge["correct_answer"] else "False"
+    if question_type == "short_answer":
+        return " ".join(challenge["expected_output"])
+    return str(challenge["correct_answer"])
+
+
+def sql_reference_query(challenge: Dict[str, Any], engine: str) -> str:
+    """Reference solution for a SQL challenge on the given engine"""
+    return challenge.get(f"{engine}_reference_query", challenge["reference_query"])
+
+
+class PhaseTimer:
+    """Accumulates per-phase timings and allocation figures"""
+
+    def __init__(self):
+        self.timings: Dict[str, List[float]] = {}
+        self.allocations: Dict[str, Dict[str, float]] = {}
+
+    def time(self, phase: str, fn: Callable[[], Any]) -> Any:
+        start = time.perf_counter()
+        result = fn()
+        self.timings.setdefault(phase, []).append(time.perf_counter() - start)
+        return result
+
+    def trace(self, phase: str, fn: Callable[[], Any]) -> Any:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        after, peak = tracemalloc.get_traced_memory()
+        self.allocations[phase] = {
+            "peak_alloc_kb": round((peak - before) / 1024, 2),
+            "net_alloc_kb": round((after - before) / 1024, 2),
+        }
+        return result
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        phases = {}
+        for phase, samples in self.timings.items():
+            phases[phase] = {
+                "median_ms": round(statistics.median(samples) * 1000, 4),
+                "min_ms": round(min(samples) * 1000, 4),
+                "max_ms": round(max(samples) * 1000, 4),
+            }
+            phases[phase].update(self.allocations.get(phase, {}))
+        return phases
+
+
+def bench_sql_challenge(manager, fetch_raw: Callable[[Any, str], Any],
+                        challenge_id: int, query: str, repeats: int) -> Dict[str, Any]:
+    """Benchmark one SQL challenge phase by phase"""
+    container = manager.container
+    timer = PhaseTimer()
+    passed = None
+
+    def run_phases(measure: Callable[[str, Callable[[], Any]], Any]):
+        environment = measure("setup", lambda: container.create_challenge_environment(challenge_id, BENCH_USER_ID))
+        try:
+            result = measure("execute", lambda: container.execute_query(environment, query))
+            # Connect the way the container does: dataset environments have no db_path
+            conn = container.connect(environment)
+            try:
+                raw_rows = fetch_raw(conn, query)
+            finally:
+                conn.close()
+            measure("normalize", lambda: container.normalize_results(raw_rows))
+            valid = measure("validate", lambda: manager._validate_result(challenge_id, result))
+        finally:
+            measure("cleanup", lambda: container.cleanup_environment(environment))
+        measure("total", lambda: manager.execute_challenge(challenge_id, BENCH_USER_ID, query))
+        return valid
+
+    for _ in range(repeats):
+        passed = run_phases(timer.time)
+
+    tracemalloc.start()
+    try:
+        run_phases(timer.trace)
+    finally:
+        tracemalloc.stop()
+
+    return {"passed": passed, "phases": timer.report()}
+
+
+def bench_atomic_challenge(manager, challenge_id: int, answer: str, repeats: int) -> Dict[str, Any]:
+    """Benchmark one atomic structure challenge (no environment to set up)"""
+    container = manager.container
+    timer = PhaseTimer()
+    passed = None
+
+    def run_phases(measure: Callable[[str, Callable[[], Any]], Any]):
+        measure("execute", lambda: container.execute_challenge(challenge_id, answer))
+        result = measure("total", lambda: manager.execute_challenge(challenge_id, BENCH_USER_ID, answer))
+        return result.get("passed")
+
+    for _ in range(repeats):
+        passed = run_phases(timer.time)
+
+    tracemalloc.start()
+    try:
+        run_phases(timer.trace)
+    finally:
+        tracemalloc.stop()
+
+    return {"passed": passed, "phases": timer.report()}
+
+
+ENGINES = ["sqlite", "duckdb", "atomic"]
+
+
+def run_benchmarks(engines: List[str], challenge_ids: Optional[List[int]], repeats: int) -> Dict[str, Any]:
+    """Run the selected engines over the selected challenges"""
+    results = {}
+
+    sql_engines = {
+        "sqlite": (ChallengeManager(), _fetch_sqlite),
+        "duckdb": (DuckDBChallengeManager(), _fetch_duckdb),
+    }
+    for engine, (manager, fetch_raw) in sql_engines.items():
+        if engine not in engines:
+            continue
+        for challenge in CHALLENGES:
+            if challenge_ids and challenge["id"] not in challenge_ids:
+                continue
+            query = sql_reference_query(challenge, engine)
+            results[f"{engine}:{challenge['id']}"] = dict(
+                engine=engine, challenge_id=challenge["id"],
+                **bench_sql_challenge(manager, fetch_raw, challenge["id"], query, repeats)
+            )
+
+    if "atomic" in engines:
+        manager = AtomicStructureChallengeManager()
+        for challenge in ATOMIC_STRUCTURE_CHALLENGES:
+            if challenge_ids and challenge["id"] not in challenge_ids:
+                continue
+            answer = atomic_reference_answer(challenge)
+            results[f"atomic:{challenge['id']}"] = dict(
+                engine="atomic", challenge_id=challenge["id"],
+                **bench_atomic_challenge(manager, challenge["id"], answer, repeats)
+            )
+
+    return results
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any],
+                    threshold: float, min_delta_ms: float) -> List[Dict[str, Any]]:
+    """Return every phase whose median time grew by more than `threshold` (and `min_delta_ms`)"""
+    regressions = []
+    for key, entry in current.items():
+        base_entry = baseline.get(key)
+        if not base_entry:
+            continue
+        for phase, stats in entry["phases"].items():
+            base_stats = base_entry["phases"].get(phase)
+            if not base_stats or base_stats["median_ms"] <= 0:
+                continue
+            delta = stats["median_ms"] - base_stats["median_ms"]
+            ratio = stats["median_ms"] / base_stats["median_ms"]
+            if ratio > 1 + threshold and delta > min_delta_ms:
+                regressions.append({
+                    "benchmark": key,
+                    "phase": phase,
+                    "baseline_ms": base_stats["median_ms"],
+                    "current_ms": stats["median_ms"],
+                    "change": f"+{(ratio - 1) * 100:.1f}%",
+                })
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the challenge containers")
+    parser.add_argument("--engine", action="append", choices=ENGINES, help="Engine to benchmark (repeatable, default: all)")
+    parser.add_argument("--challenge", action="append", type=int, help="Challenge id to benchmark (repeatable, default: all)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed iterations per challenge")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write results to a baseline file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare results against a baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore slowdowns smaller than this")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    results = run_benchmarks(args.engine or ENGINES, args.challenge, args.repeats)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "repeats": args.repeats,
+        "results": results,
+    }
+
+    failed = [key for key, entry in results.items() if not entry["passed"]]
+    for key in failed:
+        print(f"WARNING: reference answer did not pass for {key}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline for {len(results)} benchmarks to {args.save_baseline}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline["results"], results, args.threshold, args.min_delta_ms)
+        print(json.dumps({"baseline_commit": baseline.get("git_commit"), "regressions": regressions}, indent=2))
+        return 1 if regressions else 0
+
+    if not args.save_baseline:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic data generator for scale-testing users.db.
+
+Fills the users, user_progress, user_submissions and password_reset_tokens
+tables created by main.init_db() with realistic distributions:
+
+- user activity follows a power law (a few very active students, a long tail)
+- students work through challenges in the same order as /challenges/next
+- retries per challenge are geometric with a pass rate that depends on the
+  challenge level, so progress rows always agree with the submissions
+
+Rows are written with executemany inside large transactions. The same
+--seed always produces the same database.
+
+Examples (from the backend directory):
+
+    python -m bench.generate_data --output /tmp/users.db --users 100000 --submissions 10000000
+    python -m bench.load_test --database /tmp/users.db --scenario leaderboard
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Tuple
+
+import bcrypt
+
+from challenges import CHALLENGES
+
+GENERATED_PASSWORD = "password123"
+START_DATE = datetime(2024, 1, 1)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Probability that a single attempt passes, per challenge level
+PASS_RATES = {"Basic": 0.7, "Intermediate": 0.5, "Advanced": 0.35}
+LEVEL_ORDER = {"Basic": 1, "Intermediate": 2, "Advanced": 3}
+
+# Pareto shape for user activity (~80/20 split)
+ACTIVITY_ALPHA = 1.16
+
+
+def generated_user_email(index: int) -> str:
+    """Email of the index-th generated user (1-based)"""
+    return f"user{index}@example.com"
+
+
+class SyntheticDataGenerator:
+    """Generates deterministic rows for the app database tables"""
+
+    def __init__(self, users: int, submissions: int, seed: int = 42, reset_token_rate: float = 0.02):
+        self.users = users
+        self.submissions = submissions
+        self.seed = seed
+        self.reset_token_rate = reset_token_rate
+        self.challenges = sorted(CHALLENGES, key=lambda c: (LEVEL_ORDER[c["level"]], c["id"]))
+        # One bcrypt hash shared by every user - hashing millions of passwords is not the point
+        self.password_hash = bcrypt.hashpw(
+            GENERATED_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4)
+        ).decode('utf-8')
+
+    def _submission_budgets(self, rng: random.Random) -> List[int]:
+        """Split the submission total across users following a power law"""
+        weights = [rng.paretovariate(ACTIVITY_ALPHA) for _ in range(self.users)]
+        total_weight = sum(weights)
+        budgets = [int(self.submissions * w / total_weight) for w in weights]
+
+        # Hand out the rounding remainder to the most active users first
+        remainder = self.submissions - sum(budgets)
+        for index in sorted(range(self.users), key=lambda i: -weights[i])[:remainder]:
+            budgets[index] += 1
+        return budgets
+
+    def user_rows(self) -> Iterator[Tuple]:
+        rng = random.Random(f"{self.seed}-users")
+        for user_id in range(1, self.users + 1):
+            created_at = START_DATE + timedelta(seconds=rng.randrange(0, 180 * 86400))
+            yield (user_id, generated_user_email(user_id), self.password_hash, created_at.strftime(TIMESTAMP_FORMAT))
+
+    def activity_rows(self) -> Iterator[Tuple[str, Tuple]]:
+        """Yield ("submission", row) and ("progress", row) tuples for every user"""
+        rng = random.Random(f"{self.seed}-activity")
+        created = random.Random(f"{self.seed}-users")
+        budgets = self._submission_budgets(rng)
+
+        for user_id in range(1, self.users + 1):
+            clock = START_DATE + timedelta(seconds=created.randrange(0, 180 * 86400))
+            budget = budgets[user_id - 1]
+            progress = {}
+            solved = []
+
+            for challenge in self.challenges:
+                if budget <= 0:
+                    break
+                pass_rate = PASS_RATES[challenge["level"]]
+                entry = progress[challenge["id"]] = [None, 0]
+
+                while budget > 0 and entry[0] is None:
+                    entry[1] += 1
+                    budget -= 1
+                    clock += timedelta(seconds=rng.randrange(20, 900))
+                    passed = rng.random() < pass_rate
+                    query = challenge["reference_query"].strip()
+                    if not passed:
+                        query += " LIMIT 0"
+                    submitted_at = clock.strftime(TIMESTAMP_FORMAT)
+                    yield "submission", (user_id, challenge["id"], query, passed, submitted_at)
+                    if passed:
+                        entry[0] = submitted_at
+                        solved.append(challenge)
+
+            # Students who finished everything keep re-submitting solved challenges
+            while budget > 0 and solved:
+                challenge = rng.choice(solved)
+                progress[challenge["id"]][1] += 1
+                budget -= 1
+                clock += timedelta(seconds=rng.randrange(20, 900))
+                yield "submission", (user_id, challenge["id"], challenge["reference_query"].strip(), True,
+                                     clock.strftime(TIMESTAMP_FORMAT))
+
+            # Every submission counts as an attempt, like record_submission_and_progress
+            for challenge_id, (solved_at, attempts) in progress.items():
+                yield "progress", (user_id, challenge_id, solved_at, attempts)
+
+    def reset_token_rows(self) -> Iterator[Tuple]:
+        rng = random.Random(f"{self.seed}-tokens")
+        for user_id in range(1, self.users + 1):
+            if rng.random() >= self.reset_token_rate:
+                continue
+            created_at = START_DATE + timedelta(seconds=rng.randrange(0, 180 * 86400))
+            expires_at = created_at + timedelta(minutes=30)
+            yield (user_id, f"{rng.getrandbits(128):032x}", expires_at.strftime(TIMESTAMP_FORMAT),
+                   rng.random() < 0.6, created_at.strftime(TIMESTAMP_FORMAT))
+
+
+def _init_schema(db_path: str):
+    """Create the tables exactly as the app does"""
+    from main import init_db
+
+    saved = {key: os.environ.pop(key, None) for key in ("DATABASE_PATH", "RAILWAY_VOLUME_MOUNT_PATH")}
+    os.environ["DATABASE_PATH"] = db_path
+    try:
+        init_db()
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def _insert_batched(conn: sqlite3.Connection, sql: str, rows: Iterator[Tuple], batch_size: int) -> int:
+    """executemany in chunks of `batch_size`; returns the number of rows written"""
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def generate_database(db_path: str, users: int, submissions: int, seed: int = 42,
+                      batch_size: int = 50000, reset_token_rate: float = 0.02) -> Dict[str, Any]:
+    """Generate a users.db at `db_path` and return row counts and timings"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+
+    _init_schema(db_path)
+    generator = SyntheticDataGenerator(users, submissions, seed, reset_token_rate)
+    start = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Scratch database: durability does not matter, speed does
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA cache_size=-262144")
+
+        conn.execute("BEGIN")
+        user_count = _insert_batched(
+            conn, "INSERT INTO users (id, email, password_hash, created_at) VALUES (?, ?, ?, ?)",
+            generator.user_rows(), batch_size
+        )
+        conn.execute("COMMIT")
+
+        submission_count = 0
+        progress_count = 0
+        submission_batch = []
+        progress_batch = []
+
+        conn.execute("BEGIN")
+        for kind, row in generator.activity_rows():
+            if kind == "submission":
+                submission_batch.append(row)
+            else:
+                progress_batch.append(row)
+            if len(submission_batch) >= batch_size:
+                conn.executemany(
+                    "INSERT INTO user_submissions (user_id, challenge_id, query, passed, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                    submission_batch
+                )
+                submission_count += len(submission_batch)
+                submission_batch = []
+                # Keep transactions large but bounded
+                if submission_count % (batch_size * 20) == 0:
+                    conn.execute("COMMIT")
+                    conn.execute("BEGIN")
+            if len(progress_batch) >= batch_size:
+                conn.executemany(
+                    "INSERT INTO user_progress (user_id, challenge_id, solved_at, attempts) VALUES (?, ?, ?, ?)",
+                    progress_batch
+                )
+                progress_count += len(progress_batch)
+                progress_batch = []
+        if submission_batch:
+            conn.executemany(
+                "INSERT INTO user_submissions (user_id, challenge_id, query, passed, submitted_at) VALUES (?, ?, ?, ?, ?)",
+                submission_batch
+            )
+            submission_count += len(submission_batch)
+        if progress_batch:
+            conn.executemany(
+                "INSERT INTO user_progress (user_id, challenge_id, solved_at, attempts) VALUES (?, ?, ?, ?)",
+                progress_batch
+            )
+            progress_count += len(progress_batch)
+        conn.execute("COMMIT")
+
+        conn.execute("BEGIN")
+        token_count = _insert_batched(
+            conn, "INSERT INTO password_reset_tokens (user_id, token, expires_at, used, created_at) VALUES (?, ?, ?, ?, ?)",
+            generator.reset_token_rows(), batch_size
+        )
+        conn.execute("COMMIT")
+
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    total_rows = user_count + submission_count + progress_count + token_count
+    return {
+        "database": db_path,
+        "seed": seed,
+        "password": GENERATED_PASSWORD,
+        "rows": {
+            "users": user_count,
+            "user_progress": progress_count,
+            "user_submissions": submission_count,
+            "password_reset_tokens": token_count,
+        },
+        "elapsed_s": round(elapsed, 2),
+        "rows_per_s": round(total_rows / elapsed) if elapsed > 0 else 0,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic users.db for scale testing")
+    parser.add_argument("--output", required=True, help="Path of the database to create")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--submissions", type=int, default=1000000, help="Total submissions across all users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows per executemany call")
+    parser.add_argument("--reset-token-rate", type=float, default=0.02, help="Fraction of users with a reset token")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    summary = generate_database(args.output, args.users, args.submissions, args.seed,
+                                args.batch_size, args.reset_token_rate)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+HTTP load-test harness for classroom-burst scenarios.
+
+Drives a running backend (or one started locally on a free port) with
+asyncio + httpx and reports throughput, latency percentiles and error
+rates per scenario as JSON, so runs can be compared across commits.
+
+Examples (from the backend directory):
+
+    python -m bench.load_test --scenario all --output load.json
+    python -m bench.load_test --scenario submit_burst --users 300
+    python -m bench.load_test --base-url http://localhost:8000 --scenario leaderboard
+    python -m bench.load_test --database /tmp/users.db --scenario leaderboard
+
+--database points the local server at a database produced by
+bench.generate_data, so read-heavy scenarios run against realistic volumes.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BENCH_PASSWORD = "bench-password-123"
+DEFAULT_ADMIN_EMAIL = "bench-admin@example.com"
+
+# Known-correct answers used by the submission scenario
+SUBMISSIONS = [
+    (1, "SELECT * FROM products"),
+    (2, "SELECT name, price FROM products"),
+    (3, "SELECT * FROM products WHERE category = 'Electronics'"),
+    (4, "SELECT * FROM users WHERE age > 30"),
+    (5, "SELECT * FROM orders WHERE product_name = 'Laptop' AND quantity > 1"),
+]
+
+DATABASE_TYPES = ["sqlite", "duckdb"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LatencyRecorder:
+    """Collects per-endpoint latency samples and error counts"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.status_codes: Dict[str, Dict[str, int]] = {}
+
+    def record(self, name: str, latency: float, status: Optional[int]):
+        self.samples.setdefault(name, []).append(latency)
+        codes = self.status_codes.setdefault(name, {})
+        key = str(status) if status is not None else "transport_error"
+        codes[key] = codes.get(key, 0) + 1
+        if status is None or status >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    @staticmethod
+    def _summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+        ordered = sorted(latencies)
+        count = len(ordered)
+        return {
+            "requests": count,
+            "errors": errors,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(ordered, 50) * 1000, 2),
+                "p95": round(percentile(ordered, 95) * 1000, 2),
+                "p99": round(percentile(ordered, 99) * 1000, 2),
+                "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+                "mean": round(sum(ordered) / count * 1000, 2) if count else 0.0,
+            },
+        }
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """Summarize everything recorded during a scenario that ran for `elapsed` seconds"""
+        all_latencies = [lat for samples in self.samples.values() for lat in samples]
+        total_errors = sum(self.errors.values())
+
+        report = self._summarize(all_latencies, total_errors, elapsed)
+        report["duration_s"] = round(elapsed, 3)
+        report["endpoints"] = {}
+        for name, samples in sorted(self.samples.items()):
+            endpoint = self._summarize(samples, self.errors.get(name, 0), elapsed)
+            endpoint["status_codes"] = self.status_codes.get(name, {})
+            report["endpoints"][name] = endpoint
+        return report
+
+
+async def timed_request(client: httpx.AsyncClient, recorder: Optional[LatencyRecorder], name: str,
+                        method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    """Issue a request and record its latency under `name`"""
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError:
+        pass
+    if recorder is not None:
+        recorder.record(name, time.perf_counter() - start, response.status_code if response is not None else None)
+    return response
+
+
+def _auth(token: Optional[str]) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+async def signup_or_login(client: httpx.AsyncClient, email: str,
+                          recorder: Optional[LatencyRecorder] = None) -> Optional[str]:
+    """Create a user (or log in if it already exists) and return its access token"""
+    credentials = {"email": email, "password": BENCH_PASSWORD}
+    response = await timed_request(client, recorder, "POST /auth/signup", "POST", "/auth/signup", json=credentials)
+    if response is not None and response.status_code == 200:
+        return response.json()["access_token"]
+
+    response = await timed_request(client, recorder, "POST /auth/login", "POST", "/auth/login", json=credentials)
+    if response is not None and response.status_code == 200:
+        return response.json()["access_token"]
+    return None
+
+
+async def create_users(client: httpx.AsyncClient, count: int, run_id: str, concurrency: int) -> List[str]:
+    """Create `count` users outside of any measurement and return their tokens"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(index: int):
+        async with semaphore:
+            return await signup_or_login(client, f"bench-{run_id}-{index}@example.com")
+
+    tokens = await asyncio.gather(*(create(i) for i in range(count)))
+    return [t for t in tokens if t]
+
+
+async def scenario_signup_login(client: httpx.AsyncClient, recorder: LatencyRecorder, args, run_id: str):
+    """Every student signs up and then logs in at the same moment"""
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def student(index: int):
+        email = f"storm-{run_id}-{index}@example.com"
+        credentials = {"email": email, "password": BENCH_PASSWORD}
+        async with semaphore:
+            await timed_request(client, recorder, "POST /auth/signup", "POST", "/auth/signup", json=credentials)
+            await timed_request(client, recorder, "POST /auth/login", "POST", "/auth/login", json=credentials)
+
+    await asyncio.gather(*(student(i) for i in range(args.users)))
+
+
+async def scenario_submit_burst(client: httpx.AsyncClient, recorder: LatencyRecorder, args, run_id: str):
+    """Every student submits answers on SQLite and DuckDB at the same moment"""
+    tokens = await create_users(client, args.users, run_id, args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def student(index: int, token: str):
+        for attempt in range(args.submissions_per_user):
+            challenge_id, query = SUBMISSIONS[(index + attempt) % len(SUBMISSIONS)]
+            database_type = DATABASE_TYPES[(index + attempt) % len(DATABASE_TYPES)]
+            async with semaphore:
+                await timed_request(
+                    client, recorder, f"POST /challenges/{{id}}/submit [{database_type}]",
+                    "POST", f"/challenges/{challenge_id}/submit",
+                    json={"user_query": query, "database_type": database_type},
+                    headers=_auth(token),
+                )
+
+    await asyncio.gather(*(student(i, t) for i, t in enumerate(tokens)))
+
+
+async def _poll_until(deadline: float, interval: float, poll):
+    while time.perf_counter() < deadline:
+        await poll()
+        if interval > 0:
+            await asyncio.sleep(interval)
+
+
+async def scenario_leaderboard(client: httpx.AsyncClient, recorder: LatencyRecorder, args, run_id: str):
+    """Every student keeps the leaderboard page open and polls it"""
+    deadline = time.perf_counter() + args.duration
+
+    async def poll():
+        await timed_request(client, recorder, "GET /leaderboard", "GET", "/leaderboard")
+
+    await asyncio.gather(*(_poll_until(deadline, args.poll_interval, poll) for _ in range(args.users)))
+
+
+async def scenario_admin_dashboard(client: httpx.AsyncClient, recorder: LatencyRecorder, args, run_id: str):
+    """A few instructors keep refreshing the admin dashboard"""
+    token = await signup_or_login(client, args.admin_email)
+    headers = _auth(token)
+    deadline = time.perf_counter() + args.duration
+
+    async def refresh():
+        # The dashboard loads both panels in parallel
+        await asyncio.gather(
+            timed_request(client, recorder, "GET /admin/stats", "GET", "/admin/stats", headers=headers),
+            timed_request(client, recorder, "GET /admin/users", "GET", "/admin/users", headers=headers),
+        )
+
+    await asyncio.gather(*(_poll_until(deadline, args.poll_interval, refresh) for _ in range(args.admin_clients)))
+
+
+SCENARIOS = {
+    "signup_login": scenario_signup_login,
+    "submit_burst": scenario_submit_burst,
+    "leaderboard": scenario_leaderboard,
+    "admin_dashboard": scenario_admin_dashboard,
+}
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """Starts the backend with uvicorn on a free port against a throwaway (or given) users.db"""
+
+    def __init__(self, admin_email: str, workers: int = 1, database: Optional[str] = None):
+        self.admin_email = admin_email
+        self.workers = workers
+        self.database = database
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.temp_dir = None
+        self.process = None
+
+    def __enter__(self):
+        self.temp_dir = tempfile.TemporaryDirectory(prefix="sql-challenges-bench-")
+        env = dict(os.environ)
+        env.pop("RAILWAY_VOLUME_MOUNT_PATH", None)
+        env.update({
+            "DATABASE_PATH": self.database or os.path.join(self.temp_dir.name, "users.db"),
+            "ADMIN_EMAILS": self.admin_email,
+            "ENVIRONMENT": "development",
+        })
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+        )
+        self._wait_until_ready()
+        return self
+
+    def _wait_until_ready(self, timeout: float = 30.0):
+        start = time.time()
+        while time.time() - start < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError("Backend exited before becoming ready")
+            try:
+                if httpx.get(f"{self.base_url}/courses", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("Backend failed to start within timeout")
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.temp_dir is not None:
+            self.temp_dir.cleanup()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_scenarios(base_url: str, names: List[str], args) -> Dict[str, Any]:
+    """Run the selected scenarios one after another and collect their reports"""
+    run_id = uuid.uuid4().hex[:8]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for name in names:
+            recorder = LatencyRecorder()
+            start = time.perf_counter()
+            await SCENARIOS[name](client, recorder, args, run_id)
+            results[name] = recorder.summary(time.perf_counter() - start)
+            print(f"{name}: {results[name]['requests']} requests, "
+                  f"{results[name]['throughput_rps']} req/s, "
+                  f"p95 {results[name]['latency_ms']['p95']} ms, "
+                  f"error rate {results[name]['error_rate']}", file=sys.stderr)
+
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classroom-burst HTTP load test for the backend")
+    parser.add_argument("--base-url", help="Target an already running backend instead of starting one")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS) + ["all"],
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--users", type=int, default=300, help="Number of simulated students")
+    parser.add_argument("--submissions-per-user", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=300, help="Maximum requests in flight")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds to run polling scenarios")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between polls per client")
+    parser.add_argument("--admin-clients", type=int, default=5)
+    parser.add_argument("--admin-email", default=DEFAULT_ADMIN_EMAIL)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the local server")
+    parser.add_argument("--database", help="Run the local server against this users.db (see bench.generate_data)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    names = args.scenario or ["all"]
+    if "all" in names:
+        names = list(SCENARIOS)
+
+    def run(base_url: str):
+        return asyncio.run(run_scenarios(base_url, names, args))
+
+    if args.base_url:
+        base_url = args.base_url
+        results = run(base_url)
+    else:
+        with LocalServer(args.admin_email, args.workers, args.database) as server:
+            base_url = server.base_url
+            results = run(base_url)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "base_url": base_url,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "scenario")},
+        "scenarios": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Build-time compilation of the challenge catalog.
+
+Instead of seeding databases and parsing schemas on first use in every
+process, the catalog can be compiled once into:
+
+- sqlite/challenge-<id>-<version>.db and duckdb/challenge-<id>-<version>.duckdb,
+  the databases the containers would otherwise build on first use (same file
+  names, so the containers pick them up as they are)
+- schema.json with each challenge's parsed CREATE TABLE statements
+- index.json with each challenge's version, images, expected row count, order
+  sensitivity and result digest, plus the atomic structure challenges
+
+Every reference query is run against its SQLite image and must reproduce the
+challenge's expected output, otherwise the build fails. Large-dataset
+challenges are indexed but their data is built by large_datasets.py.
+
+    python challenge_artifacts.py --output-dir artifacts
+
+At startup the backend reads the index from $CHALLENGE_ARTIFACT_DIR (default
+backend/artifacts). Entries that no longer match the catalog are ignored, and
+those challenges are built lazily as before.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+INDEX_FILE = "index.json"
+SCHEMA_FILE = "schema.json"
+
+
+def get_artifact_dir() -> str:
+    """Directory holding the compiled artifacts"""
+    return os.getenv("CHALLENGE_ARTIFACT_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+
+
+def compiled_image_dir(engine: str) -> Optional[str]:
+    """Directory of compiled database images for an engine, if the catalog has been compiled"""
+    artifact_dir = get_artifact_dir()
+    if not os.path.exists(os.path.join(artifact_dir, INDEX_FILE)):
+        return None
+    return os.path.join(artifact_dir, engine)
+
+
+def parse_table_schema(schema_sql: str):
+    """Parse CREATE TABLE SQL and return structured schema data"""
+    tables = []
+
+    # Split by CREATE TABLE statements
+    create_table_regex = re.compile(r'CREATE TABLE (\w+)\s*\(([\s\S]*?)\);', re.IGNORECASE)
+    matches = create_table_regex.findall(schema_sql)
+
+    for table_name, columns_text in matches:
+        columns = []
+
+        # Parse columns
+        column_lines = [line.strip() for line in columns_text.split(',') if line.strip()]
+
+        for line in column_lines:
+            # Skip foreign key constraints
+            if line.upper().startswith('FOREIGN KEY') or line.upper().startswith('PRIMARY KEY'):
+                continue
+
+            # Parse column definition
+            column_match = re.match(r'^(\w+)\s+([\w()]+)(.*)$', line)
+            if column_match:
+                column_name = column_match.group(1)
+                column_type = column_match.group(2)
+                constraints_text = column_match.group(3)
+
+                # Extract constraints
+                constraints = []
+                if 'PRIMARY KEY' in constraints_text.upper():
+                    constraints.append('PRIMARY KEY')
+                if 'NOT NULL' in constraints_text.upper():
+                    constraints.append('NOT NULL')
+                if 'UNIQUE' in constraints_text.upper():
+                    constraints.append('UNIQUE')
+
+                columns.append({
+                    "name": column_name,
+                    "type": column_type,
+                    "constraints": constraints
+                })
+
+        tables.append({
+            "table_name": table_name,
+            "columns": columns
+        })
+
+    return tables
+
+
+def expected_digest(challenge: Dict[str, Any]) -> str:
+    """Result digest of a challenge's expected output, as stored in the index"""
+    from large_datasets import result_digest
+
+    if "expected_digest" in challenge:
+        return challenge["expected_digest"]
+    return result_digest([str(cell) for cell in row] for row in challenge.get("expected_output", []))
+
+
+def definition_version(challenge: Dict[str, Any]) -> str:
+    """Short digest of a whole challenge definition, for challenges without a database"""
+    return hashlib.sha1(json.dumps(challenge, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+def compile_catalog(output_dir: Optional[str] = None, engines: List[str] = ("sqlite", "duckdb")) -> Dict[str, Any]:
+    """Build the images, schema JSON and index; raises ValueError if a reference query is wrong"""
+    # Imported here: the containers themselves look up compiled images from this module
+    from atomic_structure_challenges import ATOMIC_STRUCTURE_CHALLENGES
+    from challenge_container import ChallengeContainer, challenge_version
+    from challenges import CHALLENGES
+    from duckdb_container import DuckDBContainer
+    from mutation_validation import is_mutation_challenge
+    from result_validation import is_order_sensitive, result_matches
+
+    output_dir = output_dir or get_artifact_dir()
+    start = time.perf_counter()
+    sqlite_container = ChallengeContainer(shared_db_dir=os.path.join(output_dir, "sqlite"))
+    duckdb_container = DuckDBContainer(template_dir=os.path.join(output_dir, "duckdb")) if "duckdb" in engines else None
+
+    challenges = {}
+    schemas = {}
+    errors = []
+    for challenge in CHALLENGES:
+        entry = {
+            "version": challenge_version(challenge),
+            "expected": {
+                "row_count": challenge.get("expected_row_count", len(challenge.get("expected_output", []))),
+                "ordered": is_order_sensitive(challenge),
+                "digest": expected_digest(challenge),
+            },
+            "images": {},
+        }
+        schemas[str(challenge["id"])] = parse_table_schema(challenge.get("schema_sql") or "")
+        if challenge.get("dataset"):
+            entry["dataset"] = challenge["dataset"]
+        else:
+            sqlite_path = sqlite_container.get_shared_database(challenge)
+            entry["images"]["sqlite"] = os.path.relpath(sqlite_path, output_dir)
+            if duckdb_container is not None:
+                entry["images"]["duckdb"] = os.path.relpath(duckdb_container.get_template_database(challenge), output_dir)
+            if not is_mutation_challenge(challenge) and not _reference_matches(sqlite_path, challenge, result_matches):
+                errors.append(challenge["id"])
+        challenges[str(challenge["id"])] = entry
+
+    if errors:
+        raise ValueError(f"Reference queries do not reproduce the expected output for challenges {errors}")
+
+    atomic = {
+        str(challenge["id"]): {"version": definition_version(challenge), "type": challenge.get("type"),
+                               "level": challenge.get("level")}
+        for challenge in ATOMIC_STRUCTURE_CHALLENGES
+    }
+    index = {
+        "built_at": datetime.utcnow().isoformat(),
+        "build_s": round(time.perf_counter() - start, 2),
+        "challenges": challenges,
+        "atomic_structure": atomic,
+    }
+    _write_json(os.path.join(output_dir, SCHEMA_FILE), schemas)
+    # The index goes last: its presence means the artifacts are complete
+    _write_json(os.path.join(output_dir, INDEX_FILE), index)
+    return index
+
+
+def _reference_matches(db_path: str, challenge: Dict[str, Any], result_matches) -> bool:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return result_matches(challenge, conn.execute(challenge["reference_query"]).fetchall())
+    finally:
+        conn.close()
+
+
+def _write_json(path: str, data: Any):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+class ChallengeArtifacts:
+    """The compiled index and schemas, loaded once at startup"""
+
+    def __init__(self, artifact_dir: Optional[str] = None):
+        self.artifact_dir = artifact_dir
+        self.challenges: Dict[str, Dict[str, Any]] = {}
+        self.schemas: Dict[str, list] = {}
+        self.stale: List[str] = []
+        self.load_ms: Optional[float] = None
+        self._parsed: Dict[Any, list] = {}
+
+    def load(self) -> bool:
+        """Read the index, keeping entries that still match the catalog; False if there is none"""
+        from challenge_container import challenge_version
+        from challenges import CHALLENGES
+
+        start = time.perf_counter()
+        artifact_dir = self.artifact_dir or get_artifact_dir()
+        index_path = os.path.join(artifact_dir, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return False
+        with open(index_path) as f:
+            index = json.load(f)
+        with open(os.path.join(artifact_dir, SCHEMA_FILE)) as f:
+            schemas = json.load(f)
+
+        self.challenges = {}
+        self.stale = []
+        for challenge in CHALLENGES:
+            key = str(challenge["id"])
+            entry = index["challenges"].get(key)
+            if (entry and entry["version"] == challenge_version(challenge)
+                    and entry["expected"]["digest"] == expected_digest(challenge)):
+                self.challenges[key] = entry
+            else:
+                self.stale.append(key)
+        self.schemas = {key: schemas[key] for key in self.challenges if key in schemas}
+        self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+        return True
+
+    def schema(self, challenge: Dict[str, Any]) -> list:
+        """Parsed schema of a challenge: compiled if current, otherwise parsed once"""
+        compiled = self.schemas.get(str(challenge["id"]))
+        if compiled is not None:
+            return compiled
+        parsed = self._parsed.get(challenge["id"])
+        if parsed is None:
+            parsed = self._parsed[challenge["id"]] = parse_table_schema(challenge["schema_sql"])
+        return parsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"loaded": len(self.challenges), "stale": self.stale, "load_ms": self.load_ms}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the challenge catalog into build artifacts")
+    parser.add_argument("--output-dir", help="Defaults to $CHALLENGE_ARTIFACT_DIR or backend/artifacts")
+    parser.add_argument("--engine", action="append", choices=["sqlite", "duckdb"],
+                        help="Database images to build (repeatable, default: both)")
+    args = parser.parse_args(argv)
+
+    try:
+        index = compile_catalog(args.output_dir, args.engine or ["sqlite", "duckdb"])
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(json.dumps({"challenges": len(index["challenges"]), "atomic_structure": len(index["atomic_structure"]),
+                      "build_s": index["build_s"]}, indent=2))
+    return 0
+
+# Global challenge artifacts instance
+challenge_artifacts = ChallengeArtifacts()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
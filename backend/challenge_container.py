@@ -1,44 +1,163 @@
 import sqlite3
 import tempfile
 import os
+import shutil
+import hashlib
+import threading
+import time
 import uuid
-from typing import Dict, Any, Optional
+from urllib.request import pathname2url
+from typing import Dict, Any, List, Optional
 from challenges import CHALLENGES
+from challenge_artifacts import compiled_image_dir
+from query_validation import query_prevalidator, READ_ONLY, READ_ONLY_ACTIONS
+from performance import performance_grader, is_performance_graded
+from large_datasets import DATASETS, ensure_dataset, SQLITE_MMAP_SIZE, DATASET_READ_ONLY_ERROR
+from mutation_validation import (SQLiteTableFingerprint, SQLITE_FINGERPRINT_FUNCTION, is_mutation_challenge,
+                                 expected_fingerprints, grade_mutation, reference_fingerprints, quote_identifier)
+from randomized_datasets import randomized_dataset_cache
+from hidden_datasets import hidden_dataset_grader, has_hidden_datasets
+from result_validation import RowMatcher, expected_result, RESULT_PREVIEW_ROWS, FETCH_BATCH_ROWS
+from engines import ExecutionEngine, EngineCapabilities, find_challenge, validate_rows, timed_out_result, register_engine, report_stage
+
+# Error raised by SQLite when the authorizer denies an action
+NOT_AUTHORIZED = "not authorized"
+# SQLite VM instructions between deadline checks
+PROGRESS_INTERVAL = 10000
+
+
+def challenge_version(challenge: Dict[str, Any]) -> str:
+    """Short digest of a challenge's schema and data"""
+    digest = hashlib.sha1()
+    digest.update((challenge.get("schema_sql") or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((challenge.get("seed_sql") or "").encode("utf-8"))
+    if challenge.get("dataset"):
+        digest.update(f"\0{challenge['dataset']}-v{DATASETS[challenge['dataset']]['version']}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def _read_only_authorizer(action, *args):
+    """Allow plain reads only - no writes, ATTACH or PRAGMA"""
+    if action in READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
 
 class ChallengeContainer:
     """Manages isolated database files for SQL challenges"""
     
-    def __init__(self):
+    def __init__(self, shared_db_dir: Optional[str] = None):
         self.active_environments = {}
+        # One immutable database per challenge, shared by all read-only submissions
+        self.shared_db_dir = (shared_db_dir or os.getenv("CHALLENGE_DB_DIR") or compiled_image_dir("sqlite")
+                              or tempfile.mkdtemp(prefix="sql-challenges-"))
+        os.makedirs(self.shared_db_dir, exist_ok=True)
+        self._shared_databases: Dict[int, str] = {}
+        # Environments reading or copying each shared database right now
+        self._shared_users: Dict[str, int] = {}
+        # Dropped databases still in use; the last environment to let go deletes them
+        self._dropped = set()
+        # Reentrant: acquiring a database may build it
+        self._shared_lock = threading.RLock()
         
-    def create_challenge_environment(self, challenge_id: int, user_id: str) -> Dict[str, Any]:
-        """Create an isolated environment for a challenge"""
+    def create_challenge_environment(self, challenge_id: int, user_id: str, read_only: bool = False,
+                                     challenge: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Create an isolated environment for a challenge
+        
+        With read_only=True the environment points at the shared immutable
+        database instead of a private copy. `challenge` overrides the catalog
+        lookup, for challenge variants such as hidden datasets.
+        """
         
         # Get challenge details
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        challenge = challenge or next((c for c in CHALLENGES if c["id"] == challenge_id), None)
         if not challenge:
             raise ValueError(f"Challenge {challenge_id} not found")
         
         # Create unique container name
         container_name = f"sql-challenge-{challenge_id}-{user_id}-{uuid.uuid4().hex[:8]}"
         
-        # Create temporary database file
-        temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        temp_db_path = temp_db.name
-        temp_db.close()
-        
-        # Initialize database with challenge schema and data
-        self._setup_challenge_database(temp_db_path, challenge)
+        if challenge.get("dataset"):
+            # Prebuilt datasets are always mounted in place, never copied
+            db_path = ensure_dataset(challenge["dataset"])["sqlite"]
+            read_only = True
+        elif read_only:
+            # Released by cleanup_environment
+            db_path = self._acquire_shared_database(challenge)
+        else:
+            # Private copy of the pre-built database - cheaper than replaying the seed SQL
+            temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+            db_path = temp_db.name
+            temp_db.close()
+            shared_path = self._acquire_shared_database(challenge)
+            try:
+                shutil.copyfile(shared_path, db_path)
+            finally:
+                self._release_shared_database(shared_path)
         
         return {
             "container_name": container_name,
-            "db_path": temp_db_path,
+            "db_path": db_path,
+            "shared": read_only,
+            "dataset": challenge.get("dataset"),
             "challenge_id": challenge_id,
             "user_id": user_id,
             "schema": challenge.get("schema", ""),
             "seed_data": challenge.get("seed_data", [])
         }
     
+    def get_shared_database(self, challenge: Dict[str, Any]) -> str:
+        """Path of the shared database for a challenge, built on first use"""
+        challenge_id = challenge["id"]
+        with self._shared_lock:
+            db_path = self._shared_databases.get(challenge_id)
+            if db_path and os.path.exists(db_path):
+                return db_path
+            
+            db_path = os.path.join(self.shared_db_dir, f"challenge-{challenge_id}-{challenge_version(challenge)}.db")
+            if not os.path.exists(db_path):
+                # Build next to the final path and rename so readers never see a partial file
+                build_path = f"{db_path}.{uuid.uuid4().hex[:8]}.tmp"
+                try:
+                    self._setup_challenge_database(build_path, challenge)
+                    os.replace(build_path, db_path)
+                finally:
+                    if os.path.exists(build_path):
+                        os.unlink(build_path)
+            # Dropped but still on disk: the same version is simply taken back
+            self._dropped.discard(db_path)
+            self._shared_databases[challenge_id] = db_path
+            return db_path
+    
+    def _acquire_shared_database(self, challenge: Dict[str, Any]) -> str:
+        """get_shared_database, keeping the file on disk until _release_shared_database"""
+        with self._shared_lock:
+            db_path = self.get_shared_database(challenge)
+            self._shared_users[db_path] = self._shared_users.get(db_path, 0) + 1
+            return db_path
+    
+    def _release_shared_database(self, db_path: str):
+        with self._shared_lock:
+            users = self._shared_users.pop(db_path) - 1
+            if users:
+                self._shared_users[db_path] = users
+            elif db_path in self._dropped:
+                self._dropped.discard(db_path)
+                if os.path.exists(db_path):
+                    os.unlink(db_path)
+    
+    def drop_shared_database(self, challenge: Dict[str, Any]):
+        """Forget and delete a challenge's shared database, once no environment is using it"""
+        with self._shared_lock:
+            db_path = self._shared_databases.pop(challenge["id"], None)
+            if not db_path:
+                return
+            if self._shared_users.get(db_path):
+                self._dropped.add(db_path)
+            elif os.path.exists(db_path):
+                os.unlink(db_path)
+    
     def _setup_challenge_database(self, db_path: str, challenge: Dict[str, Any]):
         """Initialize database with challenge schema and seed data"""
         conn = sqlite3.connect(db_path)
@@ -57,35 +176,70 @@ class ChallengeContainer:
         finally:
             conn.close()
     
-    def execute_query(self, environment: Dict[str, Any], user_query: str) -> Dict[str, Any]:
-        """Execute user query in isolated environment"""
-        
+    def connect(self, environment: Dict[str, Any], check_same_thread: bool = True) -> sqlite3.Connection:
+        """Open a connection to an environment's database"""
         db_path = environment["db_path"]
-        conn = sqlite3.connect(db_path)
+        if environment.get("shared"):
+            # immutable=1 skips locking and change detection; the authorizer blocks everything but reads
+            conn = sqlite3.connect(f"file:{pathname2url(db_path)}?mode=ro&immutable=1", uri=True,
+                                   check_same_thread=check_same_thread)
+            conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            conn.set_authorizer(_read_only_authorizer)
+            return conn
+        return sqlite3.connect(db_path, check_same_thread=check_same_thread)
+    
+    def execute_query(self, environment: Dict[str, Any], user_query: str,
+                      timeout_s: Optional[float] = None, matcher: Optional[RowMatcher] = None) -> Dict[str, Any]:
+        """Execute user query in isolated environment
+        
+        Raw rows are fed to `matcher` as they are fetched; only the preview rows
+        are converted to strings. Once the matcher reports that the result
+        cannot match, fetching stops after the preview rows.
+        """
+        
+        conn = self.connect(environment)
         cursor = conn.cursor()
         
+        if timeout_s is not None:
+            # Returning non-zero from the progress handler interrupts the running statement
+            deadline = time.monotonic() + timeout_s
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_INTERVAL)
+        
         try:
             # Execute user query
             cursor.execute(user_query)
             
-            # Get results
-            query_upper = user_query.strip().upper()
-            if query_upper.startswith("SELECT") or query_upper.startswith("WITH"):
-                results = cursor.fetchall()
+            # Get results - any statement that produces rows has a description
+            if cursor.description is not None:
                 columns = [description[0] for description in cursor.description] if cursor.description else []
                 
-                # Normalize results to strings to match expected format
                 normalized_results = []
-                for row in results:
-                    normalized_row = [str(cell) for cell in row]
-                    normalized_results.append(normalized_row)
+                row_count = 0
+                complete = True
+                while True:
+                    rows = cursor.fetchmany(FETCH_BATCH_ROWS)
+                    if not rows:
+                        break
+                    row_count += len(rows)
+                    if matcher is not None:
+                        matcher.feed_many(rows)
+                    if len(normalized_results) < RESULT_PREVIEW_ROWS:
+                        normalized_results.extend(self.normalize_results(rows[:RESULT_PREVIEW_ROWS - len(normalized_results)]))
+                    if matcher is not None and matcher.failed and row_count >= RESULT_PREVIEW_ROWS:
+                        # Already wrong - the rest would only be thrown away
+                        complete = cursor.fetchone() is None
+                        break
                 
-                return {
+                result = {
                     "success": True,
                     "results": normalized_results,
                     "columns": columns,
-                    "row_count": len(normalized_results)
+                    "row_count": row_count
                 }
+                if row_count > len(normalized_results) or not complete:
+                    # Only the preview is returned; if grading stopped early, row_count is a lower bound
+                    result["truncated"] = True
+                return result
             else:
                 # For non-SELECT queries (INSERT, UPDATE, DELETE, etc.)
                 conn.commit()
@@ -96,6 +250,8 @@ class ChallengeContainer:
                 }
                 
         except sqlite3.Error as e:
+            if timeout_s is not None and str(e) == "interrupted":
+                return timed_out_result(timeout_s)
             return {
                 "success": False,
                 "error": str(e)
@@ -103,8 +259,46 @@ class ChallengeContainer:
         finally:
             conn.close()
     
+    def table_fingerprints(self, environment: Dict[str, Any], tables: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Columns, row count and order-independent hash of each table, aggregated inside SQLite
+        
+        Defaults to every table; tables that do not exist are left out.
+        """
+        conn = self.connect(environment)
+        try:
+            conn.create_aggregate(SQLITE_FINGERPRINT_FUNCTION, -1, SQLiteTableFingerprint)
+            if tables is None:
+                tables = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+            fingerprints = {}
+            for table in tables:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+                if not columns:
+                    continue
+                row_count, digest = conn.execute(
+                    f"SELECT COUNT(*), {SQLITE_FINGERPRINT_FUNCTION}({', '.join(map(quote_identifier, columns))}) "
+                    f"FROM {quote_identifier(table)}"
+                ).fetchone()
+                fingerprints[table] = {"columns": columns, "row_count": row_count, "hash": digest}
+            return fingerprints
+        finally:
+            conn.close()
+    
+    def normalize_results(self, rows: List[tuple]) -> List[List[str]]:
+        """Normalize result rows to strings to match expected format"""
+        normalized_results = []
+        for row in rows:
+            normalized_row = [str(cell) for cell in row]
+            normalized_results.append(normalized_row)
+        return normalized_results
+    
     def cleanup_environment(self, environment: Dict[str, Any]):
         """Clean up challenge environment"""
+        if environment.get("shared"):
+            # Shared databases outlive the request
+            if not environment.get("dataset"):
+                self._release_shared_database(environment["db_path"])
+            return
         try:
             # Remove temporary database file
             if os.path.exists(environment["db_path"]):
@@ -112,25 +306,87 @@ class ChallengeContainer:
         except Exception as e:
             print(f"Error cleaning up environment: {e}")
 
-class ChallengeManager:
+class ChallengeManager(ExecutionEngine):
     """Manages challenge execution and validation"""
     
+    name = "sqlite"
+    dialect = "sqlite"
+    capabilities = EngineCapabilities(read_only_sharing=True, cancellation=True)
+    
     def __init__(self):
         self.container = ChallengeContainer()
     
-    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str) -> Dict[str, Any]:
+    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                          timeout_s: Optional[float] = None) -> Dict[str, Any]:
         """Execute a challenge with user query"""
+        # Performance grading must finish within the submission's own timeout
+        deadline = time.monotonic() + timeout_s if timeout_s is not None else None
         
-        # Create isolated environment
-        environment = self.container.create_challenge_environment(challenge_id, user_id)
+        # Reject empty and malformed queries before building a sandbox
+        check = query_prevalidator.validate(challenge_id, user_query, "sqlite")
+        if not check["success"]:
+            return check
+        
+        # Read-only queries run against the shared database, everything else gets a private copy
+        read_only = check["statement_type"] == READ_ONLY
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            raise ValueError(f"Challenge {challenge_id} not found")
+        # Randomized challenges are graded on the user's own generated data
+        challenge = randomized_dataset_cache.for_user(challenge, user_id)
+        if is_mutation_challenge(challenge):
+            # Graded on the tables the statement leaves behind
+            return grade_mutation(self.container, challenge, self._expected_fingerprints(challenge),
+                                  user_id, user_query, timeout_s)
+        if challenge.get("dataset") and not read_only:
+            return {"success": False, "error": DATASET_READ_ONLY_ERROR}
+        
+        # Hidden datasets run alongside the visible one, each on its own snapshot
+        hidden = hidden_dataset_grader.start(
+            challenge, lambda variant: self._execute_on(variant, user_id, user_query, timeout_s, read_only))
+        result = self._execute_on(challenge, user_id, user_query, timeout_s, read_only, report=True,
+                                  deadline=deadline)
+        hidden_dataset_grader.finish(hidden, result, timeout_s)
+        if "seed_bucket" in challenge:
+            result["seed_bucket"] = challenge["seed_bucket"]
+        return result
+    
+    def _execute_on(self, challenge: Dict[str, Any], user_id: str, user_query: str, timeout_s: Optional[float],
+                    read_only: bool, report: bool = False, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Run and validate the query on one dataset of a challenge; `report` for the one the user sees"""
+        if report:
+            report_stage("setting_up")
+        environment = self.container.create_challenge_environment(challenge["id"], user_id, read_only, challenge)
         
         try:
-            # Execute user query
-            result = self.container.execute_query(environment, user_query)
+            # Execute user query, validating rows as they are fetched
+            if report:
+                report_stage("executing")
+            matcher = expected_result(challenge).matcher()
+            result = self.container.execute_query(environment, user_query, timeout_s, matcher)
+            
+            if (read_only and not result["success"] and NOT_AUTHORIZED in result.get("error", "")
+                    and not environment.get("dataset")):
+                # The classification missed something - retry on a private copy
+                self.container.cleanup_environment(environment)
+                environment = self.container.create_challenge_environment(challenge["id"], user_id,
+                                                                          challenge=challenge)
+                matcher = expected_result(challenge).matcher()
+                result = self.container.execute_query(environment, user_query, timeout_s, matcher)
             
             # Validate against expected output
             if result["success"]:
-                result["passed"] = self._validate_result(challenge_id, result)
+                if report:
+                    report_stage("validating")
+                result["passed"] = "results" in result and matcher.finish()
+                
+                # Correct answers on large datasets are also graded on speed and plan, if there is time left
+                if report and result["passed"] and is_performance_graded(challenge):
+                    performance = performance_grader.grade(
+                        self.container, environment, challenge, user_query, "sqlite", deadline
+                    )
+                    if performance is not None:
+                        result["performance"] = performance
             
             return result
             
@@ -138,21 +394,37 @@ class ChallengeManager:
             # Clean up environment
             self.container.cleanup_environment(environment)
     
+    def warm(self, challenge_id: int):
+        """Build the shared database (or dataset) for a challenge"""
+        challenge = find_challenge(challenge_id)
+        if not challenge:
+            return
+        if challenge.get("dataset"):
+            ensure_dataset(challenge["dataset"])
+            self._profile_reference(challenge)
+        else:
+            self.container.get_shared_database(challenge)
+        for variant in hidden_dataset_grader.variants(challenge) if has_hidden_datasets(challenge) else []:
+            self.container.get_shared_database(variant)
+        if is_mutation_challenge(challenge):
+            self._expected_fingerprints(challenge)
+    
+    def _expected_fingerprints(self, challenge: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        return expected_fingerprints(self.name, challenge, challenge_version(challenge),
+                                     lambda: reference_fingerprints(self.container, challenge))
+    
+    def _profile_reference(self, challenge: Dict[str, Any]):
+        environment = self.container.create_challenge_environment(challenge["id"], "reference", True, challenge)
+        try:
+            performance_grader.precompute_reference(self.container, environment, challenge, "sqlite")
+        finally:
+            self.container.cleanup_environment(environment)
+    
     def _validate_result(self, challenge_id: int, result: Dict[str, Any]) -> bool:
         """Validate user result against expected output"""
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
-        if not challenge:
-            return False
-        
-        expected_output = challenge.get("expected_output", [])
-        
-        # Simple validation - check if results match expected
-        if "results" in result and result["results"] is not None:
-            user_results = result["results"]
-            return user_results == expected_output
-        
-        # If no results or results is None, it definitely doesn't match expected output
-        return False
+        return validate_rows(find_challenge(challenge_id), result)
 
 # Global challenge manager instance
-challenge_manager = ChallengeManager() 
\ No newline at end of file
+challenge_manager = ChallengeManager()
+register_engine(challenge_manager)
+randomized_dataset_cache.add_eviction_listener(challenge_manager.container.drop_shared_database)
@@ -19,6 +19,7 @@ INSERT INTO products VALUES (3, 'Keyboard', 75, 'Electronics');
 INSERT INTO products VALUES (4, 'Desk Chair', 150, 'Furniture');
 INSERT INTO products VALUES (5, 'Book', 15, 'Books');
 """,
+        "reference_query": "SELECT * FROM products",
         "expected_column_names": ["id", "name", "price", "category"],
         "expected_output": [
             ['1', 'Laptop', '1200', 'Electronics'],
@@ -46,6 +47,7 @@ INSERT INTO products VALUES (1, 'Laptop', 1200, 'Electronics');
 INSERT INTO products VALUES (2, 'Mouse', 25, 'Electronics');
 INSERT INTO products VALUES (3, 'Keyboard', 75, 'Electronics');
 """,
+        "reference_query": "SELECT name, price FROM products",
         "expected_column_names": ["name", "price"],
         "expected_output": [
             ['Laptop', '1200'],
@@ -71,6 +73,7 @@ INSERT INTO products VALUES (1, 'Laptop', 1200, 'Electronics');
 INSERT INTO products VALUES (2, 'Desk Chair', 150, 'Furniture');
 INSERT INTO products VALUES (3, 'Mouse', 25, 'Electronics');
 """,
+        "reference_query": "SELECT * FROM products WHERE category = 'Electronics'",
         "expected_column_names": ["id", "name", "price", "category"],
         "expected_output": [
             ['1', 'Laptop', '1200', 'Electronics'],
@@ -94,6 +97,7 @@ INSERT INTO users VALUES (1, 'alice', 28);
 INSERT INTO users VALUES (2, 'bob', 32);
 INSERT INTO users VALUES (3, 'charlie', 35);
 """,
+        "reference_query": "SELECT * FROM users WHERE age > 30",
         "expected_column_names": ["id", "username", "age"],
         "expected_output": [
             ['2', 'bob', '32'],
@@ -117,6 +121,7 @@ INSERT INTO orders VALUES (1, 'Laptop', 1);
 INSERT INTO orders VALUES (2, 'Mouse', 2);
 INSERT INTO orders VALUES (3, 'Laptop', 3);
 """,
+        "reference_query": "SELECT * FROM orders WHERE product_name = 'Laptop' AND quantity > 1",
         "expected_column_names": ["order_id", "product_name", "quantity"],
         "expected_output": [
             ['3', 'Laptop', '3']
@@ -139,6 +144,7 @@ INSERT INTO customers VALUES (1, 'John Doe', 'USA');
 INSERT INTO customers VALUES (2, 'Jane Smith', 'Canada');
 INSERT INTO customers VALUES (3, 'Peter Jones', 'UK');
 """,
+        "reference_query": "SELECT * FROM customers WHERE country IN ('USA', 'Canada')",
         "expected_column_names": ["id", "name", "country"],
         "expected_output": [
             ['1', 'John Doe', 'USA'],
@@ -162,6 +168,7 @@ INSERT INTO products VALUES (1, 'Laptop', 1200);
 INSERT INTO products VALUES (2, 'Mouse', 25);
 INSERT INTO products VALUES (3, 'Keyboard', 75);
 """,
+        "reference_query": "SELECT * FROM products ORDER BY price DESC",
         "expected_column_names": ["id", "name", "price"],
         "expected_output": [
             ['1', 'Laptop', '1200'],
@@ -187,6 +194,7 @@ INSERT INTO products VALUES (2, 'Mouse', 25);
 INSERT INTO products VALUES (3, 'Keyboard', 75);
 INSERT INTO products VALUES (4, 'Monitor', 300);
 """,
+        "reference_query": "SELECT * FROM products ORDER BY price DESC LIMIT 2",
         "expected_column_names": ["id", "name", "price"],
         "expected_output": [
             ['1', 'Laptop', '1200'],
@@ -209,6 +217,7 @@ INSERT INTO users VALUES (1, 'alice');
 INSERT INTO users VALUES (2, 'bob');
 INSERT INTO users VALUES (3, 'charlie');
 """,
+        "reference_query": "SELECT COUNT(*) AS count FROM users",
         "expected_column_names": ["count"],
         "expected_output": [
             ['3']
@@ -232,6 +241,7 @@ INSERT INTO customers VALUES (2, 'Jane Smith', 'Canada');
 INSERT INTO customers VALUES (3, 'Peter Jones', 'UK');
 INSERT INTO customers VALUES (4, 'Alice', 'USA');
 """,
+        "reference_query": "SELECT country FROM customers GROUP BY country ORDER BY MIN(id)",
         "expected_column_names": ["country"],
         "expected_output": [
             ['USA'],
@@ -262,6 +272,12 @@ INSERT INTO customers VALUES (1, 'John Doe', 'USA');
 INSERT INTO customers VALUES (2, 'Jane Smith', 'Canada');
 INSERT INTO orders VALUES (1, 1, 'Laptop');
 INSERT INTO orders VALUES (2, 2, 'Mouse');
+""",
+        "reference_query": """
+SELECT o.order_id, c.name
+FROM orders o
+JOIN customers c ON o.customer_id = c.id
+ORDER BY o.order_id
 """,
         "expected_column_names": ["order_id", "name"],
         "expected_output": [
@@ -292,6 +308,13 @@ INSERT INTO customers VALUES (2, 'Bob');
 INSERT INTO orders VALUES (1, 1, 100);
 INSERT INTO orders VALUES (2, 1, 200);
 INSERT INTO orders VALUES (3, 2, 150);
+""",
+        "reference_query": """
+SELECT c.name, SUM(o.amount) AS total_amount
+FROM customers c
+JOIN orders o ON o.customer_id = c.id
+GROUP BY c.id, c.name
+ORDER BY c.id
 """,
         "expected_column_names": ["name", "total_amount"],
         "expected_output": [
@@ -322,6 +345,13 @@ INSERT INTO products VALUES (2, 'Mouse');
 INSERT INTO products VALUES (3, 'Keyboard');
 INSERT INTO order_items VALUES (1, 1, 10);
 INSERT INTO order_items VALUES (2, 2, 5);
+""",
+        "reference_query": """
+SELECT p.name
+FROM products p
+LEFT JOIN order_items oi ON oi.product_id = p.id
+WHERE oi.id IS NULL
+ORDER BY p.id
 """,
         "expected_column_names": ["name"],
         "expected_output": [
@@ -351,6 +381,12 @@ INSERT INTO departments VALUES (2, 'Sales');
 INSERT INTO employees VALUES (1, 'Alice', 1);
 INSERT INTO employees VALUES (2, 'Bob', 2);
 INSERT INTO employees VALUES (3, 'Charlie', 1);
+""",
+        "reference_query": """
+SELECT e.name, d.name AS department
+FROM employees e
+JOIN departments d ON e.department_id = d.id
+ORDER BY e.id
 """,
         "expected_column_names": ["name", "department"],
         "expected_output": [
@@ -382,6 +418,14 @@ INSERT INTO departments VALUES (2, 'Sales');
 INSERT INTO employees VALUES (1, 'Alice', 1);
 INSERT INTO employees VALUES (2, 'Bob', 2);
 INSERT INTO employees VALUES (3, 'Charlie', 1);
+""",
+        "reference_query": """
+SELECT d.name
+FROM departments d
+JOIN employees e ON e.department_id = d.id
+GROUP BY d.id, d.name
+HAVING COUNT(*) > 1
+ORDER BY d.id
 """,
         "expected_column_names": ["name"],
         "expected_output": [
@@ -406,6 +450,7 @@ INSERT INTO sales VALUES (2, 'Feb', 1500);
 INSERT INTO sales VALUES (3, 'Mar', 1200);
 INSERT INTO sales VALUES (4, 'Apr', 1800);
 """,
+        "reference_query": "SELECT month, amount, SUM(amount) OVER (ORDER BY id) AS running_total FROM sales ORDER BY id",
         "expected_column_names": ["month", "amount", "running_total"],
         "expected_output": [
             ['Jan', '1000', '1000'],
@@ -433,6 +478,12 @@ INSERT INTO employees VALUES (2, 'Bob', 'Engineering', 90000);
 INSERT INTO employees VALUES (3, 'Charlie', 'Sales', 70000);
 INSERT INTO employees VALUES (4, 'Diana', 'Sales', 75000);
 INSERT INTO employees VALUES (5, 'Eve', 'Engineering', 85000);
+""",
+        "reference_query": """
+SELECT name, department, salary,
+       RANK() OVER (PARTITION BY department ORDER BY salary DESC) AS "rank"
+FROM employees
+ORDER BY department, salary DESC
 """,
         "expected_column_names": ["name", "department", "salary", "rank"],
         "expected_output": [
@@ -463,6 +514,21 @@ INSERT INTO employees VALUES (3, 'Manager B', 1);
 INSERT INTO employees VALUES (4, 'Employee 1', 2);
 INSERT INTO employees VALUES (5, 'Employee 2', 2);
 INSERT INTO employees VALUES (6, 'Employee 3', 3);
+""",
+        "reference_query": """
+WITH RECURSIVE hierarchy AS (
+  SELECT id, name, manager_id, 0 AS level
+  FROM employees
+  WHERE manager_id IS NULL
+  UNION ALL
+  SELECT e.id, e.name, e.manager_id, h.level + 1
+  FROM employees e
+  JOIN hierarchy h ON e.manager_id = h.id
+)
+SELECT h.name AS employee_name, COALESCE(m.name, '') AS manager_name, h.level
+FROM hierarchy h
+LEFT JOIN employees m ON h.manager_id = m.id
+ORDER BY h.level, h.id
 """,
         "expected_column_names": ["employee_name", "manager_name", "level"],
         "expected_output": [
@@ -494,6 +560,14 @@ INSERT INTO sales VALUES (3, 'Mouse', 'North', 500);
 INSERT INTO sales VALUES (4, 'Mouse', 'South', 600);
 INSERT INTO sales VALUES (5, 'Keyboard', 'North', 300);
 INSERT INTO sales VALUES (6, 'Keyboard', 'South', 400);
+""",
+        "reference_query": """
+SELECT product,
+       SUM(CASE WHEN region = 'North' THEN amount ELSE 0 END) AS north,
+       SUM(CASE WHEN region = 'South' THEN amount ELSE 0 END) AS south
+FROM sales
+GROUP BY product
+ORDER BY product
 """,
         "expected_column_names": ["product", "north", "south"],
         "expected_output": [
@@ -522,6 +596,12 @@ INSERT INTO products VALUES (3, 'Mouse A', 'Electronics', 50);
 INSERT INTO products VALUES (4, 'Mouse B', 'Electronics', 30);
 INSERT INTO products VALUES (5, 'Book A', 'Books', 20);
 INSERT INTO products VALUES (6, 'Book B', 'Books', 25);
+""",
+        "reference_query": """
+SELECT name, category, price
+FROM products p
+WHERE price > (SELECT AVG(price) FROM products WHERE category = p.category)
+ORDER BY id
 """,
         "expected_column_names": ["name", "category", "price"],
         "expected_output": [
@@ -549,6 +629,12 @@ INSERT INTO employees VALUES (2, 'Bob', 'Engineering', 80000);
 INSERT INTO employees VALUES (3, 'Charlie', 'Sales', 70000);
 INSERT INTO employees VALUES (4, 'Diana', 'Sales', 70000);
 INSERT INTO employees VALUES (5, 'Eve', 'Engineering', 90000);
+""",
+        "reference_query": """
+SELECT e1.name AS employee1, e2.name AS employee2, e1.department, e1.salary
+FROM employees e1
+JOIN employees e2 ON e1.department = e2.department AND e1.salary = e2.salary AND e1.id < e2.id
+ORDER BY e1.id
 """,
         "expected_column_names": ["employee1", "employee2", "department", "salary"],
         "expected_output": [
@@ -573,6 +659,13 @@ INSERT INTO sales VALUES (1, 'Jan', 1000);
 INSERT INTO sales VALUES (2, 'Feb', 1500);
 INSERT INTO sales VALUES (3, 'Mar', 1200);
 INSERT INTO sales VALUES (4, 'Apr', 1800);
+""",
+        "reference_query": """
+SELECT month, amount,
+       SUM(amount) OVER (ORDER BY id) AS running_total,
+       ROUND(amount * 100.0 / SUM(amount) OVER (), 2) AS percentage
+FROM sales
+ORDER BY id
 """,
         "expected_column_names": ["month", "amount", "running_total", "percentage"],
         "expected_output": [
@@ -602,6 +695,12 @@ INSERT INTO employees VALUES (3, 'Charlie', 'Engineering', 70000);
 INSERT INTO employees VALUES (4, 'Diana', 'Sales', 75000);
 INSERT INTO employees VALUES (5, 'Eve', 'Sales', 65000);
 INSERT INTO employees VALUES (6, 'Frank', 'Sales', 85000);
+""",
+        "reference_query": """
+SELECT name, department, salary
+FROM employees e
+WHERE salary > (SELECT AVG(salary) FROM employees WHERE department = e.department)
+ORDER BY id
 """,
         "expected_column_names": ["name", "department", "salary"],
         "expected_output": [
@@ -628,6 +727,27 @@ INSERT INTO orders VALUES (2, 'Bob', '2024-01-20', 200);
 INSERT INTO orders VALUES (3, 'Charlie', '2024-01-25', 150);
 INSERT INTO orders VALUES (4, 'Diana', '2023-12-01', 300);
 INSERT INTO orders VALUES (5, 'Eve', '2024-01-30', 250);
+""",
+        "reference_query": """
+SELECT customer_name, order_date, amount,
+       CAST(julianday('2024-01-30') - julianday(order_date) AS INTEGER) AS days_ago
+FROM orders
+WHERE order_date >= date('2024-01-30', '-30 days')
+ORDER BY order_date
+""",
+        "duckdb_reference_query": """
+SELECT customer_name, order_date, amount,
+       DATE '2024-01-30' - order_date AS days_ago
+FROM orders
+WHERE order_date >= DATE '2024-01-30' - INTERVAL 30 DAY
+ORDER BY order_date
+""",
+        "postgres_reference_query": """
+SELECT customer_name, order_date, amount,
+       DATE '2024-01-30' - order_date AS days_ago
+FROM orders
+WHERE order_date >= DATE '2024-01-30' - INTERVAL '30 days'
+ORDER BY order_date
 """,
         "expected_column_names": ["customer_name", "order_date", "amount", "days_ago"],
         "expected_output": [
@@ -657,6 +777,18 @@ INSERT INTO sales VALUES (5, 1200);
 INSERT INTO sales VALUES (6, 150);
 INSERT INTO sales VALUES (7, 300);
 INSERT INTO sales VALUES (8, 800);
+""",
+        "reference_query": """
+SELECT CASE
+         WHEN amount <= 200 THEN '0-200'
+         WHEN amount <= 500 THEN '201-500'
+         WHEN amount <= 1000 THEN '501-1000'
+         ELSE '1000+'
+       END AS "range",
+       COUNT(*) AS count
+FROM sales
+GROUP BY 1
+ORDER BY MIN(amount)
 """,
         "expected_column_names": ["range", "count"],
         "expected_output": [
@@ -667,3 +799,7 @@ INSERT INTO sales VALUES (8, 800);
         ]
     }
 ]
+
+# Large-dataset tier, backed by prebuilt datasets instead of seed_sql
+from large_challenges import LARGE_CHALLENGES
+CHALLENGES.extend(LARGE_CHALLENGES)
@@ -1,6 +1,6 @@
 import os
 import sqlite3
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text, Float
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -34,6 +34,7 @@ class UserSubmission(Base):
     query = Column(Text, nullable=False)
     passed = Column(Boolean, nullable=False)
     submitted_at = Column(DateTime, default=datetime.utcnow)
+    perf_score = Column(Float, nullable=True)
 
 def get_database_url():
     """Get database URL based on environment"""
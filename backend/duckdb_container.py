@@ -1,33 +1,134 @@
 import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
 import tempfile
+import threading
+import time
 import os
+import shutil
 import uuid
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from challenges import CHALLENGES
+from challenge_artifacts import compiled_image_dir
+from challenge_container import challenge_version
+from query_validation import query_prevalidator, READ_ONLY
+from performance import performance_grader, is_performance_graded
+from large_datasets import ensure_dataset, DATASET_READ_ONLY_ERROR
+from mutation_validation import (is_mutation_challenge, expected_fingerprints, grade_mutation,
+                                 reference_fingerprints, quote_identifier)
+from randomized_datasets import randomized_dataset_cache
+from hidden_datasets import hidden_dataset_grader, has_hidden_datasets
+from result_validation import (ExpectedResult, expected_result, result_matches, sort_columns, NUMERIC,
+                               NUMERIC_REL_TOLERANCE, NUMERIC_ABS_TOLERANCE, RESULT_PREVIEW_ROWS)
+from engines import ExecutionEngine, EngineCapabilities, timed_out_result, register_engine, report_stage
+
+# Outside this range Python's str() switches floats to exponent notation
+FLOAT_POSITIONAL_MIN = 1e-4
+FLOAT_POSITIONAL_MAX = 1e16
+
+
+def _python_strings(column: pa.Array) -> pa.Array:
+    """str() every value in Python - the reference the vectorized paths must match"""
+    return pa.array([None if value is None else str(value) for value in column.to_pylist()], pa.string())
+
+
+def _float_strings(column: pa.Array) -> pa.Array:
+    """Format floats exactly like Python's str(), vectorized for ordinary values"""
+    # float32 values reach Python as doubles, so format them as doubles too
+    values = pc.cast(column, pa.float64())
+    strings = pc.cast(values, pa.string())
+    
+    # Arrow prints integral doubles without the trailing ".0"
+    integral = pc.match_substring_regex(strings, r"^-?\d+$")
+    strings = pc.if_else(integral, pc.binary_join_element_wise(strings, ".0", ""), strings)
+    
+    # Both print the shortest round-trip digits, but pick exponent notation at different magnitudes
+    magnitude = pc.abs(values)
+    exponent_form = pc.or_(
+        pc.greater_equal(magnitude, FLOAT_POSITIONAL_MAX),
+        pc.and_(pc.less(magnitude, FLOAT_POSITIONAL_MIN), pc.not_equal(magnitude, 0.0))
+    )
+    exponent_form = pc.or_(exponent_form, pc.match_substring(strings, "e"))
+    if pc.any(exponent_form).as_py():
+        strings = pc.if_else(exponent_form, _python_strings(values), strings)
+    return strings
+
+
+def normalize_column(column: pa.Array) -> pa.Array:
+    """Canonical string form of a result column, matching str(cell) per value"""
+    column_type = column.type
+    if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+        strings = pc.cast(column, pa.string())
+    elif pa.types.is_integer(column_type) or pa.types.is_date(column_type):
+        strings = pc.cast(column, pa.string())
+    elif pa.types.is_decimal(column_type) and column_type.scale <= 6:
+        # Python's Decimal only uses exponent notation beyond six decimal places
+        strings = pc.cast(column, pa.string())
+    elif pa.types.is_boolean(column_type):
+        strings = pc.if_else(column, "True", "False")
+    elif pa.types.is_floating(column_type):
+        strings = _float_strings(column)
+    else:
+        # Timestamps, intervals, nested types... rare enough to format in Python
+        strings = _python_strings(column)
+    return pc.fill_null(strings, "None")
+
 
 class DuckDBContainer:
     """Manages isolated DuckDB database files for SQL challenges"""
     
-    def __init__(self):
+    def __init__(self, template_dir: Optional[str] = None):
         self.active_environments = {}
+        # One prebuilt database per challenge version; each submission gets a copy
+        self.template_dir = template_dir or compiled_image_dir("duckdb") or tempfile.mkdtemp(prefix="duckdb-challenges-")
+        os.makedirs(self.template_dir, exist_ok=True)
+        self._templates: Dict[int, str] = {}
+        # Environments copying each template right now
+        self._template_users: Dict[str, int] = {}
+        # Dropped templates still being copied; the last copy to finish deletes them
+        self._dropped = set()
+        # Reentrant: acquiring a template may build it
+        self._template_lock = threading.RLock()
+        
+    def create_challenge_environment(self, challenge_id: int, user_id: str,
+                                     challenge: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Create an isolated environment for a challenge
         
-    def create_challenge_environment(self, challenge_id: int, user_id: str) -> Dict[str, Any]:
-        """Create an isolated environment for a challenge"""
+        `challenge` overrides the catalog lookup, for challenge variants such as
+        hidden datasets.
+        """
         
         # Get challenge details
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        challenge = challenge or next((c for c in CHALLENGES if c["id"] == challenge_id), None)
         if not challenge:
             raise ValueError(f"Challenge {challenge_id} not found")
         
         # Create unique container name
         container_name = f"duckdb-challenge-{challenge_id}-{user_id}-{uuid.uuid4().hex[:8]}"
         
+        if challenge.get("dataset"):
+            # Prebuilt datasets are read straight from their Parquet files
+            return {
+                "container_name": container_name,
+                "db_path": None,
+                "dataset": challenge["dataset"],
+                "parquet": ensure_dataset(challenge["dataset"])["parquet"],
+                "challenge_id": challenge_id,
+                "user_id": user_id,
+                "schema": challenge.get("schema", ""),
+                "seed_data": challenge.get("seed_data", [])
+            }
+        
         # Create temporary database file - DuckDB needs a proper path
         temp_dir = tempfile.mkdtemp()
         temp_db_path = os.path.join(temp_dir, f"challenge_{challenge_id}_{user_id}_{uuid.uuid4().hex[:8]}.duckdb")
         
-        # Initialize database with challenge schema and data
-        self._setup_challenge_database(temp_db_path, challenge)
+        # Copy the prebuilt database - cheaper than replaying the seed SQL
+        template_path = self._acquire_template_database(challenge)
+        try:
+            shutil.copyfile(template_path, temp_db_path)
+        finally:
+            self._release_template_database(template_path)
         
         return {
             "container_name": container_name,
@@ -38,6 +139,56 @@ class DuckDBContainer:
             "seed_data": challenge.get("seed_data", [])
         }
     
+    def get_template_database(self, challenge: Dict[str, Any]) -> str:
+        """Path of the prebuilt database for a challenge, built on first use"""
+        challenge_id = challenge["id"]
+        with self._template_lock:
+            db_path = self._templates.get(challenge_id)
+            if db_path and os.path.exists(db_path):
+                return db_path
+            
+            db_path = os.path.join(self.template_dir, f"challenge-{challenge_id}-{challenge_version(challenge)}.duckdb")
+            if not os.path.exists(db_path):
+                build_path = f"{db_path}.{uuid.uuid4().hex[:8]}.tmp"
+                try:
+                    self._setup_challenge_database(build_path, challenge)
+                    os.replace(build_path, db_path)
+                finally:
+                    if os.path.exists(build_path):
+                        os.unlink(build_path)
+            # Dropped but still on disk: the same version is simply taken back
+            self._dropped.discard(db_path)
+            self._templates[challenge_id] = db_path
+            return db_path
+    
+    def _acquire_template_database(self, challenge: Dict[str, Any]) -> str:
+        """get_template_database, keeping the file on disk until _release_template_database"""
+        with self._template_lock:
+            db_path = self.get_template_database(challenge)
+            self._template_users[db_path] = self._template_users.get(db_path, 0) + 1
+            return db_path
+    
+    def _release_template_database(self, db_path: str):
+        with self._template_lock:
+            users = self._template_users.pop(db_path) - 1
+            if users:
+                self._template_users[db_path] = users
+            elif db_path in self._dropped:
+                self._dropped.discard(db_path)
+                if os.path.exists(db_path):
+                    os.unlink(db_path)
+    
+    def drop_template_database(self, challenge: Dict[str, Any]):
+        """Forget and delete a challenge's template once no copy is in progress; copies already made are unaffected"""
+        with self._template_lock:
+            db_path = self._templates.pop(challenge["id"], None)
+            if not db_path:
+                return
+            if self._template_users.get(db_path):
+                self._dropped.add(db_path)
+            elif os.path.exists(db_path):
+                os.unlink(db_path)
+    
     def _setup_challenge_database(self, db_path: str, challenge: Dict[str, Any]):
         """Initialize database with challenge schema and seed data"""
         conn = duckdb.connect(db_path)
@@ -60,33 +211,46 @@ class DuckDBContainer:
         finally:
             conn.close()
     
-    def execute_query(self, environment: Dict[str, Any], user_query: str) -> Dict[str, Any]:
+    def connect(self, environment: Dict[str, Any]) -> duckdb.DuckDBPyConnection:
+        """Open a connection to an environment's database"""
+        if environment.get("dataset"):
+            # In-memory database with one view per Parquet file - nothing is copied
+            conn = duckdb.connect(":memory:")
+            for table_name, parquet_path in environment["parquet"].items():
+                escaped_path = parquet_path.replace("'", "''")
+                conn.execute(f"CREATE VIEW {table_name} AS SELECT * FROM read_parquet('{escaped_path}')")
+            return conn
+        return duckdb.connect(environment["db_path"])
+    
+    def execute_query(self, environment: Dict[str, Any], user_query: str,
+                      timeout_s: Optional[float] = None) -> Dict[str, Any]:
         """Execute user query in isolated environment"""
         
-        db_path = environment["db_path"]
-        conn = duckdb.connect(db_path)
+        conn = self.connect(environment)
+        
+        # interrupt() is safe to call from another thread and aborts the running query
+        timer = threading.Timer(timeout_s, conn.interrupt) if timeout_s is not None else None
+        if timer:
+            timer.daemon = True
+            timer.start()
         
         try:
             # Execute user query
             conn.execute(user_query)
             
-            # Get results
-            query_upper = user_query.strip().upper()
-            if query_upper.startswith("SELECT") or query_upper.startswith("WITH"):
-                results = conn.fetchall()
-                columns = [desc[0] for desc in conn.description] if conn.description else []
-                
-                # Normalize results to strings to match expected format
-                normalized_results = []
-                for row in results:
-                    normalized_row = [str(cell) for cell in row]
-                    normalized_results.append(normalized_row)
+            # Get results - classify with DuckDB's own parser
+            if query_prevalidator.classify_duckdb(user_query) == READ_ONLY:
+                # Columnar transfer; only the preview is converted to strings and rows
+                table = conn.fetch_arrow_table()
+                preview = self.preview_rows(self.normalize_results(table.slice(0, RESULT_PREVIEW_ROWS)))
                 
                 return {
                     "success": True,
-                    "results": normalized_results,
-                    "columns": columns,
-                    "row_count": len(normalized_results)
+                    "results": preview,
+                    "columns": table.column_names,
+                    "row_count": table.num_rows,
+                    "truncated": len(preview) < table.num_rows,
+                    "table": table
                 }
             else:
                 # For non-SELECT queries (INSERT, UPDATE, DELETE, etc.)
@@ -97,16 +261,66 @@ class DuckDBContainer:
                     "rows_affected": rowcount
                 }
                 
+        except duckdb.InterruptException:
+            return timed_out_result(timeout_s)
         except Exception as e:
             return {
                 "success": False,
                 "error": str(e)
             }
         finally:
+            if timer:
+                timer.cancel()
             conn.close()
     
+    def table_fingerprints(self, environment: Dict[str, Any], tables: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Columns, row count and order-independent hash of each table, aggregated inside DuckDB
+        
+        Row hashes are summed as HUGEINT, so duplicates count and order does not.
+        Defaults to every table; tables that do not exist are left out.
+        """
+        conn = self.connect(environment)
+        try:
+            columns_by_table: Dict[str, List[str]] = {}
+            for table, column in conn.execute("""
+                SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = 'main' AND table_name IN (
+                    SELECT table_name FROM information_schema.tables
+                    WHERE table_schema = 'main' AND table_type = 'BASE TABLE'
+                )
+                ORDER BY table_name, ordinal_position
+            """).fetchall():
+                columns_by_table.setdefault(table, []).append(column)
+            
+            fingerprints = {}
+            for table in (sorted(columns_by_table) if tables is None else tables):
+                columns = columns_by_table.get(table)
+                if not columns:
+                    continue
+                row_count, digest = conn.execute(
+                    f"SELECT count(*), coalesce(sum(hash({', '.join(map(quote_identifier, columns))})::HUGEINT), 0)::VARCHAR "
+                    f"FROM {quote_identifier(table)}"
+                ).fetchone()
+                fingerprints[table] = {"columns": columns, "row_count": row_count, "hash": digest}
+            return fingerprints
+        finally:
+            conn.close()
+    
+    def normalize_results(self, table: pa.Table) -> pa.Table:
+        """Normalize result columns to strings to match expected format"""
+        columns = [normalize_column(column.combine_chunks()) for column in table.columns]
+        return pa.Table.from_arrays(columns, names=table.column_names)
+    
+    def preview_rows(self, table: pa.Table, limit: int = RESULT_PREVIEW_ROWS) -> List[List[str]]:
+        """First `limit` rows of a normalized table as Python lists"""
+        preview = table.slice(0, limit)
+        return [list(row) for row in zip(*(column.to_pylist() for column in preview.columns))]
+    
     def cleanup_environment(self, environment: Dict[str, Any]):
         """Clean up challenge environment"""
+        if environment.get("dataset"):
+            # Datasets are shared and outlive the request
+            return
         try:
             # Remove temporary database file and directory
             db_path = environment["db_path"]
@@ -119,47 +333,192 @@ class DuckDBContainer:
         except Exception as e:
             print(f"Error cleaning up environment: {e}")
 
-class DuckDBChallengeManager:
+class DuckDBChallengeManager(ExecutionEngine):
     """Manages DuckDB challenge execution and validation"""
     
+    name = "duckdb"
+    dialect = "duckdb"
+    capabilities = EngineCapabilities(cancellation=True)
+    
     def __init__(self):
         self.container = DuckDBContainer()
     
-    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str) -> Dict[str, Any]:
+    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                          timeout_s: Optional[float] = None) -> Dict[str, Any]:
         """Execute a challenge with user query"""
+        # Performance grading must finish within the submission's own timeout
+        deadline = time.monotonic() + timeout_s if timeout_s is not None else None
         
+        # Reject empty and malformed queries before building a sandbox
+        check = query_prevalidator.validate(challenge_id, user_query, "duckdb")
+        if not check["success"]:
+            return check
+        
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            raise ValueError(f"Challenge {challenge_id} not found")
+        # Randomized challenges are graded on the user's own generated data
+        challenge = randomized_dataset_cache.for_user(challenge, user_id)
+        if challenge.get("dataset") and check["statement_type"] != READ_ONLY:
+            return {"success": False, "error": DATASET_READ_ONLY_ERROR}
+        if is_mutation_challenge(challenge):
+            # Graded on the tables the statement leaves behind
+            return grade_mutation(self.container, challenge, self._expected_fingerprints(challenge),
+                                  user_id, user_query, timeout_s)
+        
+        # Hidden datasets run alongside the visible one, each on its own snapshot
+        hidden = hidden_dataset_grader.start(
+            challenge, lambda variant: self._execute_on(variant, user_id, user_query, timeout_s))
+        result = self._execute_on(challenge, user_id, user_query, timeout_s, report=True, deadline=deadline)
+        hidden_dataset_grader.finish(hidden, result, timeout_s)
+        if "seed_bucket" in challenge:
+            result["seed_bucket"] = challenge["seed_bucket"]
+        return result
+    
+    def _execute_on(self, challenge: Dict[str, Any], user_id: str, user_query: str, timeout_s: Optional[float],
+                    report: bool = False, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Run and validate the query on one dataset of a challenge; `report` for the one the user sees"""
         # Create isolated environment
-        environment = self.container.create_challenge_environment(challenge_id, user_id)
+        if report:
+            report_stage("setting_up")
+        environment = self.container.create_challenge_environment(challenge["id"], user_id, challenge)
         
         try:
             # Execute user query
-            result = self.container.execute_query(environment, user_query)
+            if report:
+                report_stage("executing")
+            result = self.container.execute_query(environment, user_query, timeout_s)
             
             # Validate against expected output
             if result["success"]:
-                result["passed"] = self._validate_result(challenge_id, result)
+                if report:
+                    report_stage("validating")
+                result["passed"] = self._result_matches(challenge, result)
+                
+                # Correct answers on large datasets are also graded on speed and plan, if there is time left
+                if report and result["passed"] and is_performance_graded(challenge):
+                    performance = performance_grader.grade(
+                        self.container, environment, challenge, user_query, "duckdb", deadline
+                    )
+                    if performance is not None:
+                        result["performance"] = performance
             
+            # The arrow table is for validation only
+            result.pop("table", None)
             return result
             
         finally:
             # Clean up environment
             self.container.cleanup_environment(environment)
     
+    def warm(self, challenge_id: int):
+        """Build the template database (or dataset) for a challenge"""
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            return
+        if challenge.get("dataset"):
+            ensure_dataset(challenge["dataset"])
+            self._profile_reference(challenge)
+        else:
+            self.container.get_template_database(challenge)
+        for variant in hidden_dataset_grader.variants(challenge) if has_hidden_datasets(challenge) else []:
+            self.container.get_template_database(variant)
+        if is_mutation_challenge(challenge):
+            self._expected_fingerprints(challenge)
+    
+    def _expected_fingerprints(self, challenge: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        return expected_fingerprints(self.name, challenge, challenge_version(challenge),
+                                     lambda: reference_fingerprints(self.container, challenge))
+    
+    def _profile_reference(self, challenge: Dict[str, Any]):
+        environment = self.container.create_challenge_environment(challenge["id"], "reference", challenge)
+        try:
+            performance_grader.precompute_reference(self.container, environment, challenge, "duckdb")
+        finally:
+            self.container.cleanup_environment(environment)
+    
     def _validate_result(self, challenge_id: int, result: Dict[str, Any]) -> bool:
         """Validate user result against expected output"""
         challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
         if not challenge:
             return False
+        return self._result_matches(challenge, result)
+    
+    def _result_matches(self, challenge: Dict[str, Any], result: Dict[str, Any]) -> bool:
+        expected = expected_result(challenge)
         
-        expected_output = challenge.get("expected_output", [])
+        table = result.get("table")
+        if table is None:
+            # Only a row preview is available
+            return "results" in result and result["results"] is not None and result_matches(challenge, result["results"])
         
-        # Simple validation - check if results match expected
-        if "results" in result and result["results"] is not None:
-            user_results = result["results"]
-            return user_results == expected_output
+        # A wrong row count fails before any cell is compared
+        if table.num_rows != expected.row_count:
+            return False
+        if expected.row_count == 0:
+            # An empty expected output says nothing about columns
+            return True
         
-        # If no results or results is None, it definitely doesn't match expected output
-        return False
+        # Large results are checked against a digest instead of an inline list
+        if expected.digest is not None:
+            normalized = self.container.normalize_results(table)
+            return result_matches(challenge, self.container.preview_rows(normalized, table.num_rows))
+        
+        # Compare column by column when the full result is available
+        return self._table_matches(table, expected)
+    
+    def _table_matches(self, table: pa.Table, expected: ExpectedResult) -> bool:
+        """Compare typed columns: numbers with a tolerance, text exactly, no per-cell strings"""
+        if table.num_columns != len(expected.kinds):
+            return False
+        if table.num_rows == 0:
+            return True
+        
+        columns = []
+        for column, kind in zip(table.columns, expected.kinds):
+            column = self._typed_column(column.combine_chunks(), kind)
+            if column is None:
+                return False
+            columns.append(column)
+        expected_columns = expected.vectors
+        if not expected.ordered:
+            # Row order does not matter: compare both sides sorted on every column
+            columns = sort_columns(columns)
+            expected_columns = expected.sorted_vectors
+        return all(
+            self._column_matches(column, expected_column, kind)
+            for column, expected_column, kind in zip(columns, expected_columns, expected.kinds)
+        )
+    
+    def _typed_column(self, column: pa.Array, kind: str) -> Optional[pa.Array]:
+        """Cast a result column to the expected column's type; None if it cannot be"""
+        if kind == NUMERIC:
+            column_type = column.type
+            if not (pa.types.is_integer(column_type) or pa.types.is_floating(column_type)
+                    or pa.types.is_decimal(column_type) or pa.types.is_boolean(column_type)
+                    or pa.types.is_string(column_type) or pa.types.is_large_string(column_type)):
+                return None
+            try:
+                return pc.cast(column, pa.float64())
+            except pa.ArrowInvalid:
+                # Text that is not a number
+                return None
+        if pa.types.is_string(column.type):
+            return pc.fill_null(column, "None")
+        # Dates, numbers... in a text column are compared by their string form
+        return normalize_column(column)
+    
+    def _column_matches(self, column: pa.Array, expected: pa.Array, kind: str) -> bool:
+        if kind != NUMERIC:
+            return column.equals(expected)
+        if not pc.is_null(column).equals(pc.is_null(expected)):
+            return False
+        tolerance = pc.max_element_wise(
+            pc.multiply(pc.abs(expected), NUMERIC_REL_TOLERANCE), NUMERIC_ABS_TOLERANCE)
+        close = pc.less_equal(pc.abs(pc.subtract(column, expected)), tolerance)
+        return pc.all(close).as_py() is not False
 
 # Global DuckDB challenge manager instance
-duckdb_challenge_manager = DuckDBChallengeManager() 
\ No newline at end of file
+duckdb_challenge_manager = DuckDBChallengeManager()
+register_engine(duckdb_challenge_manager)
+randomized_dataset_cache.add_eviction_listener(duckdb_challenge_manager.container.drop_template_database)
@@ -0,0 +1,278 @@
+import asyncio
+import copy
+import os
+import re
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Any, Optional, Union
+
+# Importing the engine modules registers every engine
+import atomic_structure_container
+import docker_postgres_container
+import duckdb_container
+import postgres_container
+import railway_postgres_container
+from challenge_container import challenge_version
+from engines import ExecutionEngine, ENGINE_REGISTRY, get_engine, find_challenge, timed_out_result, set_stage_listener, \
+    reset_stage_listener
+from query_validation import query_prevalidator, normalize_query, READ_ONLY
+from randomized_datasets import seed_bucket
+
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", "16"))
+ENGINE_TIMEOUT_S = float(os.getenv("ENGINE_TIMEOUT_S", "30"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+
+# Engines that cancel their own queries get this long to report the timeout themselves
+CANCEL_GRACE_S = 1.0
+LATENCY_SAMPLES = 1000
+
+# Queries whose result can change between runs are never cached
+_NONDETERMINISTIC = re.compile(
+    r"\b(?:random|randomblob|uuid|gen_random_uuid|now|current_date|current_time|current_timestamp"
+    r"|localtime|localtimestamp|clock_timestamp|statement_timestamp|timeofday)\b|'now'",
+    re.IGNORECASE
+)
+
+
+class EngineMetrics:
+    """Counters and recent latencies for one engine"""
+
+    def __init__(self):
+        self.submissions = 0
+        self.completed = 0
+        self.passed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.abandoned = 0
+        self.cache_hits = 0
+        self.in_flight = 0
+        self.latencies_ms = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.submissions += 1
+            self.in_flight += 1
+
+    def finished(self, result: Dict[str, Any], elapsed_ms: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+            self._count(result)
+            self.latencies_ms.append(elapsed_ms)
+
+    def cache_hit(self, result: Dict[str, Any]):
+        with self._lock:
+            self.submissions += 1
+            self.cache_hits += 1
+            self._count(result)
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned += 1
+
+    def _count(self, result: Dict[str, Any]):
+        if result.get("timed_out"):
+            self.timeouts += 1
+        elif not result.get("success"):
+            self.errors += 1
+        elif result.get("passed"):
+            self.passed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies_ms)
+            snapshot = {key: value for key, value in vars(self).items()
+                        if not key.startswith("_") and key != "latencies_ms"}
+        snapshot["p50_ms"] = round(statistics.median(latencies), 3) if latencies else None
+        snapshot["p95_ms"] = round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else None
+        return snapshot
+
+
+class EngineScheduler:
+    """Runs submissions for every registered engine
+
+    Sync engines share one worker pool; async engines share one background
+    event loop (their connection pools are bound to it). Every engine gets the
+    same deadline handling, metrics and result cache, keyed on the challenge
+    version and normalized query, for read-only deterministic queries.
+    """
+
+    def __init__(self, max_workers: int = ENGINE_WORKERS, timeout_s: float = ENGINE_TIMEOUT_S,
+                 cache_size: int = RESULT_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="engine")
+        self.max_workers = max_workers
+        self.timeout_s = timeout_s
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._metrics: Dict[str, EngineMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    def _resolve(self, engine: Union[str, ExecutionEngine]) -> ExecutionEngine:
+        if isinstance(engine, str):
+            resolved = get_engine(engine)
+            if resolved is None:
+                raise ValueError(f"Unsupported database type: {engine}")
+            return resolved
+        return engine
+
+    def metrics_for(self, name: str) -> EngineMetrics:
+        with self._metrics_lock:
+            if name not in self._metrics:
+                self._metrics[name] = EngineMetrics()
+            return self._metrics[name]
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="engine-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _cache_key(self, engine: ExecutionEngine, challenge_id: int, user_id: str, user_query: str) -> Optional[tuple]:
+        """Cache key for a read-only, deterministic query; None if the result must not be cached"""
+        if not self.cache_size or not engine.dialect or _NONDETERMINISTIC.search(user_query):
+            return None
+        challenge = find_challenge(challenge_id)
+        if not challenge:
+            return None
+        check = query_prevalidator.validate(challenge_id, user_query, engine.dialect)
+        if not check["success"] or check["statement_type"] != READ_ONLY:
+            return None
+        # Randomized challenges give each bucket of users different data
+        return (engine.name, challenge_id, challenge_version(challenge), seed_bucket(challenge, user_id),
+                normalize_query(user_query))
+
+    def _cached(self, key: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                return None
+            self._cache.move_to_end(key)
+        return copy.deepcopy(result)
+
+    def _store(self, key: Optional[tuple], result: Dict[str, Any]):
+        if key is None or not result.get("success"):
+            return
+        with self._cache_lock:
+            self._cache[key] = copy.deepcopy(result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def submit(self, engine: Union[str, ExecutionEngine], challenge_id: int, user_id: str, user_query: str,
+               timeout_s: Optional[float] = None, on_stage: Optional[Callable[[str], None]] = None) -> Future:
+        """Start a submission; the future resolves to the engine's result plus elapsed_ms
+
+        on_stage, if given, is called from the worker with each stage the engine reaches.
+        """
+        engine = self._resolve(engine)
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        metrics = self.metrics_for(engine.name)
+
+        key = self._cache_key(engine, challenge_id, user_id, user_query)
+        cached = self._cached(key)
+        if cached is not None:
+            metrics.cache_hit(cached)
+            cached.update({"cached": True, "elapsed_ms": 0.0})
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        # Engines that can stop their own query get the deadline; others are just abandoned
+        engine_timeout = timeout_s if engine.capabilities.cancellation else None
+        metrics.started()
+        if engine.capabilities.asynchronous:
+            coroutine = self._run_async(engine, key, challenge_id, user_id, user_query, engine_timeout, on_stage)
+            return asyncio.run_coroutine_threadsafe(coroutine, self._event_loop())
+        return self.executor.submit(self._run, engine, key, challenge_id, user_id, user_query, engine_timeout,
+                                    on_stage)
+
+    def _run(self, engine: ExecutionEngine, key, challenge_id: int, user_id: str, user_query: str,
+             timeout_s: Optional[float], on_stage=None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        # Worker threads are reused, so the listener is always reset
+        token = set_stage_listener(on_stage)
+        try:
+            result = engine.execute_challenge(challenge_id, user_id, user_query, timeout_s)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        finally:
+            reset_stage_listener(token)
+        return self._finish(engine, key, result, start)
+
+    async def _run_async(self, engine: ExecutionEngine, key, challenge_id: int, user_id: str, user_query: str,
+                         timeout_s: Optional[float], on_stage=None) -> Dict[str, Any]:
+        start = time.perf_counter()
+        # Each task runs in its own context, so this does not leak to other submissions
+        set_stage_listener(on_stage)
+        try:
+            result = await engine.execute_challenge(challenge_id, user_id, user_query, timeout_s)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        return self._finish(engine, key, result, start)
+
+    def _finish(self, engine: ExecutionEngine, key, result: Dict[str, Any], start: float) -> Dict[str, Any]:
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 3)
+        self.metrics_for(engine.name).finished(result, elapsed_ms)
+        self._store(key, result)
+        result["elapsed_ms"] = elapsed_ms
+        return result
+
+    def _wait_time(self, engine: ExecutionEngine, timeout_s: float) -> float:
+        return timeout_s + CANCEL_GRACE_S if engine.capabilities.cancellation else timeout_s
+
+    def execute(self, engine: Union[str, ExecutionEngine], challenge_id: int, user_id: str, user_query: str,
+                timeout_s: Optional[float] = None, on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Run a submission and wait for it, up to the deadline"""
+        engine = self._resolve(engine)
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        future = self.submit(engine, challenge_id, user_id, user_query, timeout_s, on_stage)
+        try:
+            return future.result(timeout=self._wait_time(engine, timeout_s))
+        except FutureTimeout:
+            # The engine keeps running in the background; its result is discarded
+            self.metrics_for(engine.name).abandon()
+            return timed_out_result(timeout_s)
+
+    async def execute_async(self, engine: Union[str, ExecutionEngine], challenge_id: int, user_id: str,
+                            user_query: str, timeout_s: Optional[float] = None,
+                            on_stage: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Awaitable execute() for callers running on an event loop"""
+        engine = self._resolve(engine)
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+        future = self.submit(engine, challenge_id, user_id, user_query, timeout_s, on_stage)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self._wait_time(engine, timeout_s))
+        except asyncio.TimeoutError:
+            self.metrics_for(engine.name).abandon()
+            return timed_out_result(timeout_s)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-engine capabilities and metrics plus cache occupancy"""
+        with self._cache_lock:
+            cached = len(self._cache)
+        return {
+            "engines": {
+                name: {**engine.describe(), "metrics": self.metrics_for(name).snapshot()}
+                for name, engine in ENGINE_REGISTRY.items()
+            },
+            "cache": {"entries": cached, "max_entries": self.cache_size},
+            "workers": self.max_workers,
+            "timeout_s": self.timeout_s,
+        }
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+# Global engine scheduler instance
+engine_scheduler = EngineScheduler()
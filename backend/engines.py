@@ -0,0 +1,111 @@
+import contextvars
+from typing import Callable, Dict, Any, List, Optional
+
+from challenges import CHALLENGES
+from result_validation import result_matches
+
+
+class EngineCapabilities:
+    """What an engine can do, so the scheduler can use each engine's fast path"""
+
+    def __init__(self, read_only_sharing: bool = False, transactional_reset: bool = False,
+                 cancellation: bool = False, asynchronous: bool = False):
+        # Read-only queries share one copy of the challenge data instead of a private one
+        self.read_only_sharing = read_only_sharing
+        # Isolation is a rolled-back transaction on a long-lived database
+        self.transactional_reset = transactional_reset
+        # execute_challenge honours timeout_s by stopping the running query itself
+        self.cancellation = cancellation
+        # execute_challenge is a coroutine function
+        self.asynchronous = asynchronous
+
+    def to_dict(self) -> Dict[str, bool]:
+        return dict(vars(self))
+
+
+class ExecutionEngine:
+    """Protocol every challenge engine implements
+
+    execute_challenge(challenge_id, user_id, user_query, timeout_s=None) returns
+    {"success": True, "passed": bool, "results": [[str]], "columns": [...], "row_count": n}
+    or {"success": False, "error": ...}. Engines with the asynchronous capability
+    implement it as a coroutine function.
+    """
+
+    name = ""
+    # Dialect used to classify queries as read-only; None for engines that do not run SQL
+    dialect: Optional[str] = None
+    capabilities = EngineCapabilities()
+
+    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                          timeout_s: Optional[float] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def warm(self, challenge_id: int):
+        """Build whatever a challenge's submissions share, ahead of a burst of them"""
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "dialect": self.dialect, "capabilities": self.capabilities.to_dict()}
+
+
+def find_challenge(challenge_id: int) -> Optional[Dict[str, Any]]:
+    return next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+
+
+def validate_rows(challenge: Optional[Dict[str, Any]], result: Dict[str, Any]) -> bool:
+    """Compare normalized result rows with a challenge's precomputed expected result"""
+    if not challenge:
+        return False
+
+    user_results = result.get("results")
+    if user_results is None:
+        return False
+
+    return result_matches(challenge, user_results)
+
+
+# Stages a submission reports while it runs
+SUBMISSION_STAGES = ("queued", "setting_up", "executing", "validating")
+
+# Set by whoever is waiting on the submission; engines call report_stage()
+_stage_listener: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar(
+    "stage_listener", default=None)
+
+
+def set_stage_listener(listener: Optional[Callable[[str], None]]) -> contextvars.Token:
+    return _stage_listener.set(listener)
+
+
+def reset_stage_listener(token: contextvars.Token):
+    _stage_listener.reset(token)
+
+
+def report_stage(stage: str):
+    """Tell the current submission's listener, if any, which stage it has reached"""
+    listener = _stage_listener.get()
+    if listener is not None:
+        listener(stage)
+
+
+def timed_out_result(timeout_s: float) -> Dict[str, Any]:
+    return {
+        "success": False,
+        "timed_out": True,
+        "error": f"Query did not finish within {timeout_s:g}s"
+    }
+
+# Engines by database_type, filled in by each engine module as it is imported
+ENGINE_REGISTRY: Dict[str, ExecutionEngine] = {}
+
+
+def register_engine(engine: ExecutionEngine) -> ExecutionEngine:
+    ENGINE_REGISTRY[engine.name] = engine
+    return engine
+
+
+def get_engine(database_type: str) -> Optional[ExecutionEngine]:
+    return ENGINE_REGISTRY.get(database_type.lower())
+
+
+def engine_names() -> List[str]:
+    return list(ENGINE_REGISTRY)
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# Threads running hidden datasets; separate from the engine pool, whose workers wait on them
+HIDDEN_DATASET_WORKERS = int(os.getenv("HIDDEN_DATASET_WORKERS", "16"))
+# How long to wait for hidden datasets when the submission has no timeout of its own
+HIDDEN_DATASET_TIMEOUT_S = float(os.getenv("HIDDEN_DATASET_TIMEOUT_S", "30"))
+
+
+def has_hidden_datasets(challenge: Optional[Dict[str, Any]]) -> bool:
+    # Large-dataset challenges are graded on their generated data alone
+    return bool(challenge and challenge.get("hidden_datasets") and not challenge.get("dataset"))
+
+
+def reference_output(challenge: Dict[str, Any], seed_sql: str) -> List[List[str]]:
+    """Expected output of the reference query on other seed data, computed on SQLite"""
+    conn = sqlite3.connect(":memory:")
+    try:
+        if challenge.get("schema_sql"):
+            conn.executescript(challenge["schema_sql"])
+        conn.executescript(seed_sql)
+        return [[str(cell) for cell in row] for row in conn.execute(challenge["reference_query"])]
+    finally:
+        conn.close()
+
+
+class HiddenDatasetGrader:
+    """Grades a submission on a challenge's hidden datasets as well as the visible one
+
+    Each hidden dataset ({"name", "seed_sql"} and optionally "expected_output")
+    becomes a variant of the challenge with its own id and version, so engines
+    build and cache its snapshot like any other challenge database. Variants
+    run concurrently with the visible dataset; the first failure cancels
+    whatever has not started and decides the verdict.
+    """
+
+    def __init__(self, workers: int = HIDDEN_DATASET_WORKERS, timeout_s: float = HIDDEN_DATASET_TIMEOUT_S):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hidden-dataset")
+        self.timeout_s = timeout_s
+        # challenge id -> (definition the variants were built from, variants)
+        self._variants: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def variants(self, challenge: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Challenge copies with each hidden dataset's seed data and expected output, built once"""
+        source = (challenge["hidden_datasets"], challenge.get("schema_sql"), challenge.get("reference_query"))
+        cached = self._variants.get(challenge["id"])
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        variants = []
+        for dataset in challenge["hidden_datasets"]:
+            variant = {name: value for name, value in challenge.items()
+                       if name not in ("hidden_datasets", "expected_digest", "expected_row_count")}
+            variant["id"] = f"{challenge['id']}-hidden-{dataset['name']}"
+            variant["hidden_dataset"] = dataset["name"]
+            variant["seed_sql"] = dataset["seed_sql"]
+            variant["expected_output"] = dataset.get("expected_output") or reference_output(
+                challenge, dataset["seed_sql"])
+            variants.append(variant)
+        with self._lock:
+            self._variants[challenge["id"]] = (source, variants)
+        return variants
+
+    def start(self, challenge: Optional[Dict[str, Any]],
+              run: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Optional[List[Tuple[str, Future]]]:
+        """Start run(variant) for every hidden dataset; None if the challenge has none"""
+        if not has_hidden_datasets(challenge):
+            return None
+        return [(variant["hidden_dataset"], self.executor.submit(run, variant)) for variant in self.variants(challenge)]
+
+    def finish(self, runs: Optional[List[Tuple[str, Future]]], result: Dict[str, Any],
+               timeout_s: Optional[float] = None):
+        """Fold the hidden datasets' verdicts into the visible result"""
+        if runs is None:
+            return
+        futures = {future: name for name, future in runs}
+        summary = {"total": len(runs), "passed": 0, "failed": None}
+        result["hidden_datasets"] = summary
+        if not (result.get("success") and result.get("passed")):
+            # Already failed on the visible data
+            self._cancel(futures)
+            return
+
+        failed = False
+        try:
+            for future in as_completed(futures, timeout=timeout_s or self.timeout_s):
+                if not self._passed(future):
+                    failed = True
+                    summary["failed"] = futures[future]
+                    break
+                summary["passed"] += 1
+        except FutureTimeout:
+            failed = True
+            summary["failed"] = next((name for future, name in futures.items() if not future.done()), None)
+            summary["timed_out"] = True
+
+        if failed:
+            self._cancel(futures)
+            result["passed"] = False
+            # Only correct answers are graded on performance
+            result.pop("performance", None)
+
+    def _passed(self, future: Future) -> bool:
+        try:
+            outcome = future.result()
+        except Exception as e:
+            print(f"Error grading hidden dataset: {e}")
+            return False
+        return bool(outcome.get("success") and outcome.get("passed"))
+
+    def _cancel(self, futures: Dict[Future, str]):
+        # Variants already running finish under their own timeout; their results are ignored
+        for future in futures:
+            future.cancel()
+
+# Global hidden dataset grader instance
+hidden_dataset_grader = HiddenDatasetGrader()
@@ -0,0 +1,100 @@
+from large_datasets import COMMERCE_SCHEMA_SQL
+
+# Challenges over the prebuilt datasets in large_datasets.py. Results are too
+# big to list inline, so they are checked against a digest of the normalized
+# rows (see large_datasets.result_digest) and the expected row count.
+LARGE_CHALLENGES = [
+    {
+        "id": 201,
+        "name": "Revenue by Country",
+        "level": "Advanced",
+        "tier": "large",
+        "dataset": "commerce",
+        "question": "Write a query to show the total amount of completed orders per customer country. Show country and revenue, highest revenue first.",
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "reference_query": """
+SELECT c.country, SUM(o.amount) AS revenue
+FROM orders o
+JOIN customers c ON c.id = o.customer_id
+WHERE o.status = 'completed'
+GROUP BY c.country
+ORDER BY revenue DESC
+""",
+        "expected_column_names": ["country", "revenue"],
+        "expected_row_count": 15,
+        "expected_digest": "7181bf28390dd055fb2b27fe6598e2d5e36d75badba81b3b71e5e98ee939bf06"
+    },
+    {
+        "id": 202,
+        "name": "Monthly Order Counts",
+        "level": "Advanced",
+        "tier": "large",
+        "dataset": "commerce",
+        "question": "Write a query to count orders per month. Show the month as 'YYYY-MM' and order_count, ordered by month.",
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "reference_query": """
+SELECT substr(order_date, 1, 7) AS month, COUNT(*) AS order_count
+FROM orders
+GROUP BY month
+ORDER BY month
+""",
+        "expected_column_names": ["month", "order_count"],
+        "expected_row_count": 24,
+        "expected_digest": "ae793d135931da4c85d1e60cfba3b8287c3adc4e1164f943aa8d1c677033f937"
+    },
+    {
+        "id": 203,
+        "name": "Top Ten Customers",
+        "level": "Advanced",
+        "tier": "large",
+        "dataset": "commerce",
+        "question": "Write a query to find the 10 customers with the highest total amount of completed orders. Show customer_id and total_spent, highest first (ties by customer_id).",
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "reference_query": """
+SELECT customer_id, SUM(amount) AS total_spent
+FROM orders
+WHERE status = 'completed'
+GROUP BY customer_id
+ORDER BY total_spent DESC, customer_id
+LIMIT 10
+""",
+        "expected_column_names": ["customer_id", "total_spent"],
+        "expected_row_count": 10,
+        "expected_digest": "ceb1de867e82907a4dfcbb3d6f4c7e50f299f6b0b822fc19ed21882133dc01bb"
+    },
+    {
+        "id": 204,
+        "name": "Funnel Reach",
+        "level": "Advanced",
+        "tier": "large",
+        "dataset": "commerce",
+        "question": "Write a query to count how many distinct customers triggered each event type. Show event_type and customers, most customers first (ties by event_type).",
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "reference_query": """
+SELECT event_type, COUNT(DISTINCT customer_id) AS customers
+FROM events
+GROUP BY event_type
+ORDER BY customers DESC, event_type
+""",
+        "expected_column_names": ["event_type", "customers"],
+        "expected_row_count": 5,
+        "expected_digest": "a265f2d3dbe7204b17d6fadef25779e4d295997400ec8834affbd108c96593e4"
+    },
+    {
+        "id": 205,
+        "name": "Customers Without Orders",
+        "level": "Advanced",
+        "tier": "large",
+        "dataset": "commerce",
+        "question": "Write a query to count the customers who never placed an order. Show a single column named customers.",
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "reference_query": """
+SELECT COUNT(*) AS customers
+FROM customers c
+WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.customer_id = c.id)
+""",
+        "expected_column_names": ["customers"],
+        "expected_row_count": 1,
+        "expected_digest": "772080507498bb6cac93e771003cc73ae2fd192b9189fe5049bf0d746ef23011"
+    }
+]
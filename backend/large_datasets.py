@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Prebuilt datasets for the large-dataset challenge tier.
+
+Each dataset is generated deterministically (fixed seed, Python's random
+module) and built once into:
+
+- a read-only SQLite file, opened by the SQLite container with
+  mode=ro&immutable=1 and a large mmap_size
+- one Parquet file per table, mounted by the DuckDB container as views
+
+Neither container copies the data. Builds happen lazily on first use, or
+ahead of time (e.g. in the Docker image) with:
+
+    python large_datasets.py --dataset commerce
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, Iterable, List, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Read-only datasets are mapped into memory instead of going through the page cache
+SQLITE_MMAP_SIZE = 1 << 30
+
+DATASET_READ_ONLY_ERROR = "Queries on this challenge's dataset must be read-only"
+
+COMMERCE_SCHEMA_SQL = """
+CREATE TABLE customers (
+  id INTEGER PRIMARY KEY,
+  name TEXT,
+  country TEXT,
+  signup_date TEXT
+);
+CREATE TABLE orders (
+  id INTEGER PRIMARY KEY,
+  customer_id INTEGER,
+  order_date TEXT,
+  status TEXT,
+  amount INTEGER
+);
+CREATE TABLE events (
+  id INTEGER PRIMARY KEY,
+  customer_id INTEGER,
+  event_type TEXT,
+  event_time TEXT
+);
+"""
+
+# Only some access paths are indexed so query plans actually matter
+COMMERCE_INDEX_SQL = """
+CREATE INDEX idx_orders_customer_id ON orders(customer_id);
+CREATE INDEX idx_events_customer_id ON events(customer_id);
+"""
+
+COUNTRIES = ["US", "GB", "DE", "FR", "IN", "BR", "JP", "CA", "AU", "ES", "IT", "NL", "MX", "SE", "KR"]
+ORDER_STATUSES = ["completed", "refunded", "cancelled"]
+EVENT_TYPES = ["page_view", "search", "add_to_cart", "checkout", "purchase"]
+START_DATE = date(2023, 1, 1)
+
+# Pareto shape for customer activity - a few customers place most orders
+ACTIVITY_ALPHA = 1.3
+
+
+class CommerceGenerator:
+    """Customers, orders and clickstream events for an online shop"""
+
+    def __init__(self, seed: int = 42, customers: int = 50000, orders: int = 1000000, events: int = 2000000):
+        self.seed = seed
+        self.customers = customers
+        self.orders = orders
+        self.events = events
+
+    def _activity_weights(self, rng: random.Random) -> List[float]:
+        weights = [rng.paretovariate(ACTIVITY_ALPHA) for _ in range(self.customers)]
+        # Cumulative weights make rng.choices O(log n) per draw
+        total = 0.0
+        cumulative = []
+        for weight in weights:
+            total += weight
+            cumulative.append(total)
+        return cumulative
+
+    def tables(self) -> Iterable[tuple]:
+        """Yield (table_name, {column: values}) in schema column order"""
+        days = [(START_DATE + timedelta(days=i)).isoformat() for i in range(730)]
+        customer_ids = range(1, self.customers + 1)
+
+        rng = random.Random(f"{self.seed}-customers")
+        yield "customers", {
+            "id": list(customer_ids),
+            "name": [f"Customer {i}" for i in customer_ids],
+            "country": rng.choices(COUNTRIES, weights=range(len(COUNTRIES), 0, -1), k=self.customers),
+            "signup_date": [days[rng.randrange(365)] for _ in customer_ids],
+        }
+
+        rng = random.Random(f"{self.seed}-orders")
+        activity = self._activity_weights(rng)
+        yield "orders", {
+            "id": list(range(1, self.orders + 1)),
+            "customer_id": rng.choices(customer_ids, cum_weights=activity, k=self.orders),
+            "order_date": rng.choices(days, k=self.orders),
+            "status": rng.choices(ORDER_STATUSES, weights=[85, 10, 5], k=self.orders),
+            "amount": [rng.randrange(500, 50000) for _ in range(self.orders)],
+        }
+
+        rng = random.Random(f"{self.seed}-events")
+        activity = self._activity_weights(rng)
+        start = datetime(START_DATE.year, START_DATE.month, START_DATE.day)
+        yield "events", {
+            "id": list(range(1, self.events + 1)),
+            "customer_id": rng.choices(customer_ids, cum_weights=activity, k=self.events),
+            "event_type": rng.choices(EVENT_TYPES, weights=[60, 20, 10, 6, 4], k=self.events),
+            "event_time": [
+                (start + timedelta(seconds=rng.randrange(730 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+                for _ in range(self.events)
+            ],
+        }
+
+
+DATASETS = {
+    "commerce": {
+        "version": 1,
+        "schema_sql": COMMERCE_SCHEMA_SQL,
+        "index_sql": COMMERCE_INDEX_SQL,
+        "generator": CommerceGenerator,
+    },
+}
+
+_build_lock = threading.Lock()
+
+
+def get_dataset_dir() -> str:
+    """Directory holding the built datasets"""
+    return os.getenv("LARGE_DATASET_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+
+
+def dataset_path(name: str, dataset_dir: str = None) -> str:
+    """Versioned directory of a built dataset"""
+    dataset = DATASETS[name]
+    return os.path.join(dataset_dir or get_dataset_dir(), f"{name}-v{dataset['version']}")
+
+
+def result_digest(rows: Iterable[Sequence[str]]) -> str:
+    """Order-sensitive SHA-256 of normalized result rows"""
+    digest = hashlib.sha256()
+    for row in rows:
+        update_result_digest(digest, row)
+    return digest.hexdigest()
+
+
+def update_result_digest(digest, row: Sequence[str]):
+    """Add one row to a result digest"""
+    digest.update("\x1f".join(row).encode("utf-8"))
+    digest.update(b"\x1e")
+
+
+def _write_sqlite(db_path: str, dataset: Dict[str, Any], tables: Dict[str, Dict[str, list]]):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(dataset["schema_sql"])
+        conn.execute("BEGIN")
+        for table_name, columns in tables.items():
+            placeholders = ", ".join("?" for _ in columns)
+            conn.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})", zip(*columns.values()))
+        conn.execute("COMMIT")
+        conn.executescript(dataset["index_sql"])
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def build_dataset(name: str, dataset_dir: str = None) -> Dict[str, Any]:
+    """Generate a dataset and write its SQLite file, Parquet files and manifest"""
+    dataset = DATASETS[name]
+    final_path = dataset_path(name, dataset_dir)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    build_path = tempfile.mkdtemp(prefix=f".{name}-", dir=os.path.dirname(final_path))
+    os.chmod(build_path, 0o755)
+    start = time.perf_counter()
+
+    try:
+        generator = dataset["generator"]()
+        tables = dict(generator.tables())
+
+        os.makedirs(os.path.join(build_path, "parquet"))
+        for table_name, columns in tables.items():
+            pq.write_table(pa.table(columns), os.path.join(build_path, "parquet", f"{table_name}.parquet"))
+
+        db_path = os.path.join(build_path, f"{name}.db")
+        _write_sqlite(db_path, dataset, tables)
+        # immutable=1 is only safe if nothing ever writes to the file again
+        os.chmod(db_path, 0o444)
+
+        manifest = {
+            "name": name,
+            "version": dataset["version"],
+            "seed": generator.seed,
+            "rows": {table_name: len(next(iter(columns.values()))) for table_name, columns in tables.items()},
+            "built_at": datetime.utcnow().isoformat(),
+            "build_s": round(time.perf_counter() - start, 2),
+        }
+        with open(os.path.join(build_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        try:
+            os.rename(build_path, final_path)
+        except OSError:
+            # Another process finished first - keep its copy
+            if not os.path.exists(os.path.join(final_path, "manifest.json")):
+                raise
+        return manifest
+    finally:
+        if os.path.exists(build_path):
+            shutil.rmtree(build_path, ignore_errors=True)
+
+
+def is_dataset_built(name: str) -> bool:
+    """Whether a dataset is ready to use without building it"""
+    return os.path.exists(os.path.join(dataset_path(name), "manifest.json"))
+
+
+def ensure_dataset(name: str) -> Dict[str, Any]:
+    """Paths of a built dataset, building it on first use"""
+    path = dataset_path(name)
+    if not is_dataset_built(name):
+        with _build_lock:
+            if not is_dataset_built(name):
+                print(f"Building dataset '{name}' in {path}")
+                build_dataset(name)
+
+    return {
+        "sqlite": os.path.join(path, f"{name}.db"),
+        "parquet": {
+            table_name: os.path.join(path, "parquet", f"{table_name}.parquet")
+            for table_name in _table_names(name)
+        },
+    }
+
+
+def _table_names(name: str) -> List[str]:
+    return re.findall(r"CREATE TABLE (\w+)", DATASETS[name]["schema_sql"], re.IGNORECASE)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the large challenge datasets")
+    parser.add_argument("--dataset", action="append", choices=sorted(DATASETS),
+                        help="Dataset to build (repeatable, default: all)")
+    parser.add_argument("--output-dir", help="Defaults to $LARGE_DATASET_DIR or backend/datasets")
+    args = parser.parse_args(argv)
+
+    for name in args.dataset or sorted(DATASETS):
+        if os.path.exists(os.path.join(dataset_path(name, args.output_dir), "manifest.json")):
+            print(f"{name}: already built")
+            continue
+        print(json.dumps(build_dataset(name, args.output_dir), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
+from typing import List
 import sqlite3
+import asyncio
+import json
+import threading
+import time
 import re
 import jwt
 import bcrypt
@@ -14,9 +20,18 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta, timezone
 from challenges import CHALLENGES
-from challenge_container import challenge_manager
-from duckdb_container import duckdb_challenge_manager
-from atomic_structure_container import atomic_structure_challenge_manager
+from query_plans import query_plan_cache, DATASET_RETRY_AFTER_S
+from large_datasets import is_dataset_built
+from multi_engine import multi_engine_runner
+from engine_scheduler import engine_scheduler
+from engines import get_engine
+from submission_admission import submission_admission, submission_db_executor
+from submission_jobs import submission_job_queue
+from batch_grading import batch_grader, batch_verdict, BATCH_MAX_ITEMS, BATCH_RECORD_CHUNK
+from result_validation import diff_result, DIFF_PREVIEW_ROWS
+from mutation_validation import is_mutation_challenge
+from randomized_datasets import randomized_dataset_cache
+from challenge_artifacts import challenge_artifacts, parse_table_schema
 from courses import COURSES, get_course_by_id, get_available_courses, get_course_challenges
 
 app = FastAPI()
@@ -27,6 +42,14 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# How often the job event stream checks for new stages
+JOB_EVENTS_POLL_S = 0.1
+
+# Build the large datasets and profile their reference solutions at startup, off the request path
+WARM_LARGE_DATASETS = os.getenv("WARM_LARGE_DATASETS", "true").lower() == "true"
+# Start the pooled Docker Postgres containers at startup instead of on the first docker_postgres submission
+WARM_DOCKER_POSTGRES_POOL = os.getenv("WARM_DOCKER_POSTGRES_POOL", "false").lower() == "true"
+
 # CORS Configuration
 # Environment-aware CORS setup
 ENVIRONMENT = os.getenv("ENVIRONMENT", "production").lower()
@@ -118,10 +141,16 @@ def init_db():
             query TEXT NOT NULL,
             passed BOOLEAN NOT NULL,
             submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            perf_score REAL,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     """)
     
+    # Databases created before performance grading lack the perf_score column
+    submission_columns = {row[1] for row in cursor.execute("PRAGMA table_info(user_submissions)")}
+    if "perf_score" not in submission_columns:
+        cursor.execute("ALTER TABLE user_submissions ADD COLUMN perf_score REAL")
+    
     # Create password_reset_tokens table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS password_reset_tokens (
@@ -139,6 +168,40 @@ def init_db():
     conn.close()
 
 init_db()
+# Compiled catalog artifacts, if the build step produced them
+if challenge_artifacts.load():
+    print(f"Using compiled artifacts for {len(challenge_artifacts.challenges)} challenges "
+          f"({len(challenge_artifacts.stale)} stale, loaded in {challenge_artifacts.load_ms} ms)")
+else:
+    print("No compiled artifacts, building challenge databases on first use")
+
+def warm_large_datasets():
+    """Profile the reference solutions of every prebuilt large dataset on the engines that grade performance"""
+    for challenge in CHALLENGES:
+        if not challenge.get("dataset"):
+            continue
+        if not is_dataset_built(challenge["dataset"]):
+            # Datasets are built by the deploy build step (or on first use), never at import
+            print(f"Skipping warm-up of challenge {challenge['id']}: dataset {challenge['dataset']} is not built")
+            continue
+        for database_type in ["sqlite", "duckdb"]:
+            try:
+                get_engine(database_type).warm(challenge["id"])
+            except Exception as e:
+                print(f"Error warming challenge {challenge['id']} on {database_type}: {e}")
+
+def warm_docker_postgres_pool():
+    """Fill the Docker Postgres container pool, if a Docker daemon is reachable"""
+    try:
+        get_engine("docker_postgres").container.pool.warm()
+    except Exception as e:
+        print(f"Docker Postgres pool not warmed: {e}")
+
+if WARM_LARGE_DATASETS:
+    threading.Thread(target=warm_large_datasets, name="warm-large-datasets", daemon=True).start()
+
+if WARM_DOCKER_POSTGRES_POOL:
+    threading.Thread(target=warm_docker_postgres_pool, name="warm-docker-postgres-pool", daemon=True).start()
 
 # Models
 class UserSignup(BaseModel):
@@ -150,6 +213,19 @@ class UserLogin(BaseModel):
     password: str
 
 class ChallengeSubmitRequest(BaseModel):
+    user_query: str
+    database_type: str = "sqlite"  # a registered engine ("sqlite", "duckdb", "postgres", ...) or "all"
+
+class BatchGradeItem(BaseModel):
+    user_id: int
+    challenge_id: int
+    query: str
+    engine: str = "sqlite"
+
+class BatchGradeRequest(BaseModel):
+    items: List[BatchGradeItem]
+
+class ChallengeExplainRequest(BaseModel):
     user_query: str
     database_type: str = "sqlite"  # "sqlite" or "duckdb"
 
@@ -239,6 +315,19 @@ def get_user_id(email: str) -> int:
     finally:
         conn.close()
 
+def get_existing_user_ids(user_ids: set) -> set:
+    """The subset of user_ids that exist"""
+    if not user_ids:
+        return set()
+    conn = sqlite3.connect(get_database_path())
+    cursor = conn.cursor()
+    try:
+        placeholders = ",".join("?" * len(user_ids))
+        cursor.execute(f"SELECT id FROM users WHERE id IN ({placeholders})", tuple(user_ids))
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        conn.close()
+
 def get_smtp_config():
     """Get SMTP configuration based on environment"""
     environment = os.getenv("ENVIRONMENT", "production").lower()
@@ -428,51 +517,62 @@ def mark_token_as_used(token: str, conn=None):
         if should_close:
             conn.close()
 
-def record_submission_and_progress(user_id: int, challenge_id: int, query: str, passed: bool):
+def _record_submission_and_progress(cursor, user_id: int, challenge_id: int, query: str, passed: bool,
+                                    perf_score: float = None):
+    """Insert a submission and update progress inside the caller's transaction"""
+    # Record submission
+    cursor.execute("""
+        INSERT INTO user_submissions (user_id, challenge_id, query, passed, perf_score)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, challenge_id, query, passed, perf_score))
+    
+    # Update progress - simple and readable
+    cursor.execute("""
+        SELECT id, attempts, solved_at FROM user_progress 
+        WHERE user_id = ? AND challenge_id = ?
+    """, (user_id, challenge_id))
+    
+    existing = cursor.fetchone()
+    
+    if existing:
+        # Update existing record - always increment attempts
+        cursor.execute("""
+            UPDATE user_progress 
+            SET attempts = attempts + 1,
+                solved_at = CASE 
+                    WHEN ? = 1 AND solved_at IS NULL THEN CURRENT_TIMESTAMP 
+                    ELSE solved_at 
+                END
+            WHERE user_id = ? AND challenge_id = ?
+        """, (passed, user_id, challenge_id))
+    else:
+        # Insert new record
+        if passed:
+            cursor.execute("""
+                INSERT INTO user_progress (user_id, challenge_id, attempts, solved_at)
+                VALUES (?, ?, 1, CURRENT_TIMESTAMP)
+            """, (user_id, challenge_id))
+        else:
+            cursor.execute("""
+                INSERT INTO user_progress (user_id, challenge_id, attempts, solved_at)
+                VALUES (?, ?, 1, NULL)
+            """, (user_id, challenge_id))
+
+def record_submission_and_progress(user_id: int, challenge_id: int, query: str, passed: bool,
+                                   perf_score: float = None):
     """Record user submission and update progress in a single transaction"""
+    record_submissions_batch([(user_id, challenge_id, query, passed, perf_score)])
+
+def record_submissions_batch(submissions: list):
+    """Record (user_id, challenge_id, query, passed, perf_score) tuples and progress in one transaction"""
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
         # Start transaction
         conn.execute("BEGIN TRANSACTION")
         
-        # Record submission
-        cursor.execute("""
-            INSERT INTO user_submissions (user_id, challenge_id, query, passed)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, challenge_id, query, passed))
-        
-        # Update progress - simple and readable
-        cursor.execute("""
-            SELECT id, attempts, solved_at FROM user_progress 
-            WHERE user_id = ? AND challenge_id = ?
-        """, (user_id, challenge_id))
-        
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing record - always increment attempts
-            cursor.execute("""
-                UPDATE user_progress 
-                SET attempts = attempts + 1,
-                    solved_at = CASE 
-                        WHEN ? = 1 AND solved_at IS NULL THEN CURRENT_TIMESTAMP 
-                        ELSE solved_at 
-                    END
-                WHERE user_id = ? AND challenge_id = ?
-            """, (passed, user_id, challenge_id))
-        else:
-            # Insert new record
-            if passed:
-                cursor.execute("""
-                    INSERT INTO user_progress (user_id, challenge_id, attempts, solved_at)
-                    VALUES (?, ?, 1, CURRENT_TIMESTAMP)
-                """, (user_id, challenge_id))
-            else:
-                cursor.execute("""
-                    INSERT INTO user_progress (user_id, challenge_id, attempts, solved_at)
-                    VALUES (?, ?, 1, NULL)
-                """, (user_id, challenge_id))
+        for user_id, challenge_id, query, passed, perf_score in submissions:
+            _record_submission_and_progress(cursor, user_id, challenge_id, query, passed, perf_score)
         
         # Commit transaction
         conn.commit()
@@ -483,15 +583,15 @@ def record_submission_and_progress(user_id: int, challenge_id: int, query: str,
     finally:
         conn.close()
 
-def record_submission(user_id: int, challenge_id: int, query: str, passed: bool):
+def record_submission(user_id: int, challenge_id: int, query: str, passed: bool, perf_score: float = None):
     """Record a user submission"""
     conn = sqlite3.connect(get_database_path())
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            INSERT INTO user_submissions (user_id, challenge_id, query, passed)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, challenge_id, query, passed))
+            INSERT INTO user_submissions (user_id, challenge_id, query, passed, perf_score)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, challenge_id, query, passed, perf_score))
         conn.commit()
     finally:
         conn.close()
@@ -573,14 +673,14 @@ def get_user_submissions(user_id: int, challenge_id: int = None):
     try:
         if challenge_id:
             cursor.execute("""
-                SELECT challenge_id, query, passed, submitted_at
+                SELECT challenge_id, query, passed, submitted_at, perf_score
                 FROM user_submissions 
                 WHERE user_id = ? AND challenge_id = ?
                 ORDER BY submitted_at DESC
             """, (user_id, challenge_id))
         else:
             cursor.execute("""
-                SELECT challenge_id, query, passed, submitted_at
+                SELECT challenge_id, query, passed, submitted_at, perf_score
                 FROM user_submissions 
                 WHERE user_id = ?
                 ORDER BY submitted_at DESC
@@ -687,54 +787,6 @@ def reset_all_attempts_to_one():
     finally:
         conn.close()
 
-def parse_table_schema(schema_sql: str):
-    """Parse CREATE TABLE SQL and return structured schema data"""
-    tables = []
-    
-    # Split by CREATE TABLE statements
-    create_table_regex = re.compile(r'CREATE TABLE (\w+)\s*\(([\s\S]*?)\);', re.IGNORECASE)
-    matches = create_table_regex.findall(schema_sql)
-    
-    for table_name, columns_text in matches:
-        columns = []
-        
-        # Parse columns
-        column_lines = [line.strip() for line in columns_text.split(',') if line.strip()]
-        
-        for line in column_lines:
-            # Skip foreign key constraints
-            if line.upper().startswith('FOREIGN KEY') or line.upper().startswith('PRIMARY KEY'):
-                continue
-            
-            # Parse column definition
-            column_match = re.match(r'^(\w+)\s+([\w()]+)(.*)$', line)
-            if column_match:
-                column_name = column_match.group(1)
-                column_type = column_match.group(2)
-                constraints_text = column_match.group(3)
-                
-                # Extract constraints
-                constraints = []
-                if 'PRIMARY KEY' in constraints_text.upper():
-                    constraints.append('PRIMARY KEY')
-                if 'NOT NULL' in constraints_text.upper():
-                    constraints.append('NOT NULL')
-                if 'UNIQUE' in constraints_text.upper():
-                    constraints.append('UNIQUE')
-                
-                columns.append({
-                    "name": column_name,
-                    "type": column_type,
-                    "constraints": constraints
-                })
-        
-        tables.append({
-            "table_name": table_name,
-            "columns": columns
-        })
-    
-    return tables
-
 @app.post("/auth/signup")
 def signup(user: UserSignup):
     conn = sqlite3.connect(get_database_path())
@@ -946,14 +998,15 @@ def get_user_submissions_endpoint(email: str = Depends(verify_token), challenge_
     
     # Convert to more readable format
     submissions_data = []
-    for c_id, query, passed, submitted_at in submissions:
+    for c_id, query, passed, submitted_at, perf_score in submissions:
         challenge = next((c for c in CHALLENGES if c["id"] == c_id), None)
         submissions_data.append({
             "challenge_id": c_id,
             "challenge_name": challenge["name"] if challenge else f"Challenge {c_id}",
             "query": query,
             "passed": passed,
-            "submitted_at": submitted_at
+            "submitted_at": submitted_at,
+            "perf_score": perf_score
         })
     
     return {"submissions": submissions_data}
@@ -1185,7 +1238,7 @@ def get_challenge(challenge_id: int, email: str = Depends(verify_token)):
             challenge_data["options"] = challenge["options"]
     else:
         # SQL challenge - parse the schema SQL into structured data
-        schema_tables = parse_table_schema(challenge["schema_sql"])
+        schema_tables = challenge_artifacts.schema(challenge)
         challenge_data = {
             "id": challenge["id"], 
             "name": challenge["name"], 
@@ -1213,92 +1266,175 @@ def get_next_challenge_endpoint(email: str = Depends(verify_token)):
     
     return {"next_challenge": next_challenge}
 
-@app.post("/challenges/{challenge_id}/submit")
-def submit_query(challenge_id: int, req: ChallengeSubmitRequest, email: str = Depends(verify_token)):
+def find_submit_challenge(challenge_id: int) -> dict | None:
     # Check if it's an atomic structure challenge first
     if challenge_id >= 101 and challenge_id <= 200:
         from atomic_structure_challenges import ATOMIC_STRUCTURE_CHALLENGES
-        challenge = next((c for c in ATOMIC_STRUCTURE_CHALLENGES if c["id"] == challenge_id), None)
+        return next((c for c in ATOMIC_STRUCTURE_CHALLENGES if c["id"] == challenge_id), None)
+    return next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+
+def resolve_submission_engine(challenge_id: int, database_type: str):
+    """Engine for a submission; None means every engine at once"""
+    if challenge_id >= 101 and challenge_id <= 200:
+        # Atomic structure challenges (IDs 101-200)
+        return get_engine("atomic_structure")
+    if database_type.lower() == "all":
+        return None
+    # SQL challenges on the registered engine for database_type, SQLite by default
+    return get_engine(database_type) or get_engine("sqlite")
+
+async def execute_submission(challenge_id: int, user_id: int, req: ChallengeSubmitRequest) -> dict:
+    """Run a submission on the engine pool without blocking the event loop"""
+    engine = resolve_submission_engine(challenge_id, req.database_type)
+    if engine is None:
+        # SQL challenges on every engine at once, with a divergence report
+        return await multi_engine_runner.execute_challenge_async(challenge_id, str(user_id), req.user_query)
+    return await engine_scheduler.execute_async(engine, challenge_id, str(user_id), req.user_query)
+
+def run_submission_job(job, challenge_id: int, challenge: dict, user_id: int, req: ChallengeSubmitRequest) -> dict:
+    """Worker side of an async submission; engines report their stages on the job"""
+    engine = resolve_submission_engine(challenge_id, req.database_type)
+    if engine is None:
+        job.set_stage("executing")
+        result = multi_engine_runner.execute_challenge(challenge_id, str(user_id), req.user_query)
     else:
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        result = engine_scheduler.execute(engine, challenge_id, str(user_id), req.user_query,
+                                          on_stage=job.set_stage)
+    return finish_submission(challenge_id, challenge, user_id, req.user_query, result)
+
+def enqueue_submission(challenge_id: int, challenge: dict, user_id: int, req: ChallengeSubmitRequest) -> JSONResponse:
+    job = submission_job_queue.submit(
+        user_id, challenge_id, lambda job: run_submission_job(job, challenge_id, challenge, user_id, req))
+    if job is None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queued submissions, please retry shortly",
+            headers={"Retry-After": str(submission_admission.retry_after_s)}
+        )
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    })
+
+def finish_submission(challenge_id: int, challenge: dict, user_id: int, user_query: str, result: dict) -> dict:
+    """Record a finished submission and build the submit response"""
+    # Record submission and progress in a single transaction
+    performance = result.get("performance")
+    record_submission_and_progress(user_id, challenge_id, user_query, result.get("passed", False),
+                                   performance["score"] if performance else None)
+    
+    if "seed_bucket" in result:
+        # Compare against the data this user was graded on
+        challenge = randomized_dataset_cache.variant(challenge, result["seed_bucket"])
+    
+    if result["success"]:
+        if result.get("passed", False):
+            # Get next challenge info when current challenge is passed
+            next_challenge = get_next_challenge(user_id)
+            
+            # Different response format for chemistry vs SQL challenges
+            if challenge_id >= 101 and challenge_id <= 200:
+                # Chemistry challenge response
+                return {
+                    "passed": True,
+                    "result": result.get("results", []),
+                    "column_names": result.get("columns", []),
+                    "correct_answer": result.get("correct_answer", ""),
+                    "explanation": result.get("explanation", ""),
+                    "question_type": result.get("question_type", ""),
+                    "score": result.get("score", ""),
+                    "keywords_found": result.get("keywords_found", []),
+                    "next_challenge": next_challenge
+                }
+            else:
+                # SQL challenge response
+                response = {
+                    "passed": True, 
+                    "result": result.get("results", []), 
+                    "column_names": result.get("columns", []),
+                    "expected": challenge.get("expected_output", []), 
+                    "expected_column_names": challenge.get("expected_column_names", []),
+                    "performance": performance,
+                    "next_challenge": next_challenge
+                }
+        else:
+            # Different response format for chemistry vs SQL challenges
+            if challenge_id >= 101 and challenge_id <= 200:
+                # Chemistry challenge response
+                return {
+                    "passed": False,
+                    "result": result.get("results", []),
+                    "column_names": result.get("columns", []),
+                    "correct_answer": result.get("correct_answer", ""),
+                    "explanation": result.get("explanation", ""),
+                    "question_type": result.get("question_type", ""),
+                    "score": result.get("score", ""),
+                    "keywords_found": result.get("keywords_found", [])
+                }
+            else:
+                # SQL challenge response: previews of both sides and what differs
+                response = {
+                    "passed": False, 
+                    "result": result.get("results", [])[:DIFF_PREVIEW_ROWS], 
+                    "expected": challenge.get("expected_output", [])[:DIFF_PREVIEW_ROWS], 
+                    "column_names": result.get("columns", []),
+                    "expected_column_names": challenge.get("expected_column_names", [])
+                }
+                if not is_mutation_challenge(challenge):
+                    response["diff"] = diff_result(challenge, result)
         
+        # Mutation challenges report which tables ended up as expected
+        if "tables" in result:
+            response["tables"] = result["tables"]
+        
+        # Only how many hidden datasets passed, never their rows
+        if "hidden_datasets" in result:
+            response["hidden_datasets"] = result["hidden_datasets"]
+        
+        # Multi-engine submissions also report every engine and how they diverged
+        if "engines" in result:
+            response["engines"] = result["engines"]
+            response["divergence"] = result["divergence"]
+        return response
+    else:
+        raise HTTPException(status_code=400, detail=result.get("error", "Query execution failed"))
+
+@app.post("/challenges/{challenge_id}/submit")
+async def submit_query(challenge_id: int, req: ChallengeSubmitRequest, email: str = Depends(verify_token),
+                       run_async: bool = Query(False, alias="async")):
+    challenge = find_submit_challenge(challenge_id)
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
+    if run_async:
+        # Queue the submission and return a job id; results come from /jobs/{id}
+        loop = asyncio.get_running_loop()
+        user_id = await loop.run_in_executor(submission_db_executor, get_user_id, email)
+        if not user_id:
+            raise HTTPException(status_code=404, detail="User not found")
+        return enqueue_submission(challenge_id, challenge, user_id, req)
+
+    # Answer at once when saturated instead of queueing behind other submissions
+    if not submission_admission.try_acquire():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many submissions in progress, please retry shortly",
+            headers={"Retry-After": str(submission_admission.retry_after_s)}
+        )
+
     try:
+        loop = asyncio.get_running_loop()
+        
         # Get user ID for isolated execution
-        user_id = get_user_id(email)
+        user_id = await loop.run_in_executor(submission_db_executor, get_user_id, email)
         if not user_id:
             raise HTTPException(status_code=404, detail="User not found")
         
-        # Execute query in isolated container environment based on challenge type
-        if challenge_id >= 101 and challenge_id <= 200:
-            # Atomic structure challenges (IDs 101-200)
-            result = atomic_structure_challenge_manager.execute_challenge(challenge_id, str(user_id), req.user_query)
-        elif req.database_type.lower() == "duckdb":
-            # SQL challenges with DuckDB
-            result = duckdb_challenge_manager.execute_challenge(challenge_id, str(user_id), req.user_query)
-        else:
-            # SQL challenges with SQLite (default)
-            result = challenge_manager.execute_challenge(challenge_id, str(user_id), req.user_query)
-        
-        # Record submission and progress in a single transaction
-        record_submission_and_progress(user_id, challenge_id, req.user_query, result.get("passed", False))
-        
-        if result["success"]:
-            if result.get("passed", False):
-                # Get next challenge info when current challenge is passed
-                next_challenge = get_next_challenge(user_id)
-                
-                # Different response format for chemistry vs SQL challenges
-                if challenge_id >= 101 and challenge_id <= 200:
-                    # Chemistry challenge response
-                    return {
-                        "passed": True,
-                        "result": result.get("results", []),
-                        "column_names": result.get("columns", []),
-                        "correct_answer": result.get("correct_answer", ""),
-                        "explanation": result.get("explanation", ""),
-                        "question_type": result.get("question_type", ""),
-                        "score": result.get("score", ""),
-                        "keywords_found": result.get("keywords_found", []),
-                        "next_challenge": next_challenge
-                    }
-                else:
-                    # SQL challenge response
-                    return {
-                        "passed": True, 
-                        "result": result.get("results", []), 
-                        "column_names": result.get("columns", []),
-                        "expected": challenge["expected_output"], 
-                        "expected_column_names": challenge.get("expected_column_names", []),
-                        "next_challenge": next_challenge
-                    }
-            else:
-                # Different response format for chemistry vs SQL challenges
-                if challenge_id >= 101 and challenge_id <= 200:
-                    # Chemistry challenge response
-                    return {
-                        "passed": False,
-                        "result": result.get("results", []),
-                        "column_names": result.get("columns", []),
-                        "correct_answer": result.get("correct_answer", ""),
-                        "explanation": result.get("explanation", ""),
-                        "question_type": result.get("question_type", ""),
-                        "score": result.get("score", ""),
-                        "keywords_found": result.get("keywords_found", [])
-                    }
-                else:
-                    # SQL challenge response
-                    return {
-                        "passed": False, 
-                        "result": result.get("results", []), 
-                        "expected": challenge["expected_output"], 
-                        "column_names": result.get("columns", []),
-                        "expected_column_names": challenge.get("expected_column_names", [])
-                    }
-        else:
-            raise HTTPException(status_code=400, detail=result.get("error", "Query execution failed"))
+        result = await execute_submission(challenge_id, user_id, req)
+        return await loop.run_in_executor(submission_db_executor, finish_submission,
+                                          challenge_id, challenge, user_id, req.user_query, result)
 
     except HTTPException:
         # Re-raise HTTPExceptions as-is (don't wrap them)
@@ -1306,8 +1442,127 @@ def submit_query(challenge_id: int, req: ChallengeSubmitRequest, email: str = De
     except Exception as e:
         # Handle other unexpected exceptions
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        submission_admission.release()
+
+def get_owned_job(job_id: str, email: str):
+    job = submission_job_queue.get(job_id)
+    # Other users' jobs are reported as missing rather than forbidden
+    if not job or job.owner_id != get_user_id(email):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, email: str = Depends(verify_token)):
+    """Status, stages and (once finished) the result of an async submission"""
+    return get_owned_job(job_id, email).to_dict()
+
+@app.get("/jobs/{job_id}/events")
+def stream_job_events(job_id: str, email: str = Depends(verify_token)):
+    """Server-sent events: one `stage` event per stage, then a `result` event"""
+    job = get_owned_job(job_id, email)
+
+    async def events():
+        sent_stages = 0
+        while True:
+            snapshot = job.to_dict()
+            for stage in snapshot["stages"][sent_stages:]:
+                yield f"event: stage\ndata: {json.dumps(stage)}\n\n"
+            sent_stages = len(snapshot["stages"])
+            if snapshot["status"] in ("completed", "failed"):
+                yield f"event: result\ndata: {json.dumps(snapshot)}\n\n"
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_S)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.post("/challenges/{challenge_id}/explain")
+def explain_query(challenge_id: int, req: ChallengeExplainRequest, email: str = Depends(verify_token)):
+    """Return the query plan without executing the query or recording a submission"""
+    challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+    if not challenge:
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    
+    result = query_plan_cache.explain(challenge_id, req.user_query, req.database_type)
+    if result.get("unavailable"):
+        # The challenge's large dataset is still being built
+        raise HTTPException(status_code=503, detail=result["error"],
+                            headers={"Retry-After": str(DATASET_RETRY_AFTER_S)})
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return {
+        "challenge_id": challenge_id,
+        "database_type": req.database_type.lower(),
+        "plan": result["plan"],
+        "cached": result["cached"]
+    }
 
 # Admin endpoints
+@app.get("/admin/engines")
+def get_engine_metrics(admin_email: str = Depends(verify_admin_token)):
+    """Registered execution engines with their capabilities and scheduler metrics"""
+    return {**engine_scheduler.metrics(), "admission": submission_admission.snapshot(),
+            "jobs": submission_job_queue.snapshot(),
+            "randomized_datasets": randomized_dataset_cache.snapshot(),
+            "artifacts": challenge_artifacts.snapshot()}
+
+@app.post("/admin/batch-grade")
+def batch_grade(req: BatchGradeRequest, admin_email: str = Depends(verify_admin_token)):
+    """Grade many submissions at once, streaming one NDJSON verdict per item and then a summary"""
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    
+    known_users = get_existing_user_ids({item.user_id for item in req.items})
+    runnable, rejected = [], []
+    for index, item in enumerate(req.items):
+        if item.user_id not in known_users:
+            error = "User not found"
+        elif not find_submit_challenge(item.challenge_id):
+            error = "Challenge not found"
+        else:
+            engine = resolve_submission_engine(item.challenge_id, item.engine)
+            if engine is not None:
+                runnable.append({"index": index, "user_id": item.user_id, "challenge_id": item.challenge_id,
+                                 "query": item.query, "engine": engine})
+                continue
+            error = "Batch grading runs each item on a single engine"
+        rejected.append({"index": index, "user_id": item.user_id, "challenge_id": item.challenge_id,
+                         "engine": item.engine, "success": False, "passed": False, "error": error})
+    
+    def verdicts():
+        start = time.perf_counter()
+        for verdict in rejected:
+            yield json.dumps(verdict) + "\n"
+        
+        graded = passed = 0
+        submissions = []
+        try:
+            for item, result in batch_grader.grade(runnable):
+                performance = result.get("performance")
+                submissions.append((item["user_id"], item["challenge_id"], item["query"],
+                                    bool(result.get("passed", False)), performance["score"] if performance else None))
+                graded += 1
+                passed += submissions[-1][3]
+                if len(submissions) >= BATCH_RECORD_CHUNK:
+                    record_submissions_batch(submissions)
+                    submissions = []
+                yield json.dumps(batch_verdict(item, result)) + "\n"
+        finally:
+            # Items graded before a client disconnect are still recorded
+            if submissions:
+                record_submissions_batch(submissions)
+        yield json.dumps({"summary": {
+            "items": len(req.items),
+            "graded": graded,
+            "passed": passed,
+            "rejected": len(rejected),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        }}) + "\n"
+    
+    return StreamingResponse(verdicts(), media_type="application/x-ndjson")
+
 @app.get("/admin/stats")
 def get_admin_stats(admin_email: str = Depends(verify_admin_token)):
     """Get overall platform statistics"""
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from concurrent.futures import wait
+from typing import Dict, Any, List, Optional
+
+from challenge_container import challenge_manager
+from duckdb_container import duckdb_challenge_manager
+from engine_scheduler import engine_scheduler
+
+# Engines used by database_type="all", in reporting order
+ENGINE_MANAGERS = {
+    "sqlite": challenge_manager,
+    "duckdb": duckdb_challenge_manager,
+}
+
+MULTI_ENGINE_DEADLINE_S = float(os.getenv("MULTI_ENGINE_DEADLINE_S", "10"))
+
+
+def compare_engine_results(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Describe how the engines' results differ from the first engine that succeeded"""
+    succeeded = [engine for engine, result in results.items() if result.get("success") and "results" in result]
+    failed = [engine for engine, result in results.items() if not result.get("success")]
+    differences: List[Dict[str, Any]] = []
+
+    if succeeded:
+        baseline_engine = succeeded[0]
+        baseline = results[baseline_engine]
+        for engine in succeeded[1:]:
+            other = results[engine]
+            difference = {
+                "engines": [baseline_engine, engine],
+                "same_columns": baseline["columns"] == other["columns"],
+                "same_row_count": baseline["row_count"] == other["row_count"],
+                "same_rows": baseline["results"] == other["results"],
+            }
+            if not difference["same_rows"]:
+                difference["first_difference"] = _first_difference(baseline_engine, baseline["results"],
+                                                                    engine, other["results"])
+            if not all(difference[k] for k in ("same_columns", "same_row_count", "same_rows")):
+                differences.append(difference)
+
+    return {
+        "diverged": bool(differences) or (bool(failed) and bool(succeeded)),
+        "differences": differences,
+        "succeeded": succeeded,
+        "failed": failed,
+    }
+
+
+def _first_difference(engine_a: str, rows_a: List[List[str]], engine_b: str, rows_b: List[List[str]]) -> Dict[str, Any]:
+    for index in range(max(len(rows_a), len(rows_b))):
+        row_a = rows_a[index] if index < len(rows_a) else None
+        row_b = rows_b[index] if index < len(rows_b) else None
+        if row_a != row_b:
+            return {"row": index, engine_a: row_a, engine_b: row_b}
+    return {}
+
+
+class MultiEngineRunner:
+    """Runs one submission on every engine at once and compares the results"""
+
+    def __init__(self, scheduler=engine_scheduler):
+        # sqlite3 and duckdb release the GIL while executing, so the scheduler's threads overlap real work
+        self.scheduler = scheduler
+
+    def _submit(self, challenge_id: int, user_id: str, user_query: str, deadline_s: float) -> Dict[str, Any]:
+        return {
+            engine: self.scheduler.submit(manager, challenge_id, user_id, user_query, deadline_s)
+            for engine, manager in ENGINE_MANAGERS.items()
+        }
+
+    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                          deadline_s: Optional[float] = None) -> Dict[str, Any]:
+        """Per-engine results plus a combined result in the usual execute_challenge shape"""
+        deadline_s = MULTI_ENGINE_DEADLINE_S if deadline_s is None else deadline_s
+        start = time.perf_counter()
+        futures = self._submit(challenge_id, user_id, user_query, deadline_s)
+        wait(futures.values(), timeout=deadline_s)
+        return self._collect(futures, deadline_s, start)
+
+    async def execute_challenge_async(self, challenge_id: int, user_id: str, user_query: str,
+                                      deadline_s: Optional[float] = None) -> Dict[str, Any]:
+        """execute_challenge for callers on an event loop"""
+        deadline_s = MULTI_ENGINE_DEADLINE_S if deadline_s is None else deadline_s
+        start = time.perf_counter()
+        futures = self._submit(challenge_id, user_id, user_query, deadline_s)
+        await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()], timeout=deadline_s)
+        return self._collect(futures, deadline_s, start)
+
+    def _collect(self, futures: Dict[str, Any], deadline_s: float, start: float) -> Dict[str, Any]:
+        engines = {}
+        for engine, future in futures.items():
+            if future.done():
+                engines[engine] = future.result()
+            else:
+                # The engine keeps running in the background; its result is discarded
+                engines[engine] = {
+                    "success": False,
+                    "timed_out": True,
+                    "error": f"Query did not finish within {deadline_s:g}s"
+                }
+
+        result = self._combine(engines)
+        result["engines"] = engines
+        result["divergence"] = compare_engine_results(engines)
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    def _combine(self, engines: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Passing on any engine counts, just like submitting to that engine alone"""
+        passing = [r for r in engines.values() if r.get("passed")]
+        succeeded = [r for r in engines.values() if r.get("success")]
+        if not succeeded:
+            return {
+                "success": False,
+                "error": "; ".join(f"{engine}: {r.get('error', 'failed')}" for engine, r in engines.items())
+            }
+
+        primary = (passing or succeeded)[0]
+        combined = {key: value for key, value in primary.items() if key != "elapsed_ms"}
+        combined["passed"] = bool(passing)
+        return combined
+
+# Global multi-engine runner instance
+multi_engine_runner = MultiEngineRunner()
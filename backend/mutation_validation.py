@@ -0,0 +1,108 @@
+import hashlib
+import threading
+from typing import Callable, Dict, Any, Optional
+
+from engines import report_stage
+
+# Engines that cannot grade INSERT/UPDATE/DELETE/DDL challenges say so up front
+MUTATION_ENGINE_ERROR = "Challenges that modify tables are only available on SQLite and DuckDB"
+# Name of the SQLite aggregate registered on the grading connection
+SQLITE_FINGERPRINT_FUNCTION = "table_fingerprint"
+# Per-row hashes are summed modulo this, so row order does not matter
+FINGERPRINT_MODULUS = 2 ** 128
+
+
+def is_mutation_challenge(challenge: Optional[Dict[str, Any]]) -> bool:
+    """Whether a challenge is graded on the tables it leaves behind instead of a result set"""
+    return bool(challenge and challenge.get("mutation"))
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteTableFingerprint:
+    """SQLite aggregate: order-independent hash of the rows it is fed
+
+    Each row's cells are hashed with their types, and the row hashes are
+    summed, so duplicates count and the result does not depend on row order.
+    """
+
+    def __init__(self):
+        self.total = 0
+
+    def step(self, *cells):
+        digest = hashlib.blake2b(repr(cells).encode("utf-8"), digest_size=16).digest()
+        self.total = (self.total + int.from_bytes(digest, "big")) % FINGERPRINT_MODULUS
+
+    def finalize(self) -> str:
+        # Hex, since SQLite integers stop at 64 bits
+        return format(self.total, "032x")
+
+
+def compare_fingerprints(actual: Dict[str, Dict[str, Any]],
+                         expected: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-table verdict; tables missing on either side never match"""
+    tables = {}
+    for name in sorted(set(actual) | set(expected)):
+        got = actual.get(name)
+        want = expected.get(name)
+        tables[name] = {
+            "matches": got is not None and got == want,
+            "columns_match": got is not None and want is not None and got["columns"] == want["columns"],
+            "row_count": got["row_count"] if got else None,
+            "expected_row_count": want["row_count"] if want else None,
+        }
+    return tables
+
+
+_expected_fingerprints: Dict[tuple, Dict[str, Dict[str, Any]]] = {}
+_expected_lock = threading.Lock()
+
+
+def expected_fingerprints(engine: str, challenge: Dict[str, Any], version: str,
+                          compute: Callable[[], Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Fingerprints the reference solution leaves on an engine, computed once per challenge version"""
+    key = (engine, challenge["id"], version, challenge.get("reference_query"))
+    fingerprints = _expected_fingerprints.get(key)
+    if fingerprints is None:
+        fingerprints = compute()
+        with _expected_lock:
+            _expected_fingerprints[key] = fingerprints
+    return fingerprints
+
+
+def grade_mutation(container, challenge: Dict[str, Any], expected: Dict[str, Dict[str, Any]],
+                   user_id: str, user_query: str, timeout_s: Optional[float] = None) -> Dict[str, Any]:
+    """Run a mutating submission on a private copy and compare the tables it leaves behind
+
+    `container` is a SQLite or DuckDB container; fingerprints are computed in
+    SQL on that engine, so no table is read back into Python.
+    """
+    report_stage("setting_up")
+    environment = container.create_challenge_environment(challenge["id"], user_id, challenge=challenge)
+    try:
+        report_stage("executing")
+        result = container.execute_query(environment, user_query, timeout_s)
+        if result["success"]:
+            report_stage("validating")
+            actual = container.table_fingerprints(environment, challenge.get("mutation_tables"))
+            result["tables"] = compare_fingerprints(actual, expected)
+            # A query that returns rows instead of changing tables cannot pass
+            result["passed"] = "rows_affected" in result and all(
+                table["matches"] for table in result["tables"].values())
+        return result
+    finally:
+        container.cleanup_environment(environment)
+
+
+def reference_fingerprints(container, challenge: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Apply the reference solution to a fresh copy and fingerprint the result"""
+    environment = container.create_challenge_environment(challenge["id"], "reference", challenge=challenge)
+    try:
+        result = container.execute_query(environment, challenge["reference_query"])
+        if not result["success"]:
+            raise ValueError(f"Reference solution for challenge {challenge['id']} failed: {result['error']}")
+        return container.table_fingerprints(environment, challenge.get("mutation_tables"))
+    finally:
+        container.cleanup_environment(environment)
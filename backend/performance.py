@@ -0,0 +1,193 @@
+import os
+import re
+import statistics
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+# Warm-up runs are discarded; timed runs stop early once the budget is spent
+WARMUP_RUNS = int(os.getenv("PERF_WARMUP_RUNS", "1"))
+TIMED_RUNS = int(os.getenv("PERF_TIMED_RUNS", "3"))
+TIME_BUDGET_S = float(os.getenv("PERF_TIME_BUDGET_S", "5"))
+# SQLite VM instructions between deadline checks while profiling
+SQLITE_PROGRESS_INTERVAL = 10000
+
+# Runtimes within this margin of the reference count as equally fast
+TIMING_TOLERANCE = 0.15
+TIME_WEIGHT = 0.7
+PLAN_WEIGHT = 0.3
+
+_DUCKDB_SCAN = re.compile(r"\b(?:TABLE_SCAN|SEQ_SCAN)\b")
+_DUCKDB_TOTAL_TIME = re.compile(r"Total Time:\s*([\d.]+)s")
+
+
+def is_performance_graded(challenge: Dict[str, Any]) -> bool:
+    """Only challenges on the large datasets are big enough to time meaningfully"""
+    return bool(challenge.get("dataset"))
+
+
+def sqlite_plan(conn, query: str) -> Dict[str, Any]:
+    """EXPLAIN QUERY PLAN rows plus full-scan / index-use counts"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}").fetchall()
+    steps = [{"id": row[0], "parent": row[1], "detail": row[3]} for row in rows]
+    details = [step["detail"] for step in steps]
+    return {
+        "format": "sqlite_query_plan",
+        "steps": steps,
+        # "SCAN t USING COVERING INDEX" still reads every entry, so it counts as a scan
+        "full_scans": sum(1 for d in details if d.startswith("SCAN ") and d != "SCAN CONSTANT ROW"),
+        "index_searches": sum(1 for d in details if d.startswith("SEARCH ")),
+        "temp_btrees": sum(1 for d in details if "TEMP B-TREE" in d),
+    }
+
+
+def duckdb_plan(conn, query: str, analyze: bool = True) -> Dict[str, Any]:
+    """EXPLAIN ANALYZE (or plain EXPLAIN, which runs nothing) output plus the number of table scans"""
+    rows = conn.execute(f"EXPLAIN ANALYZE {query}" if analyze else f"EXPLAIN {query}").fetchall()
+    text = "\n".join(row[1] for row in rows)
+    total_time = _DUCKDB_TOTAL_TIME.search(text)
+    return {
+        "format": "duckdb_explain_analyze" if analyze else "duckdb_explain",
+        "text": text,
+        "full_scans": len(_DUCKDB_SCAN.findall(text)),
+        "index_searches": 0,
+        "profiled_ms": round(float(total_time.group(1)) * 1000, 3) if total_time else None,
+    }
+
+
+PLANNERS = {"sqlite": sqlite_plan, "duckdb": duckdb_plan}
+
+
+def time_query(run: Callable[[], Any], warmup_runs: int = WARMUP_RUNS, timed_runs: int = TIMED_RUNS,
+               time_budget_s: float = TIME_BUDGET_S, deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Median of repeated runs after warm-up; None if the deadline leaves no time for a timed run
+
+    Otherwise there is always at least one timed run. `deadline` is a
+    time.monotonic() value; runs are not started after it.
+    """
+    def expired() -> bool:
+        return deadline is not None and time.monotonic() >= deadline
+
+    for _ in range(warmup_runs):
+        if expired():
+            return None
+        run()
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max(1, timed_runs) and not expired():
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+        if time.perf_counter() - started > time_budget_s:
+            break
+    if not samples:
+        return None
+
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "runs": len(samples),
+        "warmup_runs": warmup_runs,
+    }
+
+
+def interrupt_at(conn, engine: str, deadline: Optional[float]) -> Callable[[], None]:
+    """Abort whatever runs on `conn` once the deadline passes; returns a function that disarms it"""
+    if deadline is None:
+        return lambda: None
+    if engine == "sqlite":
+        # Returning non-zero from the progress handler interrupts the running statement
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, SQLITE_PROGRESS_INTERVAL)
+        return lambda: conn.set_progress_handler(None, 0)
+    # DuckDB's interrupt() is safe to call from another thread
+    timer = threading.Timer(max(0.0, deadline - time.monotonic()), conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    return timer.cancel
+
+
+def performance_score(user: Dict[str, Any], reference: Dict[str, Any]) -> int:
+    """0-100 score: runtime relative to the reference plus plan quality"""
+    user_ms = max(user["timing"]["median_ms"], 0.001)
+    reference_ms = reference["timing"]["median_ms"] * (1 + TIMING_TOLERANCE)
+    time_score = min(1.0, reference_ms / user_ms)
+
+    user_scans = user["plan"]["full_scans"]
+    reference_scans = reference["plan"]["full_scans"]
+    plan_score = 1.0 if user_scans <= reference_scans else (reference_scans + 1) / (user_scans + 1)
+
+    return round(100 * (TIME_WEIGHT * time_score + PLAN_WEIGHT * plan_score))
+
+
+class PerformanceGrader:
+    """Times submissions and compares them with the reference solution
+
+    Reference profiles are computed when an engine warms a dataset challenge,
+    never inside a submission. Profiling a submission is capped by its
+    deadline; if the reference is not ready or time runs out, the submission
+    keeps its verdict and simply gets no performance report.
+    """
+
+    def __init__(self):
+        # Datasets are immutable, so reference profiles only need computing once
+        self._reference_profiles: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def profile(self, container, environment: Dict[str, Any], query: str, engine: str,
+                deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Timing and plan for one query in an existing environment; None if it could not finish"""
+        conn = container.connect(environment)
+        disarm = interrupt_at(conn, engine, deadline)
+        try:
+            timing = time_query(lambda: conn.execute(query).fetchall(), deadline=deadline)
+            if timing is None:
+                return None
+            plan = PLANNERS[engine](conn, query)
+        except Exception as e:
+            if deadline is None or time.monotonic() < deadline:
+                print(f"Error profiling query: {e}")
+            return None
+        finally:
+            disarm()
+            conn.close()
+        return {"timing": timing, "plan": plan}
+
+    def reference_profile(self, challenge: Dict[str, Any], engine: str) -> Optional[Dict[str, Any]]:
+        """Precomputed profile of the reference solution, if the challenge has been warmed"""
+        with self._lock:
+            return self._reference_profiles.get((engine, challenge["id"]))
+
+    def precompute_reference(self, container, environment: Dict[str, Any], challenge: Dict[str, Any],
+                             engine: str) -> Optional[Dict[str, Any]]:
+        """Profile the reference solution once per challenge and engine"""
+        cached = self.reference_profile(challenge, engine)
+        if cached:
+            return cached
+        query = challenge.get(f"{engine}_reference_query", challenge["reference_query"])
+        profile = self.profile(container, environment, query, engine)
+        if profile is None:
+            return None
+        with self._lock:
+            return self._reference_profiles.setdefault((engine, challenge["id"]), profile)
+
+    def grade(self, container, environment: Dict[str, Any], challenge: Dict[str, Any],
+              user_query: str, engine: str, deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Performance report returned with a passing submission; None if there is no time or reference"""
+        reference = self.reference_profile(challenge, engine)
+        if reference is None:
+            return None
+        user = self.profile(container, environment, user_query, engine, deadline)
+        if user is None:
+            return None
+        return {
+            "score": performance_score(user, reference),
+            "timing": user["timing"],
+            "plan": user["plan"],
+            "reference_timing": reference["timing"],
+            "reference_plan": reference["plan"],
+        }
+
+# Global performance grader instance
+performance_grader = PerformanceGrader()
@@ -0,0 +1,294 @@
+import os
+import threading
+from decimal import Decimal
+from typing import Dict, Any, List, Optional
+
+import psycopg2
+from psycopg2 import errors, sql
+from psycopg2.extensions import make_dsn
+from psycopg2.pool import ThreadedConnectionPool
+
+from challenges import CHALLENGES
+from challenge_container import challenge_version
+from docker_postgres_container import challenge_template_name
+from mutation_validation import is_mutation_challenge, MUTATION_ENGINE_ERROR
+from query_validation import query_prevalidator
+from engines import ExecutionEngine, EngineCapabilities, find_challenge, validate_rows, register_engine, report_stage
+
+# Admin connection to the long-lived server; used only to build databases and roles
+POSTGRES_URL = os.getenv("POSTGRES_URL", "postgresql://postgres@localhost:5432/postgres")
+# Submissions connect as this unprivileged role, never as the admin
+POSTGRES_RUNNER_USER = os.getenv("POSTGRES_RUNNER_USER", "sql_challenge_runner")
+POSTGRES_RUNNER_PASSWORD = os.getenv("POSTGRES_RUNNER_PASSWORD", "sql_challenge_runner")
+POSTGRES_STATEMENT_TIMEOUT_MS = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT_MS", "5000"))
+# Pooled connections per challenge database
+POSTGRES_MAX_CONNECTIONS = int(os.getenv("POSTGRES_MAX_CONNECTIONS", "8"))
+
+POSTGRES_DATASET_ERROR = "Large-dataset challenges are not available on Postgres"
+
+
+def challenge_database_name(challenge: Dict[str, Any]) -> str:
+    """Working database cloned once from the challenge template"""
+    return f"chl_{challenge['id']}_{challenge_version(challenge)}"
+
+
+def normalize_postgres_rows(rows) -> List[List[str]]:
+    """Stringify Postgres rows (from any driver) to match the SQLite engine"""
+    # NUMERIC results (AVG, ROUND) come back as Decimal; SQLite reports the same values as floats
+    return [[str(float(cell)) if isinstance(cell, Decimal) else str(cell) for cell in row] for row in rows]
+
+
+class PostgresContainer:
+    """Runs submissions on one long-lived Postgres server
+
+    Each challenge gets a template database built once and a working database
+    cloned from it. A submission borrows a pooled connection to the working
+    database and runs inside a transaction that is always rolled back, so
+    isolation costs one BEGIN/ROLLBACK instead of a container or a database.
+    """
+
+    def __init__(self, admin_url: str = POSTGRES_URL, statement_timeout_ms: int = POSTGRES_STATEMENT_TIMEOUT_MS,
+                 max_connections: int = POSTGRES_MAX_CONNECTIONS, runner_user: str = POSTGRES_RUNNER_USER,
+                 runner_password: str = POSTGRES_RUNNER_PASSWORD):
+        self.admin_url = admin_url
+        self.statement_timeout_ms = statement_timeout_ms
+        self.max_connections = max_connections
+        self.runner_user = runner_user
+        self.runner_password = runner_password
+        self._pools: Dict[str, ThreadedConnectionPool] = {}
+        # ThreadedConnectionPool raises when exhausted; callers wait on these instead
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._runner_ready = False
+        self._lock = threading.Lock()
+
+    def _dsn(self, database: str, as_runner: bool = False) -> str:
+        if as_runner:
+            return make_dsn(self.admin_url, dbname=database, user=self.runner_user, password=self.runner_password)
+        return make_dsn(self.admin_url, dbname=database)
+
+    def _admin_execute(self, statement, params=None, database: str = "postgres") -> List[tuple]:
+        """Run a statement that cannot run inside a transaction (CREATE/DROP DATABASE, roles)"""
+        conn = psycopg2.connect(self._dsn(database))
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(statement, params)
+            return cursor.fetchall() if cursor.description is not None else []
+        finally:
+            conn.close()
+
+    def _ensure_runner_role(self):
+        if self._runner_ready:
+            return
+        exists = self._admin_execute("SELECT 1 FROM pg_roles WHERE rolname = %s", (self.runner_user,))
+        action = "ALTER" if exists else "CREATE"
+        self._admin_execute(
+            sql.SQL(action + " ROLE {} LOGIN NOSUPERUSER NOCREATEDB NOCREATEROLE PASSWORD %s").format(
+                sql.Identifier(self.runner_user)),
+            (self.runner_password,)
+        )
+        self._runner_ready = True
+
+    def _database_state(self, database: str) -> Optional[bool]:
+        """None if the database does not exist, otherwise whether it is marked as a template"""
+        rows = self._admin_execute("SELECT datistemplate FROM pg_database WHERE datname = %s", (database,))
+        return rows[0][0] if rows else None
+
+    def _ensure_template(self, challenge: Dict[str, Any]) -> str:
+        """Create the challenge template once; it survives backend restarts"""
+        template = challenge_template_name(challenge)
+        state = self._database_state(template)
+        if state:
+            return template
+        if state is False:
+            # Left over from an interrupted build
+            self._admin_execute(sql.SQL("DROP DATABASE {} WITH (FORCE)").format(sql.Identifier(template)))
+
+        self._admin_execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(template)))
+        conn = psycopg2.connect(self._dsn(template))
+        try:
+            cursor = conn.cursor()
+            if challenge.get("schema_sql"):
+                cursor.execute(challenge["schema_sql"])
+            if challenge.get("seed_sql"):
+                cursor.execute(challenge["seed_sql"])
+            runner = sql.Identifier(self.runner_user)
+            cursor.execute(sql.SQL("GRANT USAGE, CREATE ON SCHEMA public TO {}").format(runner))
+            cursor.execute(sql.SQL("GRANT SELECT, INSERT, UPDATE, DELETE, TRUNCATE ON ALL TABLES IN SCHEMA public TO {}").format(runner))
+            cursor.execute(sql.SQL("GRANT USAGE, SELECT, UPDATE ON ALL SEQUENCES IN SCHEMA public TO {}").format(runner))
+            conn.commit()
+        finally:
+            conn.close()
+        self._admin_execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false").format(
+            sql.Identifier(template)))
+        return template
+
+    def get_challenge_database(self, challenge: Dict[str, Any]) -> str:
+        """Build the template and working database for a challenge if they do not exist yet"""
+        database = challenge_database_name(challenge)
+        with self._lock:
+            if database in self._pools:
+                return database
+
+            self._ensure_runner_role()
+            template = self._ensure_template(challenge)
+            if self._database_state(database) is None:
+                self._admin_execute(sql.SQL("CREATE DATABASE {} TEMPLATE {}").format(
+                    sql.Identifier(database), sql.Identifier(template)))
+                print(f"Created Postgres database {database} from {template}")
+
+            self._pools[database] = ThreadedConnectionPool(0, self.max_connections,
+                                                           self._dsn(database, as_runner=True))
+            self._slots[database] = threading.BoundedSemaphore(self.max_connections)
+            return database
+
+    def create_challenge_environment(self, challenge_id: int, user_id: str) -> Dict[str, Any]:
+        """Borrow a pooled connection to the challenge database"""
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            raise ValueError(f"Challenge {challenge_id} not found")
+
+        database = self.get_challenge_database(challenge)
+        self._slots[database].acquire()
+        try:
+            conn = self._pools[database].getconn()
+        except Exception:
+            self._slots[database].release()
+            raise
+        return {
+            "database": database,
+            "connection": conn,
+            "challenge_id": challenge_id,
+            "user_id": user_id
+        }
+
+    def execute_query(self, environment: Dict[str, Any], user_query: str,
+                      timeout_s: Optional[float] = None) -> Dict[str, Any]:
+        """Execute user query inside a transaction that cleanup_environment rolls back"""
+        conn = environment["connection"]
+        cursor = conn.cursor()
+        timeout_ms = self.statement_timeout_ms
+        if timeout_s is not None:
+            timeout_ms = min(timeout_ms, max(1, int(timeout_s * 1000)))
+
+        try:
+            # psycopg2 opens the transaction (BEGIN) with the first statement
+            cursor.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+            cursor.execute(user_query)
+
+            # Any statement that produces rows has a description
+            if cursor.description is not None:
+                results = self.normalize_results(cursor.fetchall())
+                columns = [description[0] for description in cursor.description]
+
+                return {
+                    "success": True,
+                    "results": results,
+                    "columns": columns,
+                    "row_count": len(results)
+                }
+            else:
+                return {
+                    "success": True,
+                    "message": f"Query executed successfully. {cursor.rowcount} rows affected.",
+                    "rows_affected": cursor.rowcount
+                }
+
+        except errors.QueryCanceled:
+            return {
+                "success": False,
+                "timed_out": True,
+                "error": f"Query exceeded the {timeout_ms} ms statement timeout"
+            }
+        except psycopg2.Error as e:
+            return {
+                "success": False,
+                "error": str(e).strip()
+            }
+        finally:
+            cursor.close()
+
+    def normalize_results(self, rows: List[tuple]) -> List[List[str]]:
+        """Normalize result rows to strings the way the SQLite engine does"""
+        return normalize_postgres_rows(rows)
+
+    def cleanup_environment(self, environment: Dict[str, Any]):
+        """Roll back the submission and return the connection to the pool"""
+        conn = environment["connection"]
+        broken = False
+        try:
+            conn.rollback()
+        except psycopg2.Error as e:
+            print(f"Error rolling back Postgres submission: {e}")
+            broken = True
+        database = environment["database"]
+        self._pools[database].putconn(conn, close=broken or bool(conn.closed))
+        self._slots[database].release()
+
+    def close_all(self):
+        """Close every pooled connection"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+            self._slots.clear()
+        for pool in pools:
+            pool.closeall()
+
+class PostgresChallengeManager(ExecutionEngine):
+    """Manages challenge execution on the shared Postgres server"""
+
+    name = "postgres"
+    dialect = "postgres"
+    capabilities = EngineCapabilities(transactional_reset=True, cancellation=True)
+
+    def __init__(self, container: Optional[PostgresContainer] = None):
+        self.container = container or PostgresContainer()
+
+    def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                          timeout_s: Optional[float] = None) -> Dict[str, Any]:
+        """Execute a challenge with user query in a rolled-back transaction"""
+
+        # Reject empty queries, multiple statements and transaction control before borrowing a connection
+        check = query_prevalidator.validate(challenge_id, user_query, "postgres")
+        if not check["success"]:
+            return check
+
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if challenge and challenge.get("dataset"):
+            return {"success": False, "error": POSTGRES_DATASET_ERROR}
+        if is_mutation_challenge(challenge):
+            return {"success": False, "error": MUTATION_ENGINE_ERROR}
+
+        try:
+            report_stage("setting_up")
+            environment = self.container.create_challenge_environment(challenge_id, user_id)
+        except psycopg2.Error as e:
+            return {"success": False, "error": f"Database connection failed: {str(e).strip()}"}
+
+        try:
+            report_stage("executing")
+            result = self.container.execute_query(environment, user_query, timeout_s)
+
+            # Validate against expected output
+            if result["success"]:
+                report_stage("validating")
+                result["passed"] = self._validate_result(challenge_id, result)
+
+            return result
+
+        finally:
+            self.container.cleanup_environment(environment)
+
+    def warm(self, challenge_id: int):
+        """Build the template and working database for a challenge"""
+        challenge = find_challenge(challenge_id)
+        if challenge and not challenge.get("dataset"):
+            self.container.get_challenge_database(challenge)
+
+    def _validate_result(self, challenge_id: int, result: Dict[str, Any]) -> bool:
+        """Validate user result against expected output"""
+        return validate_rows(find_challenge(challenge_id), result)
+
+# Global Postgres challenge manager instance
+postgres_challenge_manager = PostgresChallengeManager()
+register_engine(postgres_challenge_manager)
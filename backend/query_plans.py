@@ -0,0 +1,130 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any
+
+import duckdb
+
+from challenges import CHALLENGES
+from challenge_container import challenge_manager, challenge_version
+from duckdb_container import duckdb_challenge_manager
+from large_datasets import ensure_dataset, is_dataset_built
+from performance import sqlite_plan, duckdb_plan
+from query_validation import query_prevalidator, normalize_query, READ_ONLY
+
+# Plans cached across all challenges and engines
+MAX_CACHED_PLANS = int(os.getenv("PLAN_CACHE_SIZE", "2048"))
+
+DATASET_NOT_READY_ERROR = "This challenge's dataset is still being built, try again shortly"
+# Suggested wait before asking again for a plan on a dataset that is being built
+DATASET_RETRY_AFTER_S = int(os.getenv("DATASET_RETRY_AFTER_S", "30"))
+
+# Users may type their own EXPLAIN; EXPLAIN ANALYZE would run the query, so it is stripped too
+_LEADING_EXPLAIN = re.compile(r"^\s*EXPLAIN(?:\s+QUERY\s+PLAN|\s+ANALYZE)?\b", re.IGNORECASE)
+
+
+class QueryPlanCache:
+    """Query plans for the explain endpoint, computed on warm read-only connections
+
+    Nothing here executes a user query or creates a sandbox, so plan requests
+    never compete with submissions for execution resources. A large dataset
+    that is not built yet is built in the background; until then the result
+    is marked "unavailable" instead of making the request wait for the build.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_PLANS):
+        self.max_entries = max_entries
+        self._plans: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._connections: Dict[tuple, tuple] = {}
+        self._building = set()
+        self._lock = threading.Lock()
+        # Opening a connection may build a dataset; cache hits must not wait for that
+        self._connections_lock = threading.Lock()
+
+    def explain(self, challenge_id: int, user_query: str, database_type: str = "sqlite") -> Dict[str, Any]:
+        """Return {"success": True, "plan": ..., "cached": bool} or {"success": False, "error": ...}"""
+        engine = database_type.lower()
+        if engine not in ("sqlite", "duckdb"):
+            return {"success": False, "error": f"Unsupported database type: {database_type}"}
+
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            return {"success": False, "error": f"Challenge {challenge_id} not found"}
+
+        query = _LEADING_EXPLAIN.sub("", user_query, count=1)
+        key = (engine, challenge_id, challenge_version(challenge), normalize_query(query))
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return {"success": True, "plan": plan, "cached": True}
+
+        check = query_prevalidator.validate(challenge_id, query, engine)
+        if not check["success"]:
+            return check
+        if check["statement_type"] != READ_ONLY:
+            return {"success": False, "error": "Only read-only queries can be explained"}
+        if challenge.get("dataset") and not is_dataset_built(challenge["dataset"]):
+            self._build_in_background(challenge["dataset"])
+            return {"success": False, "unavailable": True, "error": DATASET_NOT_READY_ERROR}
+
+        conn, lock = self._connection(engine, challenge)
+        with lock:
+            try:
+                if engine == "sqlite":
+                    plan = sqlite_plan(conn, query)
+                else:
+                    plan = duckdb_plan(conn, query, analyze=False)
+            except (sqlite3.Error, sqlite3.Warning, duckdb.Error) as e:
+                return {"success": False, "error": str(e)}
+
+        with self._lock:
+            self._plans[key] = plan
+            if len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return {"success": True, "plan": plan, "cached": False}
+
+    def _connection(self, engine: str, challenge: Dict[str, Any]):
+        """Warm read-only connection to a challenge's data, opened once"""
+        key = (engine, challenge["id"], challenge_version(challenge))
+        with self._connections_lock:
+            if key not in self._connections:
+                self._connections[key] = (self._open(engine, challenge), threading.Lock())
+            return self._connections[key]
+
+    def _open(self, engine: str, challenge: Dict[str, Any]):
+        dataset = challenge.get("dataset")
+        if engine == "sqlite":
+            if dataset:
+                db_path = ensure_dataset(dataset)["sqlite"]
+            else:
+                db_path = challenge_manager.container.get_shared_database(challenge)
+            return challenge_manager.container.connect({"db_path": db_path, "shared": True}, check_same_thread=False)
+
+        if dataset:
+            environment = {"dataset": dataset, "parquet": ensure_dataset(dataset)["parquet"]}
+            return duckdb_challenge_manager.container.connect(environment)
+
+        # Submissions copy the template database; plans read it in place
+        return duckdb.connect(duckdb_challenge_manager.container.get_template_database(challenge), read_only=True)
+
+    def _build_in_background(self, dataset: str):
+        with self._lock:
+            if dataset in self._building:
+                return
+            self._building.add(dataset)
+        threading.Thread(target=self._build, args=(dataset,), name=f"build-{dataset}", daemon=True).start()
+
+    def _build(self, dataset: str):
+        try:
+            ensure_dataset(dataset)
+        except Exception as e:
+            print(f"Error building dataset '{dataset}': {e}")
+        finally:
+            with self._lock:
+                self._building.discard(dataset)
+
+# Global query plan cache instance
+query_plan_cache = QueryPlanCache()
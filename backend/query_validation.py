@@ -0,0 +1,233 @@
+import re
+import sqlite3
+import threading
+import duckdb
+from typing import Dict, Any, List, Optional
+from challenges import CHALLENGES
+
+READ_ONLY = "read_only"
+MUTATING = "mutating"
+
+# Authorizer actions a plain query is allowed to need
+READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+# DuckDB statement types that only read data
+DUCKDB_READ_ONLY_TYPES = {
+    duckdb.StatementType.SELECT,
+    duckdb.StatementType.EXPLAIN,
+}
+
+_LEADING_EXPLAIN = re.compile(r'^\s*EXPLAIN\b', re.IGNORECASE)
+
+# Statements that would end the per-submission transaction on Postgres
+POSTGRES_TRANSACTION_CONTROL = {"BEGIN", "START", "COMMIT", "END", "ROLLBACK", "ABORT", "SAVEPOINT", "RELEASE", "PREPARE"}
+POSTGRES_READ_ONLY_KEYWORDS = {"SELECT", "VALUES", "TABLE", "SHOW", "EXPLAIN"}
+
+_DOLLAR_QUOTE = re.compile(r'\$[A-Za-z_]*\$')
+_LEADING_KEYWORD = re.compile(r'[\s(]*([A-Za-z_]+)')
+
+
+def strip_sql_comments(query: str) -> str:
+    """Remove -- and /* */ comments outside of quoted strings and identifiers"""
+    result = []
+    i = 0
+    length = len(query)
+    closing_quote = {"'": "'", '"': '"', '`': '`', '[': ']'}
+
+    while i < length:
+        char = query[i]
+        if char in closing_quote:
+            end = query.find(closing_quote[char], i + 1)
+            end = length if end == -1 else end + 1
+            result.append(query[i:end])
+            i = end
+        elif query.startswith("--", i):
+            end = query.find("\n", i)
+            i = length if end == -1 else end
+        elif query.startswith("/*", i):
+            end = query.find("*/", i + 2)
+            i = length if end == -1 else end + 2
+            result.append(" ")
+        else:
+            result.append(char)
+            i += 1
+
+    return "".join(result)
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form for caching: no comments, single spaces outside quotes, no trailing semicolons"""
+    result = []
+    query = strip_sql_comments(query)
+    i = 0
+    length = len(query)
+    closing_quote = {"'": "'", '"': '"', '`': '`', '[': ']'}
+
+    while i < length:
+        char = query[i]
+        if char in closing_quote:
+            end = query.find(closing_quote[char], i + 1)
+            end = length if end == -1 else end + 1
+            result.append(query[i:end])
+            i = end
+        elif char.isspace():
+            while i < length and query[i].isspace():
+                i += 1
+            result.append(" ")
+        else:
+            result.append(char)
+            i += 1
+
+    return "".join(result).strip().rstrip(";").strip()
+
+
+def split_postgres_statements(query: str) -> List[str]:
+    """Split on semicolons outside quotes, identifiers and $tag$ bodies"""
+    statements = []
+    current = []
+    query = strip_sql_comments(query)
+    i = 0
+    length = len(query)
+
+    while i < length:
+        char = query[i]
+        dollar = _DOLLAR_QUOTE.match(query, i) if char == "$" else None
+        if char in ("'", '"') or dollar:
+            tag = dollar.group(0) if dollar else char
+            end = query.find(tag, i + len(tag))
+            end = length if end == -1 else end + len(tag)
+            current.append(query[i:end])
+            i = end
+        elif char == ";":
+            statements.append("".join(current))
+            current = []
+            i += 1
+        else:
+            current.append(char)
+            i += 1
+
+    statements.append("".join(current))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+class QueryPrevalidator:
+    """Rejects empty and malformed queries before a challenge sandbox is built"""
+
+    def __init__(self):
+        # Schema-only in-memory databases used to prepare (never run) SQLite queries
+        self._schema_connections: Dict[int, sqlite3.Connection] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def validate(self, challenge_id: int, user_query: str, database_type: str = "sqlite") -> Dict[str, Any]:
+        """Check a query without executing it
+
+        Returns {"success": True, "statement_type": READ_ONLY | MUTATING} or
+        {"success": False, "error": ...} in the same shape as execute_query.
+        """
+        error = self._check_not_empty(user_query)
+        if error:
+            return {"success": False, "error": error}
+
+        if database_type.lower() == "duckdb":
+            return self._validate_duckdb(user_query)
+        if database_type.lower() == "postgres":
+            return self._validate_postgres(user_query)
+        return self._validate_sqlite(challenge_id, user_query)
+
+    def _check_not_empty(self, user_query: str) -> Optional[str]:
+        if not user_query or not user_query.strip():
+            return "Query is empty"
+
+        without_comments = strip_sql_comments(user_query)
+        if not without_comments.strip():
+            return "Query contains only comments"
+        if not without_comments.strip(" \t\r\n;"):
+            return "Query contains no SQL statement"
+        return None
+
+    def _validate_sqlite(self, challenge_id: int, user_query: str) -> Dict[str, Any]:
+        # Appending a terminator makes complete_statement detect unterminated strings and comments
+        if not sqlite3.complete_statement(user_query + "\n;"):
+            return {
+                "success": False,
+                "error": "Query is incomplete: unterminated string, identifier or comment"
+            }
+
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            return {"success": False, "error": f"Challenge {challenge_id} not found"}
+
+        conn, lock = self._schema_connection(challenge)
+        actions = set()
+
+        def authorizer(action, *args):
+            actions.add(action)
+            return sqlite3.SQLITE_OK
+
+        # EXPLAIN compiles the statement against the schema without running it
+        statement = user_query if _LEADING_EXPLAIN.match(user_query) else f"EXPLAIN {user_query}"
+        with lock:
+            conn.set_authorizer(authorizer)
+            try:
+                conn.execute(statement)
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                return {"success": False, "error": str(e)}
+            finally:
+                conn.set_authorizer(None)
+
+        # Statements that never reach the authorizer (e.g. VACUUM) are treated as mutating
+        read_only = bool(actions) and actions <= READ_ONLY_ACTIONS
+        return {"success": True, "statement_type": READ_ONLY if read_only else MUTATING}
+
+    def _validate_duckdb(self, user_query: str) -> Dict[str, Any]:
+        try:
+            statements = duckdb.extract_statements(user_query)
+        except duckdb.Error as e:
+            return {"success": False, "error": str(e)}
+
+        if not statements:
+            return {"success": False, "error": "Query contains no SQL statement"}
+
+        read_only = all(s.type in DUCKDB_READ_ONLY_TYPES for s in statements)
+        return {"success": True, "statement_type": READ_ONLY if read_only else MUTATING}
+
+    def _validate_postgres(self, user_query: str) -> Dict[str, Any]:
+        # Each submission runs in one transaction that is always rolled back,
+        # so a second statement or a COMMIT must never reach the server
+        statements = split_postgres_statements(user_query)
+        if len(statements) != 1:
+            return {"success": False, "error": "Only one SQL statement can be run per submission"}
+
+        match = _LEADING_KEYWORD.match(statements[0])
+        keyword = match.group(1).upper() if match else ""
+        if keyword in POSTGRES_TRANSACTION_CONTROL:
+            return {"success": False, "error": f"Transaction control statements ({keyword}) are not allowed"}
+
+        read_only = keyword in POSTGRES_READ_ONLY_KEYWORDS
+        return {"success": True, "statement_type": READ_ONLY if read_only else MUTATING}
+
+    def classify_duckdb(self, user_query: str) -> str:
+        """Classify a DuckDB query as READ_ONLY or MUTATING"""
+        result = self._validate_duckdb(user_query)
+        return result.get("statement_type", MUTATING)
+
+    def _schema_connection(self, challenge: Dict[str, Any]):
+        """Shared prepare-only connection holding just the challenge schema"""
+        challenge_id = challenge["id"]
+        with self._lock:
+            if challenge_id not in self._schema_connections:
+                conn = sqlite3.connect(":memory:", check_same_thread=False)
+                if challenge.get("schema_sql"):
+                    conn.executescript(challenge["schema_sql"])
+                self._schema_connections[challenge_id] = conn
+                self._locks[challenge_id] = threading.Lock()
+            return self._schema_connections[challenge_id], self._locks[challenge_id]
+
+# Global prevalidator instance
+query_prevalidator = QueryPrevalidator()
@@ -1,55 +1,50 @@
 import os
-import psycopg2
-import tempfile
-import uuid
-from typing import Dict, Any, Optional
-from challenges import CHALLENGES
+import re
 import asyncio
+from typing import Dict, Any, List, Optional
+from challenges import CHALLENGES
+from challenge_container import challenge_manager, challenge_version
+from postgres_container import normalize_postgres_rows, POSTGRES_DATASET_ERROR, POSTGRES_STATEMENT_TIMEOUT_MS
+from mutation_validation import is_mutation_challenge, MUTATION_ENGINE_ERROR
+from query_validation import query_prevalidator
+from engines import ExecutionEngine, EngineCapabilities, find_challenge, validate_rows, register_engine, report_stage
 import aiohttp
+import asyncpg
 
-class RailwayPostgresContainer:
-    """Manages isolated PostgreSQL databases for SQL challenges using Railway"""
-    
-    def __init__(self):
-        self.railway_token = os.getenv("RAILWAY_TOKEN")
-        self.railway_project_id = os.getenv("RAILWAY_PROJECT_ID")
-        self.base_db_url = os.getenv("DATABASE_URL")
-        
-    async def create_challenge_database(self, challenge_id: int, user_id: str) -> Dict[str, Any]:
-        """Create an isolated PostgreSQL database for a challenge"""
-        
-        # Get challenge details
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
-        if not challenge:
-            raise ValueError(f"Challenge {challenge_id} not found")
-        
-        # Create unique database name
-        db_name = f"challenge_{challenge_id}_{user_id}_{uuid.uuid4().hex[:8]}"
-        
-        # Create database via Railway API
-        db_url = await self._create_railway_database(db_name)
-        
-        # Initialize database with challenge schema and data
-        await self._setup_challenge_database(db_url, challenge)
-        
-        return {
-            "db_name": db_name,
-            "db_url": db_url,
-            "challenge_id": challenge_id,
-            "user_id": user_id
+RAILWAY_API_URL = os.getenv("RAILWAY_API_URL", "https://backboard.railway.app/graphql/v2")
+# Databases provisioned once and reused by every submission
+RAILWAY_DB_POOL_SIZE = int(os.getenv("RAILWAY_DB_POOL_SIZE", "4"))
+RAILWAY_DB_PREFIX = os.getenv("RAILWAY_DB_PREFIX", "sql-challenge-pool")
+RAILWAY_ACQUIRE_TIMEOUT_S = float(os.getenv("RAILWAY_ACQUIRE_TIMEOUT_S", "30"))
+# Submissions switch to this unprivileged role; the provisioned owner only builds schemas
+RAILWAY_RUNNER_ROLE = os.getenv("RAILWAY_RUNNER_ROLE", "sql_challenge_runner")
+
+_ROWS_AFFECTED = re.compile(r"(\d+)$")
+
+
+class RailwayGraphQLClient:
+    """Minimal client for the Railway provisioning API"""
+
+    def __init__(self, token: str, project_id: str, api_url: str = RAILWAY_API_URL):
+        self.token = token
+        self.project_id = project_id
+        self.api_url = api_url
+
+    async def _request(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
         }
-    
-    async def _create_railway_database(self, db_name: str) -> str:
-        """Create a new PostgreSQL database via Railway API"""
-        
-        if not self.railway_token or not self.railway_project_id:
-            # Fallback to local PostgreSQL or SQLite for development
-            return self._create_local_database(db_name)
-        
-        # Railway API endpoint
-        url = f"https://backboard.railway.app/graphql/v2"
-        
-        # GraphQL mutation to create database
+        async with aiohttp.ClientSession() as session:
+            async with session.post(self.api_url, json={"query": query, "variables": variables},
+                                    headers=headers) as response:
+                data = await response.json()
+        if "errors" in data:
+            raise Exception(f"Railway API error: {data['errors']}")
+        return data["data"]
+
+    async def create_database(self, db_name: str) -> str:
+        """Create a new PostgreSQL database and return its connection string"""
         mutation = """
         mutation CreateDatabase($input: CreateDatabaseInput!) {
             createDatabase(input: $input) {
@@ -59,102 +54,196 @@ class RailwayPostgresContainer:
             }
         }
         """
-        
-        variables = {
-            "input": {
-                "name": db_name,
-                "projectId": self.railway_project_id,
-                "type": "POSTGRESQL"
+        data = await self._request(mutation, {
+            "input": {"name": db_name, "projectId": self.project_id, "type": "POSTGRESQL"}
+        })
+        return data["createDatabase"]["connectionString"]
+
+    async def delete_database(self, db_name: str):
+        mutation = """
+        mutation DeleteDatabase($input: DeleteDatabaseInput!) {
+            deleteDatabase(input: $input) {
+                id
             }
         }
-        
-        headers = {
-            "Authorization": f"Bearer {self.railway_token}",
-            "Content-Type": "application/json"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "query": mutation,
-                "variables": variables
-            }, headers=headers) as response:
-                data = await response.json()
-                
-                if "errors" in data:
-                    raise Exception(f"Failed to create database: {data['errors']}")
-                
-                return data["data"]["createDatabase"]["connectionString"]
-    
-    def _create_local_database(self, db_name: str) -> str:
-        """Create a local database for development"""
-        # For development, use SQLite with unique file
-        temp_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
-        temp_db_path = temp_db.name
-        temp_db.close()
-        
-        return f"sqlite:///{temp_db_path}"
-    
-    async def _setup_challenge_database(self, db_url: str, challenge: Dict[str, Any]):
-        """Initialize database with challenge schema and seed data"""
-        
-        if db_url.startswith("sqlite"):
-            # SQLite setup
-            import sqlite3
-            db_path = db_url.replace("sqlite:///", "")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            try:
-                # Execute schema
-                if challenge.get("schema"):
-                    cursor.executescript(challenge["schema"])
-                
-                # Insert seed data
-                if challenge.get("seed_data"):
-                    for statement in challenge["seed_data"]:
-                        cursor.execute(statement)
-                
-                conn.commit()
-            finally:
-                conn.close()
-        else:
-            # PostgreSQL setup
-            conn = psycopg2.connect(db_url)
-            cursor = conn.cursor()
-            
+        """
+        await self._request(mutation, {"input": {"name": db_name, "projectId": self.project_id}})
+
+
+class PooledDatabase:
+    """A provisioned Railway database and its connection pool"""
+
+    def __init__(self, name: str, url: str, pool):
+        self.name = name
+        self.url = url
+        self.pool = pool
+        # (challenge id, version) currently loaded; submissions roll back, so it stays clean
+        self.loaded: Optional[tuple] = None
+
+
+class RailwayDatabasePool:
+    """Reuses a fixed set of provisioned databases instead of one per submission
+
+    Databases are created through the provisioning API once, on first use. A
+    lease prefers a database that already holds the challenge; otherwise the
+    database's public schema is rebuilt for it. Everything here is async and
+    uses asyncpg, so waiting on Postgres never blocks the event loop.
+    """
+
+    def __init__(self, api: RailwayGraphQLClient, size: int = RAILWAY_DB_POOL_SIZE,
+                 prefix: str = RAILWAY_DB_PREFIX, runner_role: str = RAILWAY_RUNNER_ROLE):
+        self.api = api
+        self.size = size
+        self.prefix = prefix
+        self.runner_role = runner_role
+        self.databases: List[PooledDatabase] = []
+        self.idle: List[PooledDatabase] = []
+        self.resets = 0
+        self._condition = asyncio.Condition()
+        self._warm_lock = asyncio.Lock()
+
+    async def warm(self):
+        """Provision the databases concurrently; later calls are no-ops"""
+        async with self._warm_lock:
+            if self.databases:
+                return
+            names = [f"{self.prefix}-{index}" for index in range(self.size)]
+            urls = await asyncio.gather(*(self.api.create_database(name) for name in names))
+            for name, url in zip(names, urls):
+                pool = await asyncpg.create_pool(url, min_size=1, max_size=1)
+                await self._ensure_runner_role(pool)
+                self.databases.append(PooledDatabase(name, url, pool))
+            async with self._condition:
+                self.idle.extend(self.databases)
+                self._condition.notify_all()
+            print(f"Provisioned {len(names)} Railway challenge databases")
+
+    async def acquire(self, challenge: Dict[str, Any], timeout: float = RAILWAY_ACQUIRE_TIMEOUT_S) -> PooledDatabase:
+        """Lease a database holding the challenge's schema and seed data"""
+        await self.warm()
+        key = (challenge["id"], challenge_version(challenge))
+        async with self._condition:
+            await asyncio.wait_for(self._condition.wait_for(lambda: self.idle), timeout)
+            database = next((d for d in self.idle if d.loaded == key), self.idle[0])
+            self.idle.remove(database)
+
+        if database.loaded != key:
             try:
-                # Execute schema
-                if challenge.get("schema"):
-                    cursor.execute(challenge["schema"])
-                
-                # Insert seed data
-                if challenge.get("seed_data"):
-                    for statement in challenge["seed_data"]:
-                        cursor.execute(statement)
-                
-                conn.commit()
-            finally:
-                conn.close()
-    
-    async def execute_query(self, environment: Dict[str, Any], user_query: str) -> Dict[str, Any]:
-        """Execute user query in isolated PostgreSQL environment"""
-        
-        db_url = environment["db_url"]
-        
-        if db_url.startswith("sqlite"):
-            # SQLite execution
-            import sqlite3
-            db_path = db_url.replace("sqlite:///", "")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
+                await self._reset(database, challenge)
+            except Exception:
+                await self.release(database)
+                raise
+        return database
+
+    async def _ensure_runner_role(self, pool):
+        """Create the runner role once per provisioned database, and let the owner switch to it"""
+        role = self.runner_role.replace('"', '""')
+        literal = self.runner_role.replace("'", "''")
+        async with pool.acquire() as conn:
+            await conn.execute(f"""
+                DO $$ BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{literal}') THEN
+                        CREATE ROLE "{role}" NOLOGIN NOSUPERUSER NOCREATEDB NOCREATEROLE;
+                    END IF;
+                END $$
+            """)
+            await conn.execute(f'GRANT "{role}" TO CURRENT_USER')
+
+    async def _reset(self, database: PooledDatabase, challenge: Dict[str, Any]):
+        """Rebuild the public schema for another challenge"""
+        database.loaded = None
+        async with database.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("DROP SCHEMA IF EXISTS public CASCADE; CREATE SCHEMA public")
+                if challenge.get("schema_sql"):
+                    await conn.execute(challenge["schema_sql"])
+                if challenge.get("seed_sql"):
+                    await conn.execute(challenge["seed_sql"])
+                role = self.runner_role.replace('"', '""')
+                await conn.execute(f'GRANT USAGE, CREATE ON SCHEMA public TO "{role}"')
+                await conn.execute(f'GRANT SELECT, INSERT, UPDATE, DELETE, TRUNCATE ON ALL TABLES IN SCHEMA public TO "{role}"')
+                await conn.execute(f'GRANT USAGE, SELECT, UPDATE ON ALL SEQUENCES IN SCHEMA public TO "{role}"')
+        database.loaded = (challenge["id"], challenge_version(challenge))
+        self.resets += 1
+
+    async def release(self, database: PooledDatabase):
+        async with self._condition:
+            self.idle.append(database)
+            self._condition.notify()
+
+    async def close(self, delete: bool = False):
+        """Close connection pools, optionally deleting the provisioned databases"""
+        for database in self.databases:
+            await database.pool.close()
+            if delete:
+                await self.api.delete_database(database.name)
+        self.databases.clear()
+        self.idle.clear()
+
+
+class RailwayPostgresContainer:
+    """Manages isolated PostgreSQL databases for SQL challenges using Railway"""
+
+    def __init__(self, pool: Optional[RailwayDatabasePool] = None,
+                 statement_timeout_ms: int = POSTGRES_STATEMENT_TIMEOUT_MS):
+        self.railway_token = os.getenv("RAILWAY_TOKEN")
+        self.railway_project_id = os.getenv("RAILWAY_PROJECT_ID")
+        self.statement_timeout_ms = statement_timeout_ms
+        self._pool = pool
+
+    @property
+    def configured(self) -> bool:
+        return self._pool is not None or bool(self.railway_token and self.railway_project_id)
+
+    @property
+    def pool(self) -> RailwayDatabasePool:
+        if self._pool is None:
+            self._pool = RailwayDatabasePool(RailwayGraphQLClient(self.railway_token, self.railway_project_id))
+        return self._pool
+
+    async def create_challenge_database(self, challenge_id: int, user_id: str) -> Dict[str, Any]:
+        """Lease a pooled database loaded with the challenge"""
+
+        # Get challenge details
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if not challenge:
+            raise ValueError(f"Challenge {challenge_id} not found")
+
+        database = await self.pool.acquire(challenge)
+
+        return {
+            "db_name": database.name,
+            "db_url": database.url,
+            "challenge_id": challenge_id,
+            "user_id": user_id,
+            "database": database
+        }
+
+    async def execute_query(self, environment: Dict[str, Any], user_query: str,
+                            timeout_s: Optional[float] = None) -> Dict[str, Any]:
+        """Execute user query as the runner role, in a transaction that is always rolled back"""
+
+        database = environment["database"]
+        timeout_ms = self.statement_timeout_ms
+        if timeout_s is not None:
+            timeout_ms = min(timeout_ms, max(1, int(timeout_s * 1000)))
+
+        async with database.pool.acquire() as conn:
+            transaction = conn.transaction()
+            await transaction.start()
             try:
-                cursor.execute(user_query)
-                
-                if user_query.strip().upper().startswith("SELECT"):
-                    results = cursor.fetchall()
-                    columns = [description[0] for description in cursor.description] if cursor.description else []
-                    
+                await conn.execute(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+                # Reverted by the rollback, so the pooled connection stays the owner
+                role = self.pool.runner_role.replace('"', '""')
+                await conn.execute(f'SET LOCAL ROLE "{role}"')
+
+                # A prepared statement runs exactly one statement and reports its columns
+                statement = await conn.prepare(user_query)
+                rows = await statement.fetch()
+                columns = [attribute.name for attribute in statement.get_attributes()]
+
+                if columns:
+                    results = normalize_postgres_rows(rows)
                     return {
                         "success": True,
                         "results": results,
@@ -162,145 +251,93 @@ class RailwayPostgresContainer:
                         "row_count": len(results)
                     }
                 else:
-                    conn.commit()
+                    match = _ROWS_AFFECTED.search(statement.get_statusmsg() or "")
+                    rows_affected = int(match.group(1)) if match else 0
                     return {
                         "success": True,
-                        "message": f"Query executed successfully. {cursor.rowcount} rows affected.",
-                        "rows_affected": cursor.rowcount
+                        "message": f"Query executed successfully. {rows_affected} rows affected.",
+                        "rows_affected": rows_affected
                     }
-                    
-            except sqlite3.Error as e:
+
+            except asyncpg.QueryCanceledError:
                 return {
                     "success": False,
-                    "error": str(e)
+                    "timed_out": True,
+                    "error": f"Query exceeded the {timeout_ms} ms statement timeout"
                 }
-            finally:
-                conn.close()
-        else:
-            # PostgreSQL execution
-            conn = psycopg2.connect(db_url)
-            cursor = conn.cursor()
-            
-            try:
-                cursor.execute(user_query)
-                
-                if user_query.strip().upper().startswith("SELECT"):
-                    results = cursor.fetchall()
-                    columns = [description[0] for description in cursor.description] if cursor.description else []
-                    
-                    return {
-                        "success": True,
-                        "results": results,
-                        "columns": columns,
-                        "row_count": len(results)
-                    }
-                else:
-                    conn.commit()
-                    return {
-                        "success": True,
-                        "message": f"Query executed successfully. {cursor.rowcount} rows affected.",
-                        "rows_affected": cursor.rowcount
-                    }
-                    
-            except psycopg2.Error as e:
+            except asyncpg.PostgresError as e:
                 return {
                     "success": False,
                     "error": str(e)
                 }
             finally:
-                conn.close()
-    
+                try:
+                    await transaction.rollback()
+                except Exception as e:
+                    # Unknown state - rebuild the schema before the next lease
+                    print(f"Error rolling back Railway submission: {e}")
+                    database.loaded = None
+
     async def cleanup_database(self, environment: Dict[str, Any]):
-        """Clean up challenge database"""
+        """Return the database to the pool"""
         try:
-            db_url = environment["db_url"]
-            
-            if db_url.startswith("sqlite"):
-                # Remove SQLite file
-                db_path = db_url.replace("sqlite:///", "")
-                if os.path.exists(db_path):
-                    os.unlink(db_path)
-            else:
-                # Drop PostgreSQL database via Railway API
-                await self._drop_railway_database(environment["db_name"])
-                
+            await self.pool.release(environment["database"])
         except Exception as e:
             print(f"Error cleaning up database: {e}")
-    
-    async def _drop_railway_database(self, db_name: str):
-        """Drop a PostgreSQL database via Railway API"""
-        
-        if not self.railway_token:
-            return
-        
-        url = f"https://backboard.railway.app/graphql/v2"
-        
-        mutation = """
-        mutation DeleteDatabase($input: DeleteDatabaseInput!) {
-            deleteDatabase(input: $input) {
-                id
-            }
-        }
-        """
-        
-        variables = {
-            "input": {
-                "name": db_name,
-                "projectId": self.railway_project_id
-            }
-        }
-        
-        headers = {
-            "Authorization": f"Bearer {self.railway_token}",
-            "Content-Type": "application/json"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            await session.post(url, json={
-                "query": mutation,
-                "variables": variables
-            }, headers=headers)
 
-class RailwayChallengeManager:
+class RailwayChallengeManager(ExecutionEngine):
     """Manages challenge execution with Railway PostgreSQL"""
-    
-    def __init__(self):
-        self.container = RailwayPostgresContainer()
-    
-    async def execute_challenge(self, challenge_id: int, user_id: str, user_query: str) -> Dict[str, Any]:
+
+    name = "railway"
+    dialect = "postgres"
+    capabilities = EngineCapabilities(transactional_reset=True, cancellation=True, asynchronous=True)
+
+    def __init__(self, container: Optional[RailwayPostgresContainer] = None):
+        self.container = container or RailwayPostgresContainer()
+
+    async def execute_challenge(self, challenge_id: int, user_id: str, user_query: str,
+                                timeout_s: Optional[float] = None) -> Dict[str, Any]:
         """Execute a challenge with user query in isolated PostgreSQL"""
-        
-        # Create isolated database
+
+        if not self.container.configured:
+            # Development without Railway credentials: SQLite, off the event loop
+            return await asyncio.to_thread(challenge_manager.execute_challenge, challenge_id, user_id,
+                                           user_query, timeout_s)
+
+        check = query_prevalidator.validate(challenge_id, user_query, "postgres")
+        if not check["success"]:
+            return check
+
+        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
+        if challenge and challenge.get("dataset"):
+            return {"success": False, "error": POSTGRES_DATASET_ERROR}
+        if is_mutation_challenge(challenge):
+            return {"success": False, "error": MUTATION_ENGINE_ERROR}
+
+        # Lease a pooled database
+        report_stage("setting_up")
         environment = await self.container.create_challenge_database(challenge_id, user_id)
-        
+
         try:
             # Execute user query
-            result = await self.container.execute_query(environment, user_query)
-            
+            report_stage("executing")
+            result = await self.container.execute_query(environment, user_query, timeout_s)
+
             # Validate against expected output
             if result["success"]:
+                report_stage("validating")
                 result["passed"] = self._validate_result(challenge_id, result)
-            
+
             return result
-            
+
         finally:
-            # Clean up database
+            # Return the database to the pool
             await self.container.cleanup_database(environment)
-    
+
     def _validate_result(self, challenge_id: int, result: Dict[str, Any]) -> bool:
         """Validate user result against expected output"""
-        challenge = next((c for c in CHALLENGES if c["id"] == challenge_id), None)
-        if not challenge:
-            return False
-        
-        expected_output = challenge.get("expected_output", [])
-        
-        # Simple validation - check if results match expected
-        if "results" in result:
-            user_results = result["results"]
-            return user_results == expected_output
-        
-        return True
+        return validate_rows(find_challenge(challenge_id), result)
 
 # Global challenge manager instance
-railway_challenge_manager = RailwayChallengeManager() 
\ No newline at end of file
+railway_challenge_manager = RailwayChallengeManager()
+register_engine(railway_challenge_manager)
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional
+
+from hidden_datasets import reference_output
+from result_validation import forget_expected_result
+
+# Generated seed data and expected outputs kept in memory, across all challenges and buckets
+RANDOM_DATASET_CACHE_BYTES = int(os.getenv("RANDOM_DATASET_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Buckets for a challenge that does not say
+DEFAULT_SEED_BUCKETS = 8
+
+
+def is_randomized(challenge: Optional[Dict[str, Any]]) -> bool:
+    # Large datasets are generated separately and shared by everyone
+    return bool(challenge and challenge.get("randomized") and not challenge.get("dataset"))
+
+
+def seed_bucket(challenge: Optional[Dict[str, Any]], user_id: Any) -> Optional[int]:
+    """The user's stable bucket for a randomized challenge; None if the challenge is not randomized"""
+    if not is_randomized(challenge):
+        return None
+    buckets = challenge["randomized"].get("buckets", DEFAULT_SEED_BUCKETS)
+    digest = hashlib.blake2b(f"{challenge['id']}:{user_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % buckets
+
+
+def generate_seed_sql(challenge: Dict[str, Any], bucket: int) -> str:
+    """Seed SQL for one bucket: the challenge's seed rows with the randomized columns regenerated
+
+    "randomized": {"buckets": 8, "columns": {"table.column": spec}} where spec is
+    {"min": a, "max": b} (integers, or floats with "decimals": n) or
+    {"choices": [...]}. Values depend only on the challenge definition and the
+    bucket, so every process generates the same data.
+    """
+    rng = random.Random(f"{challenge['id']}:{bucket}:{challenge.get('seed_sql') or ''}")
+    conn = sqlite3.connect(":memory:")
+    try:
+        if challenge.get("schema_sql"):
+            conn.executescript(challenge["schema_sql"])
+        if challenge.get("seed_sql"):
+            conn.executescript(challenge["seed_sql"])
+        for target, spec in sorted(challenge["randomized"].get("columns", {}).items()):
+            table, column = target.split(".", 1)
+            rowids = [row[0] for row in conn.execute(f'SELECT rowid FROM "{table}" ORDER BY rowid')]
+            conn.executemany(f'UPDATE "{table}" SET "{column}" = ? WHERE rowid = ?',
+                             [(_random_value(rng, spec), rowid) for rowid in rowids])
+        return "\n".join(line for line in conn.iterdump() if line.startswith("INSERT INTO"))
+    finally:
+        conn.close()
+
+
+def _random_value(rng: random.Random, spec: Dict[str, Any]) -> Any:
+    if "choices" in spec:
+        return rng.choice(spec["choices"])
+    if "decimals" in spec:
+        return round(rng.uniform(spec["min"], spec["max"]), spec["decimals"])
+    return rng.randint(spec["min"], spec["max"])
+
+
+def _variant_bytes(variant: Dict[str, Any]) -> int:
+    """Rough in-memory size of a generated variant"""
+    return len(variant["seed_sql"]) + sum(len(cell) for row in variant["expected_output"] for cell in row)
+
+
+class RandomizedDatasetCache:
+    """Generated per-bucket challenge variants, LRU-evicted to stay within a memory budget
+
+    A variant is a copy of the challenge with its own id ("<id>-bucket-<n>"),
+    seed SQL and expected output, so engines build and cache its database like
+    any other challenge. Each bucket is generated at most once while cached,
+    even when many submissions ask for it at the same time. Eviction listeners
+    let engines drop the database they built for an evicted variant.
+    """
+
+    def __init__(self, budget_bytes: int = RANDOM_DATASET_CACHE_BYTES):
+        self.budget_bytes = budget_bytes
+        self.bytes = 0
+        self.generated = 0
+        self.hits = 0
+        self.evictions = 0
+        # (challenge id, bucket) -> (definition it was generated from, variant, size)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._building: Dict[tuple, threading.Lock] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self._lock = threading.Lock()
+
+    def add_eviction_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        self._listeners.append(listener)
+
+    def for_user(self, challenge: Optional[Dict[str, Any]], user_id: Any) -> Optional[Dict[str, Any]]:
+        """The challenge as this user sees it: their bucket's variant, or the challenge itself"""
+        bucket = seed_bucket(challenge, user_id)
+        return challenge if bucket is None else self.variant(challenge, bucket)
+
+    def variant(self, challenge: Dict[str, Any], bucket: int) -> Dict[str, Any]:
+        key = (challenge["id"], bucket)
+        source = (challenge.get("schema_sql"), challenge.get("seed_sql"), challenge.get("reference_query"),
+                  challenge["randomized"])
+        variant = self._cached(key, source)
+        if variant is not None:
+            return variant
+
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            # Whoever held the lock may have generated it already
+            variant = self._cached(key, source)
+            if variant is not None:
+                return variant
+            variant = self._generate(challenge, bucket)
+            evicted = self._store(key, source, variant)
+            with self._lock:
+                self._building.pop(key, None)
+
+        for old in evicted:
+            self._evicted(old)
+        return variant
+
+    def _cached(self, key: tuple, source: tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != source:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _generate(self, challenge: Dict[str, Any], bucket: int) -> Dict[str, Any]:
+        variant = {name: value for name, value in challenge.items()
+                   if name not in ("randomized", "expected_digest", "expected_row_count")}
+        variant["id"] = f"{challenge['id']}-bucket-{bucket}"
+        variant["seed_bucket"] = bucket
+        variant["seed_sql"] = generate_seed_sql(challenge, bucket)
+        variant["expected_output"] = reference_output(challenge, variant["seed_sql"])
+        return variant
+
+    def _store(self, key: tuple, source: tuple, variant: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Insert a variant; returns the variants evicted to make room"""
+        size = _variant_bytes(variant)
+        evicted = []
+        with self._lock:
+            replaced = self._entries.pop(key, None)
+            if replaced is not None:
+                self.bytes -= replaced[2]
+                evicted.append(replaced[1])
+            self._entries[key] = (source, variant, size)
+            self.bytes += size
+            self.generated += 1
+            # The newest variant always stays, even if it alone is over budget
+            while self.bytes > self.budget_bytes and len(self._entries) > 1:
+                _, (_, old, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+                evicted.append(old)
+        return evicted
+
+    def _evicted(self, variant: Dict[str, Any]):
+        forget_expected_result(variant["id"])
+        for listener in self._listeners:
+            try:
+                listener(variant)
+            except Exception as e:
+                print(f"Error dropping randomized dataset {variant['id']}: {e}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "budget_bytes": self.budget_bytes,
+                    "generated": self.generated, "hits": self.hits, "evictions": self.evictions}
+
+# Global randomized dataset cache instance
+randomized_dataset_cache = RandomizedDatasetCache()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Offline regrading of historical submissions.
+
+After a challenge's expected output or seed data is fixed, everything ever
+submitted to it has to be graded again. This streams user_submissions for the
+selected challenges in id order, executes each distinct normalized query once
+in a process pool, rewrites `passed` where the verdict changed and recomputes
+user_progress.solved_at (the first passing submission) for the affected
+students. Each batch is written in one transaction.
+
+Progress is checkpointed to a state file after every batch, so an interrupted
+run picks up where it stopped. Rewriting a batch twice gives the same result,
+so a crash between the commit and the checkpoint is harmless.
+
+A query the engine could not grade (connection failure, exception, timeout)
+is an error, not a wrong answer: its submissions keep their verdict and are
+counted under "errors". If the engine cannot be warmed, or more than
+--max-error-rate of a batch's queries error, the run stops before writing
+that batch and exits non-zero.
+
+Examples (from the backend directory):
+
+    python regrade.py --database users.db --challenge 24
+    python regrade.py --database users.db --challenge 24 --challenge 25 --workers 8 --engine duckdb
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+
+# Importing the scheduler registers every engine, in this process and in forked workers
+from engine_scheduler import ENGINE_TIMEOUT_S
+from atomic_structure_challenges import ATOMIC_STRUCTURE_CHALLENGES
+from challenge_container import challenge_version
+from engines import get_engine, engine_names, find_challenge
+from mutation_validation import MUTATION_ENGINE_ERROR
+from postgres_container import POSTGRES_DATASET_ERROR
+from query_validation import normalize_query
+from randomized_datasets import seed_bucket
+
+REGRADE_BATCH_SIZE = 5000
+REGRADE_USER = "regrade"
+# A batch in which more than this fraction of executed queries could not be graded stops the run
+REGRADE_MAX_ERROR_RATE = 0.05
+
+# Verdicts; ERROR means the engine could not grade the query, which says nothing about the query
+PASS = "pass"
+FAIL = "fail"
+ERROR = "error"
+# Failed results that are the engine's fault rather than the query's
+ENGINE_ERRORS = ("Database connection failed", "Challenge execution failed", MUTATION_ENGINE_ERROR,
+                 POSTGRES_DATASET_ERROR)
+
+# Event loop for asynchronous engines, created once per process: their pools are bound to it
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class RegradeAborted(Exception):
+    """The engine could not grade the submissions; nothing from the current batch was written"""
+
+
+def _find_any_challenge(challenge_id: int) -> Optional[Dict[str, Any]]:
+    return find_challenge(challenge_id) or next(
+        (c for c in ATOMIC_STRUCTURE_CHALLENGES if c["id"] == challenge_id), None)
+
+
+def _engine_for(challenge_id: int, engine: str) -> str:
+    # Atomic structure challenges (IDs 101-200) only run on their own engine
+    return "atomic_structure" if 101 <= challenge_id <= 200 else engine
+
+
+def _worker_loop() -> asyncio.AbstractEventLoop:
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop
+
+
+def _warm_worker(engine: str, challenge_ids: List[int]):
+    """Process pool initializer: build each challenge's shared state once per worker
+
+    A challenge that cannot be warmed fails the worker, which breaks the pool
+    and aborts the run before anything is graded.
+    """
+    for challenge_id in challenge_ids:
+        manager = get_engine(_engine_for(challenge_id, engine))
+        if manager.capabilities.asynchronous:
+            _worker_loop()
+        try:
+            manager.warm(challenge_id)
+        except Exception as e:
+            print(f"Error warming challenge {challenge_id}: {e}", file=sys.stderr)
+            raise
+
+
+def verdict(result: Dict[str, Any]) -> str:
+    """PASS or FAIL for a graded result; ERROR if the engine failed or the query timed out"""
+    if result.get("success"):
+        return PASS if result.get("passed") else FAIL
+    if result.get("timed_out") or str(result.get("error", "")).startswith(ENGINE_ERRORS):
+        return ERROR
+    # A SQL error or a rejected query is the query's fault
+    return FAIL
+
+
+def grade_query(engine: str, challenge_id: int, query: str, user_id: str = REGRADE_USER,
+                timeout_s: float = ENGINE_TIMEOUT_S) -> str:
+    """Run one submission and return PASS, FAIL or ERROR
+
+    user_id only matters for randomized challenges, where it picks the data.
+    """
+    manager = get_engine(_engine_for(challenge_id, engine))
+    timeout = timeout_s if manager.capabilities.cancellation else None
+    try:
+        if manager.capabilities.asynchronous:
+            result = _worker_loop().run_until_complete(
+                manager.execute_challenge(challenge_id, user_id, query, timeout))
+        else:
+            result = manager.execute_challenge(challenge_id, user_id, query, timeout)
+    except Exception as e:
+        print(f"Error grading challenge {challenge_id}: {e}", file=sys.stderr)
+        return ERROR
+    return verdict(result)
+
+
+def _grade_entry(entry: Tuple[str, int, str, str]) -> str:
+    return grade_query(*entry)
+
+
+def _verdict_key(challenge_id: int, user_id: int, query: str) -> tuple:
+    # Randomized challenges grade each bucket of users on different data
+    return challenge_id, normalize_query(query), seed_bucket(_find_any_challenge(challenge_id), str(user_id))
+
+
+class Regrader:
+    """Regrades the submissions of some challenges in resumable batches"""
+
+    def __init__(self, db_path: str, challenge_ids: List[int], engine: str = "sqlite", workers: int = None,
+                 batch_size: int = REGRADE_BATCH_SIZE, state_path: Optional[str] = None,
+                 max_error_rate: float = REGRADE_MAX_ERROR_RATE):
+        self.db_path = db_path
+        self.challenge_ids = sorted(set(challenge_ids))
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.state_path = state_path or f"{db_path}.regrade-{'-'.join(map(str, self.challenge_ids))}.json"
+        self.max_error_rate = max_error_rate
+        # Verdict per (challenge, normalized query, seed bucket); identical submissions are executed once
+        self.verdicts: Dict[tuple, str] = {}
+
+    def _versions(self) -> Dict[str, str]:
+        return {str(challenge_id): challenge_version(_find_any_challenge(challenge_id))
+                for challenge_id in self.challenge_ids}
+
+    def _load_state(self) -> Dict[str, Any]:
+        fresh = {"challenges": self.challenge_ids, "engine": self.engine, "versions": self._versions(),
+                 "last_id": 0, "submissions": 0, "changed": 0, "executed": 0, "progress_updated": 0, "errors": 0}
+        if not os.path.exists(self.state_path):
+            return fresh
+        with open(self.state_path) as f:
+            state = json.load(f)
+        # A checkpoint from another challenge version or engine does not apply
+        if any(state.get(key) != fresh[key] for key in ("challenges", "engine", "versions")):
+            return fresh
+        state.setdefault("errors", 0)
+        return state
+
+    def _save_state(self, state: Dict[str, Any]):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def run(self, max_batches: Optional[int] = None, restart: bool = False) -> Dict[str, Any]:
+        """Regrade from the last checkpoint; returns counts and throughput"""
+        for challenge_id in self.challenge_ids:
+            if not _find_any_challenge(challenge_id):
+                raise ValueError(f"Challenge {challenge_id} not found")
+        if restart and os.path.exists(self.state_path):
+            os.unlink(self.state_path)
+
+        state = self._load_state()
+        resumed_from = state["last_id"]
+        start = time.perf_counter()
+        run_submissions = 0
+        batches = 0
+        complete = False
+        aborted = None
+
+        conn = sqlite3.connect(self.db_path)
+        placeholders = ",".join("?" * len(self.challenge_ids))
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_worker,
+                                     initargs=(self.engine, self.challenge_ids)) as pool:
+                while max_batches is None or batches < max_batches:
+                    # Keyset pagination: constant cost per batch and a natural checkpoint
+                    rows = conn.execute(f"""
+                        SELECT id, user_id, challenge_id, query, passed FROM user_submissions
+                        WHERE challenge_id IN ({placeholders}) AND id > ?
+                        ORDER BY id LIMIT ?
+                    """, (*self.challenge_ids, state["last_id"], self.batch_size)).fetchall()
+                    if not rows:
+                        complete = True
+                        break
+
+                    try:
+                        executed, errored = self._grade_new_queries(pool, rows)
+                    except BrokenProcessPool:
+                        aborted = f"engine {self.engine} could not be warmed"
+                        break
+                    if errored and len(errored) > executed * self.max_error_rate:
+                        # Nothing from this batch is written; fix the engine and run again to resume here
+                        aborted = f"{len(errored)} of {executed} queries could not be graded on {self.engine}"
+                        break
+                    changed, progress_updated, skipped = self._apply(conn, rows, errored)
+
+                    state["executed"] += executed
+                    state["last_id"] = rows[-1][0]
+                    state["submissions"] += len(rows)
+                    state["changed"] += changed
+                    state["progress_updated"] += progress_updated
+                    state["errors"] += skipped
+                    self._save_state(state)
+
+                    run_submissions += len(rows)
+                    batches += 1
+                    elapsed = time.perf_counter() - start
+                    print(f"regraded {state['submissions']} submissions (last id {state['last_id']}), "
+                          f"{state['changed']} changed, {run_submissions / elapsed:.0f} submissions/s",
+                          file=sys.stderr)
+        finally:
+            conn.close()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "database": self.db_path,
+            "challenges": self.challenge_ids,
+            "engine": self.engine,
+            "resumed_from": resumed_from,
+            "last_id": state["last_id"],
+            "complete": complete,
+            "submissions": state["submissions"],
+            "executed": state["executed"],
+            "changed": state["changed"],
+            "progress_updated": state["progress_updated"],
+            "errors": state["errors"],
+            "aborted": aborted,
+            "elapsed_s": round(elapsed, 2),
+            "submissions_per_s": round(run_submissions / elapsed) if elapsed > 0 else 0,
+        }
+
+    def _grade_new_queries(self, pool: ProcessPoolExecutor, rows: List[tuple]) -> Tuple[int, set]:
+        """Execute the batch's not-yet-seen normalized queries; returns how many ran and the keys that errored
+
+        Errors are not remembered, so a later batch tries those queries again.
+        """
+        pending = {}
+        for _, user_id, challenge_id, query, _ in rows:
+            key = _verdict_key(challenge_id, user_id, query)
+            if key not in self.verdicts and key not in pending:
+                pending[key] = (self.engine, challenge_id, query, str(user_id))
+        chunksize = max(1, len(pending) // (self.workers * 4))
+        errored = set()
+        for key, outcome in zip(pending, pool.map(_grade_entry, pending.values(), chunksize=chunksize)):
+            if outcome == ERROR:
+                errored.add(key)
+            else:
+                self.verdicts[key] = outcome
+        return len(pending), errored
+
+    def _apply(self, conn: sqlite3.Connection, rows: List[tuple], errored: set) -> Tuple[int, int, int]:
+        """Write changed verdicts and recompute progress for the affected students, in one transaction
+
+        Submissions whose query errored are left as they are; returns (changed, progress updated, skipped).
+        """
+        updates = []
+        affected = set()
+        skipped = 0
+        for submission_id, user_id, challenge_id, query, passed in rows:
+            key = _verdict_key(challenge_id, user_id, query)
+            if key in errored:
+                skipped += 1
+                continue
+            verdict = self.verdicts[key] == PASS
+            if bool(passed) != verdict:
+                updates.append((verdict, submission_id))
+                affected.add((user_id, challenge_id))
+        if not updates:
+            return 0, 0, skipped
+
+        with conn:
+            conn.executemany("UPDATE user_submissions SET passed = ? WHERE id = ?", updates)
+            # solved_at is the time of the first passing submission, or NULL if none passes any more
+            conn.executemany("""
+                UPDATE user_progress SET solved_at = (
+                    SELECT MIN(s.submitted_at) FROM user_submissions s
+                    WHERE s.user_id = user_progress.user_id AND s.challenge_id = user_progress.challenge_id
+                      AND s.passed = 1
+                )
+                WHERE user_id = ? AND challenge_id = ?
+            """, sorted(affected))
+        return len(updates), len(affected), skipped
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Regrade historical submissions after a challenge fix")
+    parser.add_argument("--database", default=os.getenv("DATABASE_PATH", "users.db"), help="App database to update")
+    parser.add_argument("--challenge", action="append", type=int, required=True,
+                        help="Challenge id to regrade (repeatable)")
+    parser.add_argument("--engine", default="sqlite", help=f"Engine to grade on ({', '.join(engine_names())})")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=REGRADE_BATCH_SIZE, help="Submissions per transaction")
+    parser.add_argument("--state", help="Checkpoint file (default: next to the database)")
+    parser.add_argument("--max-batches", type=int, help="Stop after this many batches; run again to continue")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start from the beginning")
+    parser.add_argument("--max-error-rate", type=float, default=REGRADE_MAX_ERROR_RATE,
+                        help="Stop when more than this fraction of a batch's queries cannot be graded")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if get_engine(args.engine) is None:
+        print(f"Unknown engine: {args.engine}", file=sys.stderr)
+        return 2
+    regrader = Regrader(args.database, args.challenge, args.engine, args.workers, args.batch_size, args.state,
+                        args.max_error_rate)
+    summary = regrader.run(args.max_batches, args.restart)
+    print(json.dumps(summary, indent=2))
+    if summary["aborted"]:
+        print(f"Regrading stopped: {summary['aborted']}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import Counter
+from decimal import Decimal
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+
+from challenges import CHALLENGES
+from large_datasets import update_result_digest
+from query_validation import strip_sql_comments
+
+# Rows returned to the client - validation always sees the full result
+RESULT_PREVIEW_ROWS = 1000
+# Rows pulled from a cursor at a time while validating
+FETCH_BATCH_ROWS = 500
+
+# Rows of each side, and of each diff list, returned for a failed submission
+DIFF_PREVIEW_ROWS = int(os.getenv("DIFF_PREVIEW_ROWS", "50"))
+
+# Numeric cells match when they are this close (1200 == 1200.0 == Decimal('1200.00'))
+NUMERIC_REL_TOLERANCE = 1e-9
+NUMERIC_ABS_TOLERANCE = 1e-6
+# Decimal places numeric cells are rounded to when rows are counted as a multiset
+NUMERIC_KEY_PLACES = 6
+
+NUMERIC = "numeric"
+TEXT = "text"
+# How an expected cell spells NULL
+NULL_TEXT = "None"
+
+# Distinct from every canonical cell, so a row holding it never matches
+_MISMATCH = object()
+
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`|\[[^\]]*\]")
+_ORDER_BY_OR_PAREN = re.compile(r"\(|\)|\border\s+by\b", re.IGNORECASE)
+
+
+def parse_number(cell: Any) -> Optional[float]:
+    """Numeric value of a cell (ints, floats, Decimals, booleans or numeric text); None if it has none"""
+    if isinstance(cell, (int, float, Decimal)):
+        return float(cell)
+    if isinstance(cell, str):
+        try:
+            value = float(cell)
+        except ValueError:
+            return None
+        return value if math.isfinite(value) else None
+    return None
+
+
+def numbers_match(value: float, expected: float) -> bool:
+    return math.isclose(value, expected, rel_tol=NUMERIC_REL_TOLERANCE, abs_tol=NUMERIC_ABS_TOLERANCE)
+
+
+def has_top_level_order_by(query: str) -> bool:
+    """Whether the outermost statement sorts its result (window and subquery ORDER BYs do not count)"""
+    depth = 0
+    for match in _ORDER_BY_OR_PAREN.finditer(_QUOTED.sub("''", strip_sql_comments(query))):
+        token = match.group(0)
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth == 0:
+            return True
+    return False
+
+
+def is_order_sensitive(challenge: Dict[str, Any]) -> bool:
+    """An explicit "ordered" flag, otherwise whether the reference solution sorts"""
+    if "ordered" in challenge:
+        return bool(challenge["ordered"])
+    # Digests are order-sensitive by construction
+    if "expected_digest" in challenge:
+        return True
+    return has_top_level_order_by(challenge.get("reference_query", ""))
+
+
+class ExpectedResult:
+    """What a correct result looks like, compiled once per challenge
+
+    Inline expected outputs become typed column vectors: a column whose cells
+    all parse as numbers is numeric and compared with a tolerance, anything
+    else is text. Ordered challenges keep the canonical rows in sequence;
+    unordered ones a multiset of row keys. Digest challenges keep their
+    order-sensitive SHA-256 and row count.
+    """
+
+    def __init__(self, challenge: Dict[str, Any]):
+        self.challenge_id = challenge["id"]
+        self.ordered = is_order_sensitive(challenge)
+        self.digest = challenge.get("expected_digest")
+        # Identity of the definition this was built from, to notice replaced challenges
+        self.source = self.digest if self.digest is not None else challenge.get("expected_output")
+
+        self.kinds: List[str] = []
+        self.vectors: List[pa.Array] = []
+        self.sorted_vectors: List[pa.Array] = []
+        self.canonical_rows: List[tuple] = []
+        self.multiset: Optional[Counter] = None
+        if self.digest is not None:
+            self.row_count = challenge["expected_row_count"]
+            return
+
+        rows = [[str(cell) for cell in row] for row in challenge.get("expected_output", [])]
+        self.row_count = len(rows)
+        columns = list(zip(*rows))
+        for cells in columns:
+            values = [parse_number(cell) for cell in cells if cell != NULL_TEXT]
+            numeric = bool(values) and all(value is not None for value in values)
+            self.kinds.append(NUMERIC if numeric else TEXT)
+            if numeric:
+                self.vectors.append(pa.array([None if cell == NULL_TEXT else float(cell) for cell in cells],
+                                             pa.float64()))
+            else:
+                self.vectors.append(pa.array(cells, pa.string()))
+        if self.vectors and not self.ordered:
+            self.sorted_vectors = sort_columns(self.vectors)
+
+        self.canonical_rows = [self.canonical_row(row) for row in rows]
+        if not self.ordered:
+            self.multiset = Counter(self.row_key(row) for row in self.canonical_rows)
+
+    def canonical_cell(self, index: int, cell: Any) -> Any:
+        """Engine value -> comparable value; strings are only built for non-text values in text columns"""
+        if cell is None or cell == NULL_TEXT:
+            return None
+        if self.kinds[index] == NUMERIC:
+            value = parse_number(cell)
+            return _MISMATCH if value is None else value
+        return cell if isinstance(cell, str) else str(cell)
+
+    def canonical_row(self, row: Sequence[Any]) -> Optional[tuple]:
+        if len(row) != len(self.kinds):
+            return None
+        return tuple(self.canonical_cell(index, cell) for index, cell in enumerate(row))
+
+    def row_key(self, row: tuple) -> tuple:
+        """Hashable multiset key; numbers are rounded so values within tolerance collide"""
+        return tuple(round(cell, NUMERIC_KEY_PLACES) + 0.0 if isinstance(cell, float) else cell for cell in row)
+
+    def row_matches(self, row: tuple, expected: tuple) -> bool:
+        for cell, expected_cell in zip(row, expected):
+            if isinstance(expected_cell, float):
+                if not isinstance(cell, float) or not numbers_match(cell, expected_cell):
+                    return False
+            elif cell != expected_cell:
+                return False
+        return True
+
+    def matcher(self) -> "RowMatcher":
+        return RowMatcher(self)
+
+
+def sort_columns(columns: List[pa.Array]) -> List[pa.Array]:
+    """Sort parallel columns as rows, on every column"""
+    # Positional names, since result column names can repeat
+    table = pa.Table.from_arrays(columns, names=[f"c{i}" for i in range(len(columns))])
+    table = table.sort_by([(name, "ascending") for name in table.column_names])
+    return [column.combine_chunks() for column in table.columns]
+
+
+class RowMatcher:
+    """Checks result rows as they arrive and stops at the first one that cannot match
+
+    Rows can hold raw engine values or normalized strings.
+    """
+
+    def __init__(self, expected: ExpectedResult):
+        self.expected = expected
+        self.rows = 0
+        self.failed = False
+        self._remaining = expected.multiset.copy() if expected.multiset is not None else None
+        self._digest = hashlib.sha256() if expected.digest is not None else None
+
+    def feed(self, row: Sequence[Any]) -> bool:
+        """Account for one row; False once the result can no longer match"""
+        if self.failed:
+            return False
+        index = self.rows
+        self.rows += 1
+        if index >= self.expected.row_count:
+            # First excess row
+            self.failed = True
+        elif self._digest is not None:
+            # Digests are over normalized strings
+            update_result_digest(self._digest, [cell if isinstance(cell, str) else str(cell) for cell in row])
+        else:
+            canonical = self.expected.canonical_row(row)
+            if canonical is None:
+                self.failed = True
+            elif self._remaining is None:
+                self.failed = not self.expected.row_matches(canonical, self.expected.canonical_rows[index])
+            else:
+                key = self.expected.row_key(canonical)
+                if self._remaining[key] <= 0:
+                    self.failed = True
+                else:
+                    self._remaining[key] -= 1
+        return not self.failed
+
+    def feed_many(self, rows: Iterable[Sequence[Any]]) -> bool:
+        for row in rows:
+            if not self.feed(row):
+                return False
+        return True
+
+    def finish(self) -> bool:
+        """Verdict once every row has been fed"""
+        if self.failed or self.rows != self.expected.row_count:
+            return False
+        if self._digest is not None:
+            return self._digest.hexdigest() == self.expected.digest
+        return True
+
+
+def diff_result(challenge: Dict[str, Any], result: Dict[str, Any],
+                limit: int = DIFF_PREVIEW_ROWS) -> Dict[str, Any]:
+    """Compact difference between a result and the expected output
+
+    Unordered challenges are diffed with a hash join on row keys, ordered ones
+    with a merge walk over both sequences. Each row list holds at most `limit`
+    rows; the counts are exact for the rows the engine returned.
+    """
+    expected = expected_result(challenge)
+    columns = result.get("columns", [])
+    expected_columns = challenge.get("expected_column_names", [])
+    rows = result.get("results", [])
+    diff = {
+        "ordered": expected.ordered,
+        "row_count": result.get("row_count", len(rows)),
+        "expected_row_count": expected.row_count,
+        "columns": {
+            "count_matches": not expected.kinds or len(columns) == len(expected.kinds),
+            "missing": [name for name in expected_columns if name not in columns],
+            "extra": [name for name in columns if expected_columns and name not in expected_columns],
+        },
+        # Rows past the preview were never returned, so they cannot be diffed
+        "truncated": bool(result.get("truncated")),
+    }
+    if expected.digest is not None or not diff["columns"]["count_matches"]:
+        # Only a digest is known, or rows cannot line up column by column
+        return diff
+
+    expected_rows = challenge.get("expected_output", [])
+    canonical_rows = [expected.canonical_row(row) for row in rows]
+    if expected.ordered:
+        diff.update(_merge_diff(expected, rows, canonical_rows, expected_rows, limit))
+    else:
+        diff.update(_hash_diff(expected, rows, canonical_rows, expected_rows, limit))
+    return diff
+
+
+def _hash_diff(expected: ExpectedResult, rows: List[Sequence[Any]], canonical_rows: List[tuple],
+               expected_rows: List[list], limit: int) -> Dict[str, Any]:
+    # Build side: expected row positions per key, consumed as result rows probe it
+    build: Dict[tuple, List[int]] = {}
+    for index, row in enumerate(expected.canonical_rows):
+        build.setdefault(expected.row_key(row), []).append(index)
+    extra = []
+    extra_count = 0
+    for row, canonical in zip(rows, canonical_rows):
+        positions = build.get(expected.row_key(canonical))
+        if positions:
+            positions.pop()
+        else:
+            extra_count += 1
+            if len(extra) < limit:
+                extra.append(list(row))
+    missing = sorted(index for positions in build.values() for index in positions)
+    return {
+        "missing_rows": [expected_rows[index] for index in missing[:limit]],
+        "missing_row_count": len(missing),
+        "extra_rows": extra,
+        "extra_row_count": extra_count,
+    }
+
+
+def _merge_diff(expected: ExpectedResult, rows: List[Sequence[Any]], canonical_rows: List[tuple],
+                expected_rows: List[list], limit: int) -> Dict[str, Any]:
+    mismatched = []
+    mismatched_count = 0
+    for index, (row, canonical) in enumerate(zip(rows, canonical_rows)):
+        if index >= expected.row_count:
+            break
+        if not expected.row_matches(canonical, expected.canonical_rows[index]):
+            mismatched_count += 1
+            if len(mismatched) < limit:
+                mismatched.append({"row": index, "expected": expected_rows[index], "actual": list(row)})
+    # Past the shorter side, rows are simply missing or extra
+    paired = min(len(rows), expected.row_count)
+    # The right rows in the wrong order
+    same_rows = (mismatched_count > 0 and len(rows) == expected.row_count
+                 and Counter(map(expected.row_key, canonical_rows))
+                 == Counter(map(expected.row_key, expected.canonical_rows)))
+    return {
+        "same_rows_wrong_order": same_rows,
+        "mismatched_rows": mismatched,
+        "mismatched_row_count": mismatched_count,
+        "missing_rows": expected_rows[paired:paired + limit],
+        "missing_row_count": expected.row_count - paired,
+        "extra_rows": [list(row) for row in rows[paired:paired + limit]],
+        "extra_row_count": len(rows) - paired,
+    }
+
+
+_expected_results: Dict[int, ExpectedResult] = {}
+_expected_lock = threading.Lock()
+
+
+def expected_result(challenge: Dict[str, Any]) -> ExpectedResult:
+    """The precomputed ExpectedResult for a challenge"""
+    source = challenge.get("expected_digest", challenge.get("expected_output"))
+    expected = _expected_results.get(challenge["id"])
+    if expected is None or expected.source is not source:
+        expected = ExpectedResult(challenge)
+        with _expected_lock:
+            _expected_results[challenge["id"]] = expected
+    return expected
+
+
+def forget_expected_result(challenge_id: Any):
+    """Drop a compiled result, for generated challenge variants that are evicted"""
+    with _expected_lock:
+        _expected_results.pop(challenge_id, None)
+
+
+def result_matches(challenge: Dict[str, Any], rows: Iterable[Sequence[Any]]) -> bool:
+    """Validate already materialized rows"""
+    matcher = expected_result(challenge).matcher()
+    matcher.feed_many(rows)
+    return matcher.finish()
+
+
+# Every catalog challenge is compiled when the module loads
+for _challenge in CHALLENGES:
+    expected_result(_challenge)
@@ -0,0 +1,50 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any
+
+# Submissions allowed in flight at once; the rest are told to retry
+SUBMISSION_CONCURRENCY = int(os.getenv("SUBMISSION_CONCURRENCY", "32"))
+SUBMISSION_RETRY_AFTER_S = int(os.getenv("SUBMISSION_RETRY_AFTER_S", "1"))
+SUBMISSION_DB_WORKERS = int(os.getenv("SUBMISSION_DB_WORKERS", "4"))
+
+
+class AdmissionController:
+    """Caps submissions in flight; callers over the cap are turned away instead of queued"""
+
+    def __init__(self, limit: int = SUBMISSION_CONCURRENCY, retry_after_s: int = SUBMISSION_RETRY_AFTER_S):
+        self.limit = limit
+        self.retry_after_s = retry_after_s
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "retry_after_s": self.retry_after_s,
+            }
+
+# Global submission admission controller instance
+submission_admission = AdmissionController()
+
+# App-database work for submissions (user lookup, recording), kept off the AnyIO threadpool
+submission_db_executor = ThreadPoolExecutor(max_workers=SUBMISSION_DB_WORKERS, thread_name_prefix="submission-db")
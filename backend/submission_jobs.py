@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+# Workers running queued submissions; engine work itself still goes through the engine scheduler
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Jobs queued or running at once; past this, async submissions are turned away
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "1000"))
+# Finished jobs are kept this long for polling, then dropped
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class SubmissionJob:
+    """A submission running in the background, with the stages it has reached"""
+
+    def __init__(self, owner_id: int, challenge_id: int):
+        self.id = uuid.uuid4().hex
+        self.owner_id = owner_id
+        self.challenge_id = challenge_id
+        self.status = QUEUED
+        self.stages: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.status_code: Optional[int] = None
+        self.finished_at: Optional[float] = None
+        # Bumped on every change, so pollers can tell when there is something new
+        self.version = 0
+        self._lock = threading.Lock()
+        self.set_stage(QUEUED)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def set_stage(self, stage: str):
+        """Record a stage; called from whichever thread is running the submission"""
+        with self._lock:
+            if self.stages and self.stages[-1]["stage"] == stage:
+                return
+            self.stages.append({"stage": stage, "at": time.time()})
+            if stage != QUEUED:
+                self.status = RUNNING
+            self.version += 1
+
+    def complete(self, result: Dict[str, Any]):
+        with self._lock:
+            self.status = COMPLETED
+            self.status_code = 200
+            self.result = result
+            self.finished_at = time.time()
+            self.version += 1
+
+    def fail(self, status_code: int, error: str):
+        with self._lock:
+            self.status = FAILED
+            self.status_code = status_code
+            self.error = error
+            self.finished_at = time.time()
+            self.version += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "challenge_id": self.challenge_id,
+                "status": self.status,
+                "stage": self.stages[-1]["stage"],
+                "stages": [dict(stage) for stage in self.stages],
+                "status_code": self.status_code,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class SubmissionJobQueue:
+    """Runs submissions on a worker pool so the submit request can return at once"""
+
+    def __init__(self, workers: int = JOB_WORKERS, limit: int = JOB_QUEUE_LIMIT, ttl_s: float = JOB_TTL_S):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="submission-job")
+        self.limit = limit
+        self.ttl_s = ttl_s
+        self.jobs: Dict[str, SubmissionJob] = {}
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, owner_id: int, challenge_id: int,
+               work: Callable[[SubmissionJob], Dict[str, Any]]) -> Optional[SubmissionJob]:
+        """Queue work(job), which returns the submit response; None if the queue is full"""
+        with self._lock:
+            self._evict()
+            if self.pending >= self.limit:
+                return None
+            self.pending += 1
+            job = SubmissionJob(owner_id, challenge_id)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, work)
+        return job
+
+    def _run(self, job: SubmissionJob, work: Callable[[SubmissionJob], Dict[str, Any]]):
+        try:
+            job.complete(work(job))
+        except Exception as e:
+            # HTTP errors keep their status and detail; anything else is a server error
+            job.fail(getattr(e, "status_code", 500), str(getattr(e, "detail", e)))
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def get(self, job_id: str) -> Optional[SubmissionJob]:
+        with self._lock:
+            self._evict()
+            return self.jobs.get(job_id)
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_s
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"pending": self.pending, "limit": self.limit, "retained": len(self.jobs)}
+
+# Global submission job queue instance
+submission_job_queue = SubmissionJobQueue()
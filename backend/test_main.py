@@ -1,8 +1,16 @@
 import pytest
-from fastapi.testclient import TestClient
-from main import app
 import sqlite3
 import os
+import time
+
+# Time each graded query once, without warm-up, to keep the suite fast
+os.environ.setdefault("PERF_WARMUP_RUNS", "0")
+os.environ.setdefault("PERF_TIMED_RUNS", "1")
+# Tests warm the large-dataset challenges they use themselves
+os.environ.setdefault("WARM_LARGE_DATASETS", "false")
+
+from fastapi.testclient import TestClient
+from main import app
 
 client = TestClient(app)
 
@@ -48,6 +56,7 @@ def setup_database():
             query TEXT NOT NULL,
             passed BOOLEAN NOT NULL,
             submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            perf_score REAL,
             FOREIGN KEY (user_id) REFERENCES users (id)
         )
     """)
@@ -245,6 +254,8 @@ class TestChallengeSubmission:
         assert data["passed"] == False
         assert "result" in data
         assert "expected" in data
+        assert data["diff"]["columns"]["count_matches"] is False
+        assert data["diff"]["columns"]["missing"] == ["id", "price", "category"]
     
     def test_submit_invalid_sql(self):
         """Test submitting invalid SQL"""
@@ -356,5 +367,2011 @@ class TestDatabaseFunctions:
         assert columns[1]["name"] == "name"
         assert columns[1]["type"] == "TEXT"
 
+class TestLoadTestHarness:
+    """Test the load-test report helpers"""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles"""
+        from bench.load_test import percentile
+
+        values = [float(i) for i in range(1, 101)]
+        assert percentile(values, 50) == 50.0
+        assert percentile(values, 95) == 95.0
+        assert percentile(values, 99) == 99.0
+        assert percentile([], 50) == 0.0
+
+    def test_recorder_summary(self):
+        """Test throughput and error rate in the scenario summary"""
+        from bench.load_test import LatencyRecorder
+
+        recorder = LatencyRecorder()
+        recorder.record("GET /leaderboard", 0.010, 200)
+        recorder.record("GET /leaderboard", 0.020, 200)
+        recorder.record("GET /admin/stats", 0.030, 403)
+        recorder.record("GET /admin/stats", 0.040, None)
+
+        summary = recorder.summary(2.0)
+        assert summary["requests"] == 4
+        assert summary["errors"] == 2
+        assert summary["error_rate"] == 0.5
+        assert summary["throughput_rps"] == 2.0
+        assert summary["endpoints"]["GET /leaderboard"]["errors"] == 0
+        assert summary["endpoints"]["GET /admin/stats"]["status_codes"] == {"403": 1, "transport_error": 1}
+
+class TestReferenceQueries:
+    """Test that every challenge's reference solution passes"""
+
+    def test_sqlite_reference_queries(self):
+        """Test reference queries on SQLite"""
+        from challenges import CHALLENGES
+        from challenge_container import challenge_manager
+
+        for challenge in CHALLENGES:
+            result = challenge_manager.execute_challenge(challenge["id"], "test", challenge["reference_query"])
+            assert result["passed"], f"Challenge {challenge['id']} reference query failed"
+
+    def test_duckdb_reference_queries(self):
+        """Test reference queries on DuckDB"""
+        from challenges import CHALLENGES
+        from duckdb_container import duckdb_challenge_manager
+
+        for challenge in CHALLENGES:
+            query = challenge.get("duckdb_reference_query", challenge["reference_query"])
+            result = duckdb_challenge_manager.execute_challenge(challenge["id"], "test", query)
+            assert result["passed"], f"Challenge {challenge['id']} DuckDB reference query failed"
+
+    def test_reference_columns_match_expected_names(self):
+        """Test that reference queries name their columns as expected_column_names says"""
+        from challenges import CHALLENGES
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+
+        for challenge in CHALLENGES:
+            if "expected_column_names" not in challenge or challenge.get("mutation"):
+                continue
+            for manager in (challenge_manager, duckdb_challenge_manager):
+                query = challenge.get(f"{manager.name}_reference_query", challenge["reference_query"])
+                result = manager.execute_challenge(challenge["id"], "test", query)
+                assert result["columns"] == challenge["expected_column_names"], (manager.name, challenge["id"])
+
+class TestContainerBenchmarks:
+    """Test the container microbenchmark helpers"""
+
+    def test_bench_single_challenge(self):
+        """Test that every phase is timed and measured"""
+        from bench.container_bench import run_benchmarks
+
+        results = run_benchmarks(["sqlite"], [1], repeats=1)
+        entry = results["sqlite:1"]
+        assert entry["passed"] is True
+        for phase in ["setup", "execute", "normalize", "validate", "cleanup", "total"]:
+            assert "median_ms" in entry["phases"][phase]
+            assert "peak_alloc_kb" in entry["phases"][phase]
+
+    def test_bench_dataset_challenge(self):
+        """Test that dataset challenges, which have no db_path on DuckDB, are benchmarked too"""
+        from bench.container_bench import run_benchmarks
+
+        results = run_benchmarks(["sqlite", "duckdb"], [201], repeats=1)
+        for key in ["sqlite:201", "duckdb:201"]:
+            assert results[key]["passed"] is True
+            assert "median_ms" in results[key]["phases"]["normalize"]
+
+    def test_compare_flags_regressions(self):
+        """Test regression detection against a baseline"""
+        from bench.container_bench import compare_results
+
+        baseline = {"sqlite:1": {"phases": {"setup": {"median_ms": 1.0}, "execute": {"median_ms": 1.0}}}}
+        current = {"sqlite:1": {"phases": {"setup": {"median_ms": 1.5}, "execute": {"median_ms": 1.05}}}}
+        regressions = compare_results(baseline, current, threshold=0.2, min_delta_ms=0.05)
+        assert [r["phase"] for r in regressions] == ["setup"]
+
+class TestSyntheticDataGenerator:
+    """Test the users.db scale-test generator"""
+
+    def test_generate_database(self, tmp_path):
+        """Test row counts and progress consistency"""
+        from bench.generate_data import generate_database
+
+        db_path = str(tmp_path / "generated.db")
+        summary = generate_database(db_path, users=50, submissions=2000, seed=7)
+        assert summary["rows"]["users"] == 50
+        assert summary["rows"]["user_submissions"] == 2000
+
+        conn = sqlite3.connect(db_path)
+        try:
+            # Every submission is counted as an attempt in user_progress
+            assert conn.execute("SELECT SUM(attempts) FROM user_progress").fetchone()[0] == 2000
+            solved = conn.execute("SELECT COUNT(*) FROM user_progress WHERE solved_at IS NOT NULL").fetchone()[0]
+            solved_pairs = conn.execute(
+                "SELECT COUNT(DISTINCT user_id || '-' || challenge_id) FROM user_submissions WHERE passed = 1"
+            ).fetchone()[0]
+            assert solved == solved_pairs
+        finally:
+            conn.close()
+        assert os.environ["DATABASE_PATH"] == "test_users.db"
+
+    def test_generation_is_deterministic(self, tmp_path):
+        """Test that the same seed produces the same rows"""
+        from bench.generate_data import generate_database
+
+        dumps = []
+        for name in ("a.db", "b.db"):
+            db_path = str(tmp_path / name)
+            generate_database(db_path, users=20, submissions=300, seed=3)
+            conn = sqlite3.connect(db_path)
+            dumps.append(conn.execute("SELECT user_id, challenge_id, passed, submitted_at FROM user_submissions").fetchall())
+            conn.close()
+        assert dumps[0] == dumps[1]
+
+class TestQueryPrevalidation:
+    """Test fast-fail validation before a sandbox is built"""
+
+    def test_empty_queries_rejected(self):
+        """Test empty, whitespace, semicolon and comment-only queries"""
+        from query_validation import query_prevalidator
+
+        cases = [
+            ("", "Query is empty"),
+            ("   ", "Query is empty"),
+            (";", "Query contains no SQL statement"),
+            ("-- this is a comment", "Query contains only comments"),
+            ("/* block */", "Query contains only comments"),
+        ]
+        for database_type in ["sqlite", "duckdb"]:
+            for query, message in cases:
+                result = query_prevalidator.validate(18, query, database_type)
+                assert result["success"] is False
+                assert result["error"] == message
+
+    def test_syntax_errors_rejected(self):
+        """Test broken SQL on both engines"""
+        from query_validation import query_prevalidator
+
+        result = query_prevalidator.validate(1, "SELECT 'unterminated FROM products")
+        assert "incomplete" in result["error"]
+        result = query_prevalidator.validate(1, "SELEC * FROM products")
+        assert "syntax error" in result["error"]
+        result = query_prevalidator.validate(1, "SELECT * FROM nonexistent_table")
+        assert "no such table" in result["error"]
+        result = query_prevalidator.validate(1, "SELEC * FROM products", "duckdb")
+        assert "syntax error" in result["error"]
+
+    def test_statement_classification(self):
+        """Test read-only vs mutating classification"""
+        from query_validation import query_prevalidator, READ_ONLY, MUTATING
+
+        assert query_prevalidator.validate(1, "select * from products")["statement_type"] == READ_ONLY
+        assert query_prevalidator.validate(1, "WITH p AS (SELECT * FROM products) SELECT * FROM p")["statement_type"] == READ_ONLY
+        assert query_prevalidator.validate(1, "WITH p AS (SELECT 1) DELETE FROM products")["statement_type"] == MUTATING
+        assert query_prevalidator.validate(1, "INSERT INTO products VALUES (9, 'x', 1, 'y')")["statement_type"] == MUTATING
+        assert query_prevalidator.validate(1, "PRAGMA table_info(products)")["statement_type"] == MUTATING
+        assert query_prevalidator.validate(1, "VACUUM")["statement_type"] == MUTATING
+        assert query_prevalidator.validate(1, "SELECT 1", "duckdb")["statement_type"] == READ_ONLY
+        assert query_prevalidator.validate(1, "DELETE FROM products", "duckdb")["statement_type"] == MUTATING
+
+    def test_invalid_query_skips_sandbox(self, monkeypatch):
+        """Test that no environment is created for a rejected query"""
+        from challenge_container import challenge_manager
+
+        def fail(*args, **kwargs):
+            raise AssertionError("sandbox should not be built")
+
+        monkeypatch.setattr(challenge_manager.container, "create_challenge_environment", fail)
+        result = challenge_manager.execute_challenge(1, "test", "-- nothing here")
+        assert result == {"success": False, "error": "Query contains only comments"}
+
+class TestSharedChallengeDatabases:
+    """Test read-only submissions against the shared per-challenge database"""
+
+    def test_read_only_queries_share_one_database(self, tmp_path):
+        """Test that read-only environments reuse the same file and are never deleted"""
+        from challenge_container import ChallengeContainer
+
+        container = ChallengeContainer(str(tmp_path))
+        first = container.create_challenge_environment(1, "a", read_only=True)
+        second = container.create_challenge_environment(1, "b", read_only=True)
+        assert first["shared"] and first["db_path"] == second["db_path"]
+
+        result = container.execute_query(first, "SELECT COUNT(*) FROM products")
+        assert result["success"] is True
+        container.cleanup_environment(first)
+        assert os.path.exists(second["db_path"])
+
+    def test_shared_database_blocks_writes_attach_and_pragma(self, tmp_path):
+        """Test that the authorizer denies anything but plain reads"""
+        from challenge_container import ChallengeContainer
+
+        container = ChallengeContainer(str(tmp_path))
+        environment = container.create_challenge_environment(1, "a", read_only=True)
+        for query in ["DELETE FROM products",
+                      "ATTACH DATABASE ':memory:' AS other",
+                      "PRAGMA writable_schema = ON"]:
+            result = container.execute_query(environment, query)
+            assert result["success"] is False
+            assert "not authorized" in result["error"]
+
+    def test_mutating_query_uses_private_copy(self, tmp_path):
+        """Test that mutations fall back to a private copy and leave the shared database untouched"""
+        from challenge_container import ChallengeManager
+
+        manager = ChallengeManager()
+        manager.container.shared_db_dir = str(tmp_path)
+        result = manager.execute_challenge(1, "test", "DELETE FROM products")
+        assert result["success"] is True
+        assert result["rows_affected"] > 0
+
+        result = manager.execute_challenge(1, "test", "SELECT COUNT(*) FROM products")
+        assert result["results"][0][0] != "0"
+
+class TestDuckDBColumnarResults:
+    """Test Arrow-based normalization and validation for DuckDB"""
+
+    def test_vectorized_normalization_matches_str(self):
+        """Test that every column type normalizes exactly like str(cell)"""
+        import duckdb
+        from duckdb_container import DuckDBContainer
+
+        query = """
+            SELECT * FROM (VALUES
+                (1, 1.0::DOUBLE, 12.50::DECIMAL(10,2), TRUE, 'text', DATE '2024-01-02',
+                 TIMESTAMP '2024-01-01 10:00:00', 0.1::REAL, 1e-7::DOUBLE, 0.000000123::DECIMAL(18,9)),
+                (NULL, -0.0::DOUBLE, -0.05::DECIMAL(10,2), FALSE, NULL, NULL,
+                 NULL, 100.0::REAL, 1e20::DOUBLE, NULL),
+                (-3, 2.0 / 3 * 1e10, NULL, NULL, 'x', DATE '1999-12-31',
+                 TIMESTAMP '2024-01-01 10:00:00.5', NULL, 1e15::DOUBLE, 0::DECIMAL(18,9))
+            )
+        """
+        conn = duckdb.connect()
+        expected = [[str(cell) for cell in row] for row in conn.execute(query).fetchall()]
+        table = DuckDBContainer().normalize_results(conn.execute(query).fetch_arrow_table())
+        conn.close()
+
+        assert DuckDBContainer().preview_rows(table) == expected
+
+    def test_preview_is_limited_but_validation_uses_full_result(self):
+        """Test that only the preview is materialized as rows"""
+        from duckdb_container import duckdb_challenge_manager
+
+        container = duckdb_challenge_manager.container
+        environment = container.create_challenge_environment(1, "test")
+        try:
+            result = container.execute_query(environment, "SELECT range FROM range(2500)")
+        finally:
+            container.cleanup_environment(environment)
+
+        assert result["row_count"] == 2500
+        assert len(result["results"]) == 1000
+        assert result["truncated"] is True
+        assert result["table"].num_rows == 2500
+
+    def test_columnar_validation(self):
+        """Test passing and failing submissions and that no arrow table is returned"""
+        from challenges import CHALLENGES
+        from duckdb_container import duckdb_challenge_manager
+
+        challenge = next(c for c in CHALLENGES if c["id"] == 1)
+        result = duckdb_challenge_manager.execute_challenge(1, "test", challenge["reference_query"])
+        assert result["passed"] is True
+        assert "table" not in result
+
+        result = duckdb_challenge_manager.execute_challenge(1, "test", challenge["reference_query"].strip() + " LIMIT 0")
+        assert result["passed"] is False
+
+class TestLargeDatasets:
+    """Test the prebuilt-dataset challenge tier"""
+
+    def test_generator_is_deterministic(self):
+        """Test that the same seed always produces the same rows"""
+        from large_datasets import CommerceGenerator
+
+        first = dict(CommerceGenerator(seed=7, customers=100, orders=500, events=500).tables())
+        second = dict(CommerceGenerator(seed=7, customers=100, orders=500, events=500).tables())
+        other = dict(CommerceGenerator(seed=8, customers=100, orders=500, events=500).tables())
+        assert first == second
+        assert first["orders"] != other["orders"]
+        assert list(first) == ["customers", "orders", "events"]
+
+    def test_result_digest(self):
+        """Test that digests depend on values and row order"""
+        from large_datasets import result_digest
+
+        assert result_digest([["a", "1"], ["b", "2"]]) == result_digest([["a", "1"], ["b", "2"]])
+        assert result_digest([["a", "1"], ["b", "2"]]) != result_digest([["b", "2"], ["a", "1"]])
+        assert result_digest([["a1"]]) != result_digest([["a", "1"]])
+
+    def test_datasets_are_mounted_without_copying(self):
+        """Test that both engines read the prebuilt files in place"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+        from large_datasets import ensure_dataset
+
+        paths = ensure_dataset("commerce")
+        environment = challenge_manager.container.create_challenge_environment(201, "test")
+        assert environment["db_path"] == paths["sqlite"]
+        assert environment["shared"] is True
+        challenge_manager.container.cleanup_environment(environment)
+        assert os.path.exists(paths["sqlite"])
+
+        environment = duckdb_challenge_manager.container.create_challenge_environment(201, "test")
+        assert environment["parquet"] == paths["parquet"]
+        duckdb_challenge_manager.container.cleanup_environment(environment)
+        assert all(os.path.exists(path) for path in paths["parquet"].values())
+
+    def test_dataset_queries_must_be_read_only(self):
+        """Test that mutations and ATTACH are rejected on datasets"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+        from large_datasets import DATASET_READ_ONLY_ERROR
+
+        for manager in [challenge_manager, duckdb_challenge_manager]:
+            result = manager.execute_challenge(201, "test", "DELETE FROM orders")
+            assert result == {"success": False, "error": DATASET_READ_ONLY_ERROR}
+
+        result = challenge_manager.execute_challenge(201, "test", "ATTACH DATABASE ':memory:' AS other")
+        assert result["success"] is False
+
+    def test_wrong_answer_fails_digest(self):
+        """Test that a result with the right shape but wrong rows fails"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+
+        query = "SELECT c.country, SUM(o.amount) AS revenue FROM orders o JOIN customers c ON c.id = o.customer_id GROUP BY c.country ORDER BY revenue DESC"
+        for manager in [challenge_manager, duckdb_challenge_manager]:
+            result = manager.execute_challenge(201, "test", query)
+            assert result["success"] is True
+            assert result["passed"] is False
+
+class TestPerformanceGrading:
+    """Test timing, plan capture and scoring for large-dataset challenges"""
+
+    def test_sqlite_plan_counts_scans_and_index_use(self):
+        """Test EXPLAIN QUERY PLAN classification"""
+        from performance import sqlite_plan
+
+        conn = sqlite3.connect(":memory:")
+        conn.executescript("CREATE TABLE t (id INTEGER PRIMARY KEY, k INTEGER); CREATE INDEX idx_k ON t(k);")
+        assert sqlite_plan(conn, "SELECT * FROM t")["full_scans"] == 1
+        plan = sqlite_plan(conn, "SELECT * FROM t WHERE k = 5")
+        assert plan["full_scans"] == 0
+        assert plan["index_searches"] == 1
+        conn.close()
+
+    def test_time_query_runs_warmup_and_repeats(self):
+        """Test that warm-up runs are discarded and the budget caps repeats"""
+        from performance import time_query
+
+        calls = []
+        timing = time_query(lambda: calls.append(1), warmup_runs=2, timed_runs=3)
+        assert len(calls) == 5
+        assert timing["runs"] == 3
+
+        calls.clear()
+        timing = time_query(lambda: calls.append(1), warmup_runs=0, timed_runs=5, time_budget_s=0)
+        assert timing["runs"] == 1
+
+        calls.clear()
+        assert time_query(lambda: calls.append(1), warmup_runs=1, timed_runs=3, deadline=time.monotonic()) is None
+        assert calls == []
+
+    def test_profiling_stops_at_the_deadline(self):
+        """Test that a slow query is interrupted and yields no profile instead of overrunning"""
+        from performance import PerformanceGrader
+
+        class MemoryContainer:
+            def connect(self, environment):
+                return sqlite3.connect(":memory:")
+
+        slow = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+        started = time.monotonic()
+        assert PerformanceGrader().profile(MemoryContainer(), {}, slow, "sqlite", started + 0.2) is None
+        assert time.monotonic() - started < 2
+
+    def test_grading_needs_a_precomputed_reference(self):
+        """Test that a submission never profiles the reference solution itself"""
+        from challenge_container import challenge_manager
+        from challenges import CHALLENGES
+        from performance import PerformanceGrader
+
+        grader = PerformanceGrader()
+        challenge = next(c for c in CHALLENGES if c["id"] == 205)
+        container = challenge_manager.container
+        environment = container.create_challenge_environment(205, "test", True, challenge)
+        try:
+            assert grader.grade(container, environment, challenge, challenge["reference_query"], "sqlite") is None
+            assert grader.precompute_reference(container, environment, challenge, "sqlite") is not None
+            assert grader.grade(container, environment, challenge, challenge["reference_query"], "sqlite",
+                                deadline=time.monotonic()) is None
+            report = grader.grade(container, environment, challenge, challenge["reference_query"], "sqlite")
+            assert 0 <= report["score"] <= 100
+        finally:
+            container.cleanup_environment(environment)
+
+    def test_score_against_reference(self):
+        """Test that slower queries and extra scans lower the score"""
+        from performance import performance_score
+
+        reference = {"timing": {"median_ms": 100.0}, "plan": {"full_scans": 1}}
+        assert performance_score({"timing": {"median_ms": 105.0}, "plan": {"full_scans": 1}}, reference) == 100
+        assert performance_score({"timing": {"median_ms": 50.0}, "plan": {"full_scans": 0}}, reference) == 100
+        slow = performance_score({"timing": {"median_ms": 460.0}, "plan": {"full_scans": 1}}, reference)
+        scans = performance_score({"timing": {"median_ms": 100.0}, "plan": {"full_scans": 3}}, reference)
+        assert slow < 50
+        assert 80 < scans < 100
+
+    def test_passing_submission_is_graded_and_stored(self):
+        """Test that the submit response carries the report and the score is saved"""
+        from challenge_container import challenge_manager
+        from challenges import CHALLENGES
+        from duckdb_container import duckdb_challenge_manager
+
+        # Reference profiles are computed when the challenge is warmed
+        challenge_manager.warm(205)
+        duckdb_challenge_manager.warm(205)
+        response = client.post("/auth/signup", json={"email": "perf@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+        challenge = next(c for c in CHALLENGES if c["id"] == 205)
+
+        for database_type in ["sqlite", "duckdb"]:
+            response = client.post(
+                "/challenges/205/submit",
+                json={"user_query": challenge["reference_query"], "database_type": database_type},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == 200
+            performance = response.json()["performance"]
+            assert 0 <= performance["score"] <= 100
+            assert performance["timing"]["runs"] >= 1
+            assert performance["plan"]["full_scans"] >= 1
+
+        response = client.get("/user/submissions", headers={"Authorization": f"Bearer {token}"})
+        assert all(s["perf_score"] is not None for s in response.json()["submissions"])
+
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.json()["performance"] is None
+
+    def test_startup_warm_skips_unbuilt_datasets(self, monkeypatch):
+        """Test that warming at startup never builds a dataset"""
+        import main
+
+        warmed = []
+
+        class RecordingEngine:
+            def warm(self, challenge_id):
+                warmed.append(challenge_id)
+
+        monkeypatch.setattr(main, "get_engine", lambda database_type: RecordingEngine())
+        monkeypatch.setattr(main, "is_dataset_built", lambda name: False)
+        main.warm_large_datasets()
+        assert warmed == []
+
+        monkeypatch.setattr(main, "is_dataset_built", lambda name: True)
+        main.warm_large_datasets()
+        assert 201 in warmed and 1 not in warmed
+
+class TestExplainEndpoint:
+    """Test query plan inspection without execution"""
+
+    def get_token(self, email="explain@example.com"):
+        response = client.post("/auth/signup", json={"email": email, "password": "password123"})
+        return response.json()["access_token"]
+
+    def test_explain_sqlite_and_duckdb(self):
+        """Test plans for both engines and that nothing is recorded"""
+        token = self.get_token()
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.post("/challenges/201/explain",
+                               json={"user_query": "SELECT * FROM orders WHERE customer_id = 5"},
+                               headers=headers)
+        assert response.status_code == 200
+        plan = response.json()["plan"]
+        assert plan["index_searches"] == 1
+        assert plan["full_scans"] == 0
+
+        response = client.post("/challenges/1/explain",
+                               json={"user_query": "SELECT * FROM products", "database_type": "duckdb"},
+                               headers=headers)
+        assert response.status_code == 200
+        assert response.json()["plan"]["format"] == "duckdb_explain"
+
+        response = client.get("/user/submissions", headers=headers)
+        assert response.json()["submissions"] == []
+
+    def test_plans_are_cached_by_normalized_query(self):
+        """Test that whitespace and comments do not defeat the cache"""
+        from query_plans import QueryPlanCache
+
+        cache = QueryPlanCache()
+        first = cache.explain(2, "SELECT name, price FROM products")
+        second = cache.explain(2, "SELECT name,  price\n  FROM products; -- again")
+        other = cache.explain(2, "SELECT name FROM products")
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["plan"] is first["plan"]
+        assert other["cached"] is False
+
+    def test_explain_never_executes(self, monkeypatch):
+        """Test that mutations are refused and no sandbox is created"""
+        from challenge_container import challenge_manager
+
+        def fail(*args, **kwargs):
+            raise AssertionError("explain must not build a sandbox")
+
+        monkeypatch.setattr(challenge_manager.container, "create_challenge_environment", fail)
+        token = self.get_token("explain2@example.com")
+        headers = {"Authorization": f"Bearer {token}"}
+
+        response = client.post("/challenges/1/explain", json={"user_query": "DELETE FROM products"}, headers=headers)
+        assert response.status_code == 400
+        response = client.post("/challenges/1/explain",
+                               json={"user_query": "EXPLAIN ANALYZE SELECT * FROM products", "database_type": "duckdb"},
+                               headers=headers)
+        assert response.status_code == 200
+        response = client.post("/challenges/999/explain", json={"user_query": "SELECT 1"}, headers=headers)
+        assert response.status_code == 404
+
+    def test_unbuilt_dataset_is_unavailable(self, monkeypatch):
+        """Test that an unbuilt dataset answers 503 and is built in the background"""
+        import threading
+        import query_plans
+
+        built = threading.Event()
+        monkeypatch.setattr(query_plans, "is_dataset_built", lambda name: False)
+        monkeypatch.setattr(query_plans, "ensure_dataset", lambda name: built.set())
+        token = self.get_token("explain3@example.com")
+
+        response = client.post("/challenges/202/explain",
+                               json={"user_query": "SELECT COUNT(*) FROM orders WHERE status = 'refunded'"},
+                               headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(query_plans.DATASET_RETRY_AFTER_S)
+        assert built.wait(2)
+
+    def test_duckdb_plans_read_the_template_database(self):
+        """Test that small DuckDB challenges are explained on the engine's own template"""
+        from challenges import CHALLENGES
+        from duckdb_container import duckdb_challenge_manager
+        from query_plans import QueryPlanCache
+
+        challenge = next(c for c in CHALLENGES if c["id"] == 1)
+        cache = QueryPlanCache()
+        assert cache.explain(1, "SELECT * FROM products", "duckdb")["success"] is True
+        conn, _ = cache._connection("duckdb", challenge)
+        assert conn.execute("SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+                            ).fetchone()[0] == duckdb_challenge_manager.container.get_template_database(challenge)
+
+class TestMultiEngineSubmission:
+    """Test running a submission on every engine at once"""
+
+    def test_all_engines_submit(self):
+        """Test the database_type="all" submit response"""
+        response = client.post("/auth/signup", json={"email": "multi@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products", "database_type": "all"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["passed"] is True
+        assert set(data["engines"]) == {"sqlite", "duckdb"}
+        assert all(engine["passed"] for engine in data["engines"].values())
+        assert all(engine["elapsed_ms"] >= 0 for engine in data["engines"].values())
+        assert data["divergence"]["diverged"] is False
+
+    def test_divergence_report(self):
+        """Test differing results and an engine-specific error"""
+        from multi_engine import multi_engine_runner
+
+        result = multi_engine_runner.execute_challenge(1, "test", "SELECT id / 2 FROM products")
+        divergence = result["divergence"]
+        assert divergence["diverged"] is True
+        difference = divergence["differences"][0]
+        assert difference["same_row_count"] is True
+        assert difference["same_rows"] is False
+        assert difference["first_difference"] == {"row": 0, "sqlite": ["0"], "duckdb": ["0.5"]}
+
+        result = multi_engine_runner.execute_challenge(1, "test", "SELECT sqlite_version()")
+        assert result["success"] is True
+        assert result["divergence"]["failed"] == ["duckdb"]
+        assert result["divergence"]["diverged"] is True
+
+    def test_deadline_caps_slowest_engine(self, monkeypatch):
+        """Test that a slow engine is reported as timed out"""
+        import time
+        import multi_engine
+
+        from engines import ExecutionEngine
+
+        class SlowManager(ExecutionEngine):
+            name = "duckdb"
+
+            def execute_challenge(self, challenge_id, user_id, user_query, timeout_s=None):
+                time.sleep(1)
+                return {"success": True, "results": [], "columns": [], "row_count": 0, "passed": False}
+
+        monkeypatch.setitem(multi_engine.ENGINE_MANAGERS, "duckdb", SlowManager())
+        start = time.perf_counter()
+        result = multi_engine.multi_engine_runner.execute_challenge(1, "test", "SELECT * FROM products", deadline_s=0.3)
+        assert time.perf_counter() - start < 0.9
+        assert result["passed"] is True
+        assert result["engines"]["duckdb"]["timed_out"] is True
+
+class FakeExecResult:
+    def __init__(self, exit_code):
+        self.exit_code = exit_code
+
+class FakeContainer:
+    def __init__(self, name, port, ready_after=2):
+        self.id = f"id-{name}"
+        self.name = name
+        self.status = "created"
+        self.ports = {}
+        self.port = port
+        self.probes = 0
+        self.ready_after = ready_after
+        self.stopped = False
+
+    def reload(self):
+        if not self.stopped:
+            self.status = "running"
+            self.ports = {"5432/tcp": [{"HostPort": str(self.port)}]}
+
+    def exec_run(self, command):
+        assert command.startswith("pg_isready")
+        self.probes += 1
+        return FakeExecResult(0 if self.probes >= self.ready_after else 2)
+
+    def stop(self, timeout=None):
+        self.stopped = True
+        self.status = "exited"
+
+class FakeDockerClient:
+    """Stands in for docker.from_env() in pool tests"""
+
+    def __init__(self):
+        self.started = []
+        self.containers = self
+
+    def run(self, image, name, **kwargs):
+        container = FakeContainer(name, 50000 + len(self.started))
+        self.started.append(container)
+        return container
+
+class FakePostgres:
+    """Records the SQL each pooled connection receives"""
+
+    def __init__(self, fail_on=None, failures=None):
+        self.statements = []
+        self.fail_on = fail_on
+        # How many times fail_on fails before it succeeds; None for always
+        self.failures = failures
+
+    def connect(self, url, **kwargs):
+        fake = self
+
+        class Cursor:
+            description = None
+            rowcount = 0
+
+            def execute(self, statement):
+                if fake.fail_on and fake.fail_on in statement and fake.failures != 0:
+                    if fake.failures is not None:
+                        fake.failures -= 1
+                    raise RuntimeError("boom")
+                fake.statements.append((url.rsplit("/", 1)[1], statement))
+
+        class Connection:
+            autocommit = False
+
+            def cursor(self):
+                return Cursor()
+
+            def commit(self):
+                pass
+
+            def close(self):
+                pass
+
+        return Connection()
+
+class TestPostgresContainerPool:
+    """Test the warm Postgres pool against a fake Docker client"""
+
+    def make_pool(self, fake_postgres=None, **kwargs):
+        from docker_postgres_container import PostgresContainerPool
+
+        docker_client = FakeDockerClient()
+        fake_postgres = fake_postgres or FakePostgres()
+        pool = PostgresContainerPool(docker_client, connect=fake_postgres.connect, **kwargs)
+        return pool, docker_client, fake_postgres
+
+    def test_warm_probes_until_ready(self):
+        """Test that warm() fills the pool using pg_isready plus a connection probe"""
+        pool, docker_client, fake_postgres = self.make_pool(target_size=2)
+        pool.warm()
+        assert len(pool.idle) == 2
+        assert all(c.probes == 2 for c in docker_client.started)
+        assert ("postgres", "SELECT 1") in fake_postgres.statements
+
+    def test_startup_warm_fills_pool_and_tolerates_missing_docker(self, monkeypatch):
+        """Test that the startup warm-up fills the pool, and only logs when Docker is unavailable"""
+        import docker
+        import main
+        from docker_postgres_container import DockerChallengeManager, DockerPostgresContainer
+
+        pool, docker_client, _ = self.make_pool(target_size=2)
+        manager = DockerChallengeManager(DockerPostgresContainer(docker_client, pool))
+        monkeypatch.setattr(main, "get_engine", lambda database_type: manager)
+        main.warm_docker_postgres_pool()
+        assert len(pool.idle) == 2
+
+        class NoDaemon:
+            @property
+            def containers(self):
+                raise docker.errors.DockerException("Error while fetching server API version")
+
+        manager = DockerChallengeManager(DockerPostgresContainer(docker_client=NoDaemon()))
+        monkeypatch.setattr(main, "get_engine", lambda database_type: manager)
+        main.warm_docker_postgres_pool()
+        assert len(manager.container.pool.idle) == 0
+
+    def test_lease_clones_template_and_recycles(self):
+        """Test that leases reuse warm containers and templates instead of new containers"""
+        from challenges import CHALLENGES
+        from docker_postgres_container import challenge_template_name
+
+        pool, docker_client, fake_postgres = self.make_pool(target_size=1, max_size=1)
+        pool.warm()
+        challenge = next(c for c in CHALLENGES if c["id"] == 1)
+        template = challenge_template_name(challenge)
+
+        first = pool.acquire(challenge)
+        pool.release(first)
+        second = pool.acquire(challenge)
+        pool.release(second)
+
+        statements = [statement for _, statement in fake_postgres.statements]
+        assert len(docker_client.started) == 1
+        assert statements.count(f'CREATE DATABASE "{template}"') == 1
+        assert f'CREATE DATABASE "{first["database"]}" TEMPLATE "{template}"' in statements
+        assert f'DROP DATABASE IF EXISTS "{first["database"]}" WITH (FORCE)' in statements
+        assert (template, challenge["seed_sql"]) in fake_postgres.statements
+        assert first["database"] != second["database"]
+        assert len(pool.idle) == 1 and not pool.leased
+
+    def test_leases_connect_as_runner_role(self):
+        """Test that submissions never connect as the container's superuser"""
+        from challenges import CHALLENGES
+        from docker_postgres_container import POSTGRES_RUNNER_USER, POSTGRES_USER
+
+        pool, docker_client, fake_postgres = self.make_pool(target_size=1)
+        pool.warm()
+        assert any(statement.startswith(f"CREATE ROLE {POSTGRES_RUNNER_USER}")
+                   for _, statement in fake_postgres.statements)
+        lease = pool.acquire(CHALLENGES[0])
+        assert lease["db_url"].startswith(f"postgresql://{POSTGRES_RUNNER_USER}:")
+        assert POSTGRES_USER not in lease["db_url"]
+        pool.release(lease)
+
+    def test_failed_seed_drops_template_and_retries(self):
+        """Test that a half-built template is dropped and rebuilt instead of cloned"""
+        from challenges import CHALLENGES
+        from docker_postgres_container import challenge_template_name
+
+        challenge = next(c for c in CHALLENGES if c["id"] == 1)
+        template = challenge_template_name(challenge)
+        pool, docker_client, fake_postgres = self.make_pool(
+            FakePostgres(fail_on=challenge["seed_sql"], failures=1), target_size=1)
+        pool.warm()
+        lease = pool.acquire(challenge)
+        pool.release(lease)
+
+        statements = [statement for _, statement in fake_postgres.statements]
+        drop = statements.index(f'DROP DATABASE IF EXISTS "{template}" WITH (FORCE)')
+        assert statements.index(f'CREATE DATABASE "{template}"') < drop
+        assert statements[drop + 1:].count(f'CREATE DATABASE "{template}"') == 1
+        assert (template, challenge["seed_sql"]) in fake_postgres.statements
+        # The retry succeeded, so the leased container was kept
+        assert docker_client.started[0].stopped is False
+
+    def test_failed_recycle_replaces_container(self):
+        """Test that a container whose database cannot be dropped is destroyed"""
+        import time
+        from challenges import CHALLENGES
+
+        pool, docker_client, fake_postgres = self.make_pool(FakePostgres(fail_on="DROP DATABASE"), target_size=1)
+        pool.warm()
+        lease = pool.acquire(CHALLENGES[0])
+        pool.release(lease)
+        assert docker_client.started[0].stopped is True
+
+        deadline = time.time() + 2
+        while len(pool.idle) < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(pool.idle) == 1
+        assert len(docker_client.started) == 2
+
+    def test_container_manager_uses_pool(self):
+        """Test that DockerPostgresContainer hands out pooled databases"""
+        from docker_postgres_container import DockerPostgresContainer
+
+        pool, docker_client, fake_postgres = self.make_pool(target_size=1)
+        container = DockerPostgresContainer(docker_client=docker_client, pool=pool)
+        environment = container.create_challenge_container(1, "test")
+        assert environment["db_url"].endswith("/" + environment["database"])
+        container.cleanup_container(environment)
+        assert container.active_containers == {}
+        assert len(pool.idle) >= 1
+
+    def test_invalid_queries_never_lease_a_container(self):
+        """Test that multiple statements and transaction control are rejected up front"""
+        from docker_postgres_container import DockerChallengeManager, DockerPostgresContainer
+
+        pool, docker_client, fake_postgres = self.make_pool(target_size=1)
+        manager = DockerChallengeManager(DockerPostgresContainer(docker_client=docker_client, pool=pool))
+        for query in ["SELECT * FROM products; DROP TABLE products", "COMMIT"]:
+            result = manager.execute_challenge(1, "test", query)
+            assert result["success"] is False
+        assert docker_client.started == []
+
+@pytest.fixture(scope="module")
+def postgres_url(tmp_path_factory):
+    """Admin URL of a Postgres server: POSTGRES_TEST_URL, or a throwaway one launched from local binaries"""
+    import shutil
+    import socket
+    import subprocess
+
+    if os.getenv("POSTGRES_TEST_URL"):
+        yield os.environ["POSTGRES_TEST_URL"]
+        return
+
+    bin_dir = os.getenv("POSTGRES_BIN_DIR")
+    initdb = os.path.join(bin_dir, "initdb") if bin_dir else shutil.which("initdb")
+    pg_ctl = os.path.join(bin_dir, "pg_ctl") if bin_dir else shutil.which("pg_ctl")
+    if not initdb or not pg_ctl or not os.path.exists(initdb):
+        pytest.skip("Postgres binaries not found (set POSTGRES_BIN_DIR or POSTGRES_TEST_URL)")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("Postgres refuses to run as root (set POSTGRES_TEST_URL)")
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    base = tmp_path_factory.mktemp("postgres")
+    data_dir = str(base / "data")
+    subprocess.run([initdb, "-D", data_dir, "-U", "postgres", "-A", "trust"], check=True, capture_output=True)
+    subprocess.run([pg_ctl, "-D", data_dir, "-l", str(base / "server.log"), "-w", "start",
+                    "-o", f"-p {port} -k {base} -c listen_addresses=127.0.0.1"], check=True, capture_output=True)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", data_dir, "-m", "immediate", "stop"], capture_output=True)
+
+class TestPostgresEngine:
+    """Test the single-server Postgres engine against a real server"""
+
+    @pytest.fixture
+    def manager(self, postgres_url):
+        from postgres_container import PostgresContainer, PostgresChallengeManager
+
+        manager = PostgresChallengeManager(PostgresContainer(postgres_url, statement_timeout_ms=200))
+        yield manager
+        manager.container.close_all()
+
+    def test_reference_queries(self, manager):
+        """Test that every small challenge's reference solution passes on Postgres"""
+        from challenges import CHALLENGES
+
+        for challenge in CHALLENGES:
+            if challenge.get("dataset"):
+                continue
+            query = challenge.get("postgres_reference_query", challenge["reference_query"])
+            result = manager.execute_challenge(challenge["id"], "test", query)
+            assert result["passed"], f"Challenge {challenge['id']} Postgres reference query failed"
+
+    def test_changes_are_rolled_back(self, manager):
+        """Test that a mutating submission never reaches the next one"""
+        result = manager.execute_challenge(1, "test", "DELETE FROM products")
+        assert result["success"] is True
+        assert result["rows_affected"] == 5
+
+        result = manager.execute_challenge(1, "test", "SELECT COUNT(*) FROM products")
+        assert result["results"] == [["5"]]
+
+    def test_template_built_once(self, manager, postgres_url):
+        """Test that repeated submissions reuse the challenge database"""
+        import psycopg2
+        from challenges import CHALLENGES
+        from postgres_container import challenge_database_name
+
+        for _ in range(3):
+            manager.execute_challenge(2, "test", "SELECT 1")
+        conn = psycopg2.connect(postgres_url)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM pg_database WHERE starts_with(datname, 'chl_2_')")
+            assert cursor.fetchone()[0] == 1
+        finally:
+            conn.close()
+        challenge = next(c for c in CHALLENGES if c["id"] == 2)
+        assert list(manager.container._pools) == [challenge_database_name(challenge)]
+
+    def test_statement_timeout(self, manager):
+        """Test that slow queries are cancelled and the connection is reusable"""
+        result = manager.execute_challenge(1, "test", "SELECT pg_sleep(2)")
+        assert result["success"] is False
+        assert result["timed_out"] is True
+
+        result = manager.execute_challenge(1, "test", "SELECT * FROM products")
+        assert result["passed"] is True
+
+    def test_runs_unprivileged(self, manager):
+        """Test that submissions do not run as the admin role"""
+        result = manager.execute_challenge(1, "test", "SELECT current_setting('is_superuser')")
+        assert result["results"] == [["off"]]
+
+    def test_transaction_control_rejected(self, manager):
+        """Test that a submission cannot end its own transaction"""
+        for query in ["COMMIT", "SELECT 1; COMMIT", "DELETE FROM products; SELECT 1"]:
+            result = manager.execute_challenge(1, "test", query)
+            assert result["success"] is False
+
+        result = manager.execute_challenge(1, "test", "SELECT ';' AS semicolon;")
+        assert result["results"] == [[";"]]
+
+    def test_postgres_submit(self, manager, monkeypatch):
+        """Test the database_type="postgres" submit path"""
+        from engines import ENGINE_REGISTRY
+
+        monkeypatch.setitem(ENGINE_REGISTRY, "postgres", manager)
+        response = client.post("/auth/signup", json={"email": "pg@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products", "database_type": "postgres"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["passed"] is True
+
+class RailwayStandIn:
+    """Local stand-in for the Railway GraphQL API that provisions databases on a real server"""
+
+    def __init__(self, postgres_url):
+        self.postgres_url = postgres_url
+        self.calls = []
+
+    async def handle(self, request):
+        import asyncpg
+        from aiohttp import web
+
+        body = await request.json()
+        name = body["variables"]["input"]["name"]
+        admin = await asyncpg.connect(self.postgres_url)
+        try:
+            if "createDatabase" in body["query"]:
+                self.calls.append(("create", name))
+                await admin.execute(f'DROP DATABASE IF EXISTS "{name}"')
+                await admin.execute(f'CREATE DATABASE "{name}"')
+                url = self.postgres_url.rsplit("/", 1)[0] + "/" + name
+                return web.json_response({"data": {"createDatabase": {"id": name, "name": name, "connectionString": url}}})
+            self.calls.append(("delete", name))
+            await admin.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+            return web.json_response({"data": {"deleteDatabase": {"id": name}}})
+        finally:
+            await admin.close()
+
+    async def run(self, scenario, **pool_kwargs):
+        """Serve the stand-in and run scenario(manager, pool) against a fresh database pool"""
+        from aiohttp import web
+        from railway_postgres_container import (RailwayGraphQLClient, RailwayDatabasePool,
+                                                RailwayPostgresContainer, RailwayChallengeManager)
+
+        app = web.Application()
+        app.router.add_post("/graphql/v2", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        api = RailwayGraphQLClient("token", "project", api_url=f"http://127.0.0.1:{port}/graphql/v2")
+        pool = RailwayDatabasePool(api, prefix="railway-test", **pool_kwargs)
+        manager = RailwayChallengeManager(RailwayPostgresContainer(pool, statement_timeout_ms=200))
+        try:
+            return await scenario(manager, pool)
+        finally:
+            await pool.close(delete=True)
+            await runner.cleanup()
+
+class TestRailwayPostgres:
+    """Test the async Railway engine against a local GraphQL stand-in"""
+
+    def test_databases_provisioned_once_and_reset(self, postgres_url):
+        """Test that submissions reuse pooled databases instead of calling the API"""
+        import asyncio
+        from challenges import CHALLENGES
+
+        first, second = CHALLENGES[0], CHALLENGES[1]
+
+        async def scenario(manager, pool):
+            results = [
+                await manager.execute_challenge(first["id"], "test", first["reference_query"]),
+                await manager.execute_challenge(first["id"], "test", "DELETE FROM products"),
+                await manager.execute_challenge(first["id"], "test", "SELECT COUNT(*) FROM products"),
+                await manager.execute_challenge(second["id"], "test", second["reference_query"]),
+                await manager.execute_challenge(first["id"], "test", first["reference_query"]),
+            ]
+            return results, pool.resets
+
+        stand_in = RailwayStandIn(postgres_url)
+        results, resets = asyncio.run(stand_in.run(scenario, size=1))
+        assert stand_in.calls[0] == ("create", "railway-test-0")
+        assert [call for call, _ in stand_in.calls] == ["create", "delete"]
+        assert results[0]["passed"] and results[3]["passed"] and results[4]["passed"]
+        assert results[1]["rows_affected"] == 5
+        assert results[2]["results"] == [["5"]]
+        assert resets == 3
+
+    def test_submissions_run_as_runner_role(self, postgres_url):
+        """Test that submissions cannot use the provisioned owner's privileges"""
+        import asyncio
+        from railway_postgres_container import RAILWAY_RUNNER_ROLE
+
+        async def scenario(manager, pool):
+            return [
+                await manager.execute_challenge(1, "test", "SELECT current_user"),
+                await manager.execute_challenge(1, "test", "DROP TABLE products"),
+                await manager.execute_challenge(1, "test", "SELECT COUNT(*) FROM products"),
+            ]
+
+        results = asyncio.run(RailwayStandIn(postgres_url).run(scenario, size=1))
+        assert results[0]["results"] == [[RAILWAY_RUNNER_ROLE]]
+        assert results[1]["success"] is False and "owner" in results[1]["error"]
+        assert results[2]["results"] == [["5"]]
+
+    def test_event_loop_not_blocked(self, postgres_url):
+        """Test that a slow query leaves the event loop free and times out"""
+        import asyncio
+
+        async def scenario(manager, pool):
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.02)
+                    ticks += 1
+
+            await pool.warm()
+            task = asyncio.create_task(ticker())
+            result = await manager.execute_challenge(1, "test", "SELECT pg_sleep(1)")
+            task.cancel()
+            return result, ticks
+
+        result, ticks = asyncio.run(RailwayStandIn(postgres_url).run(scenario, size=2))
+        assert result["timed_out"] is True
+        assert ticks >= 3
+
+    def test_concurrent_leases(self, postgres_url):
+        """Test that concurrent submissions share the provisioned databases"""
+        import asyncio
+
+        async def scenario(manager, pool):
+            return await asyncio.gather(*(
+                manager.execute_challenge(1, "test", "SELECT * FROM products") for _ in range(6)
+            ))
+
+        stand_in = RailwayStandIn(postgres_url)
+        results = asyncio.run(stand_in.run(scenario, size=2))
+        assert all(result["passed"] for result in results)
+        assert [call for call, _ in stand_in.calls].count("create") == 2
+
+class TestEngineScheduler:
+    """Test the engine registry and the shared scheduler"""
+
+    def test_registry(self):
+        """Test that every engine registers with its capabilities"""
+        import engine_scheduler
+        from engines import ENGINE_REGISTRY, get_engine
+
+        assert {"sqlite", "duckdb", "postgres", "docker_postgres", "railway", "atomic_structure"} <= set(ENGINE_REGISTRY)
+        assert get_engine("SQLite").capabilities.read_only_sharing is True
+        assert get_engine("postgres").capabilities.transactional_reset is True
+        assert get_engine("railway").capabilities.asynchronous is True
+        assert get_engine("docker_postgres").capabilities.cancellation is False
+
+    def test_read_only_results_cached(self):
+        """Test that repeated read-only queries are served from the cache"""
+        from engine_scheduler import EngineScheduler
+
+        scheduler = EngineScheduler(max_workers=2)
+        first = scheduler.execute("sqlite", 1, "test", "SELECT * FROM products")
+        second = scheduler.execute("sqlite", 1, "test", "SELECT *\n  FROM products;")
+        assert first["passed"] is True and "cached" not in first
+        assert second["passed"] is True and second["cached"] is True
+
+        scheduler.execute("sqlite", 1, "test", "DELETE FROM products")
+        result = scheduler.execute("sqlite", 1, "test", "DELETE FROM products")
+        assert "cached" not in result
+        assert "cached" not in scheduler.execute("sqlite", 1, "test", "SELECT random() FROM products")
+
+        metrics = scheduler.metrics()["engines"]["sqlite"]["metrics"]
+        assert metrics["submissions"] == 5
+        assert metrics["cache_hits"] == 1
+        assert metrics["passed"] == 2
+        assert metrics["in_flight"] == 0
+
+    def test_cancellation(self):
+        """Test that SQLite and DuckDB stop a query at the deadline"""
+        import time
+        from engine_scheduler import EngineScheduler
+
+        scheduler = EngineScheduler(max_workers=2, cache_size=0)
+        queries = {
+            "sqlite": "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n",
+            "duckdb": "SELECT COUNT(*) FROM range(100000000000)",
+        }
+        for engine, query in queries.items():
+            start = time.perf_counter()
+            result = scheduler.execute(engine, 1, "test", query, timeout_s=0.2)
+            assert result["timed_out"] is True, engine
+            assert time.perf_counter() - start < 1.0
+        assert scheduler.metrics()["engines"]["duckdb"]["metrics"]["timeouts"] == 1
+
+    def test_uncancellable_engine_abandoned(self):
+        """Test that engines without cancellation are abandoned at the deadline"""
+        import time
+        from engine_scheduler import EngineScheduler
+        from engines import ExecutionEngine
+
+        class SleepyEngine(ExecutionEngine):
+            name = "sleepy"
+
+            def execute_challenge(self, challenge_id, user_id, user_query, timeout_s=None):
+                assert timeout_s is None
+                time.sleep(0.5)
+                return {"success": True, "passed": True}
+
+        scheduler = EngineScheduler(max_workers=2)
+        result = scheduler.execute(SleepyEngine(), 1, "test", "SELECT 1", timeout_s=0.1)
+        assert result["timed_out"] is True
+        assert scheduler.metrics_for("sleepy").snapshot()["abandoned"] == 1
+
+    def test_async_engine(self):
+        """Test that coroutine engines run on the scheduler's event loop from sync and async callers"""
+        import asyncio
+        import threading
+        from engine_scheduler import EngineScheduler
+        from engines import ExecutionEngine, EngineCapabilities
+
+        class AsyncEngine(ExecutionEngine):
+            name = "async_test"
+            capabilities = EngineCapabilities(asynchronous=True)
+
+            async def execute_challenge(self, challenge_id, user_id, user_query, timeout_s=None):
+                await asyncio.sleep(0.01)
+                return {"success": True, "passed": True, "thread": threading.current_thread().name}
+
+        scheduler = EngineScheduler(max_workers=2)
+        engine = AsyncEngine()
+        assert scheduler.execute(engine, 1, "test", "SELECT 1")["thread"] == "engine-loop"
+        result = asyncio.run(scheduler.execute_async(engine, 1, "test", "SELECT 1"))
+        assert result["passed"] is True and result["thread"] == "engine-loop"
+
+    def test_unknown_engine_defaults_to_sqlite(self):
+        """Test that the submit endpoint still falls back to SQLite"""
+        response = client.post("/auth/signup", json={"email": "engine@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products", "database_type": "unknown"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["passed"] is True
+
+class TestSubmissionAdmission:
+    """Test bounded submission concurrency on the async submit endpoint"""
+
+    def test_saturated_submit_returns_429(self, monkeypatch):
+        """Test that a full admission controller answers 429 with Retry-After"""
+        import main
+        from submission_admission import AdmissionController
+
+        response = client.post("/auth/signup", json={"email": "busy@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+        admission = AdmissionController(limit=1, retry_after_s=3)
+        monkeypatch.setattr(main, "submission_admission", admission)
+
+        assert admission.try_acquire() is True
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "3"
+
+        admission.release()
+        response = client.post(
+            "/challenges/1/submit",
+            json={"user_query": "SELECT * FROM products"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["passed"] is True
+        assert admission.snapshot() == {"limit": 1, "in_flight": 0, "admitted": 2, "rejected": 1, "retry_after_s": 3}
+
+    def test_failed_submission_releases_slot(self, monkeypatch):
+        """Test that error responses give their admission slot back"""
+        import main
+        from submission_admission import AdmissionController
+
+        response = client.post("/auth/signup", json={"email": "error@example.com", "password": "password123"})
+        token = response.json()["access_token"]
+        admission = AdmissionController(limit=1)
+        monkeypatch.setattr(main, "submission_admission", admission)
+
+        for _ in range(2):
+            response = client.post(
+                "/challenges/1/submit",
+                json={"user_query": "SELECT * FROM missing_table"},
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == 400
+        assert admission.snapshot()["in_flight"] == 0
+
+class TestSubmissionJobs:
+    """Test async submissions via the job queue"""
+
+    def setup_method(self):
+        # Cached results skip the engine, and with it the setup/execute/validate stages
+        from engine_scheduler import engine_scheduler
+        engine_scheduler.clear_cache()
+
+    def _token(self, email):
+        response = client.post("/auth/signup", json={"email": email, "password": "password123"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    def _wait(self, job_id, headers):
+        import time
+        for _ in range(200):
+            job = client.get(f"/jobs/{job_id}", headers=headers).json()
+            if job["status"] in ("completed", "failed"):
+                return job
+            time.sleep(0.05)
+        raise AssertionError(f"job {job_id} did not finish")
+
+    def test_async_submit_returns_job(self):
+        """Test that ?async=true answers 202 and the job reports stages and the result"""
+        headers = self._token("async@example.com")
+        response = client.post(
+            "/challenges/1/submit?async=true",
+            json={"user_query": "SELECT * FROM products"},
+            headers=headers
+        )
+        assert response.status_code == 202
+        data = response.json()
+        assert data["status"] == "queued"
+        assert data["status_url"] == f"/jobs/{data['job_id']}"
+
+        job = self._wait(data["job_id"], headers)
+        assert job["status"] == "completed"
+        assert job["result"]["passed"] is True
+        assert [s["stage"] for s in job["stages"]] == ["queued", "setting_up", "executing", "validating"]
+
+        # The submission is recorded like a synchronous one
+        progress = client.get("/user/progress", headers=headers).json()["progress"]
+        assert [p["challenge_id"] for p in progress] == [1]
+
+    def test_failed_job_keeps_error(self):
+        """Test that a query error ends the job as failed with the 400 detail"""
+        headers = self._token("asyncfail@example.com")
+        response = client.post(
+            "/challenges/1/submit?async=true",
+            json={"user_query": "SELECT * FROM missing_table"},
+            headers=headers
+        )
+        job = self._wait(response.json()["job_id"], headers)
+        assert job["status"] == "failed"
+        assert job["status_code"] == 400
+        assert "missing_table" in job["error"]
+
+    def test_job_events_stream(self):
+        """Test that the SSE stream sends each stage and then the result"""
+        import json
+        headers = self._token("sse@example.com")
+        response = client.post(
+            "/challenges/1/submit?async=true",
+            json={"user_query": "SELECT * FROM products"},
+            headers=headers
+        )
+        job_id = response.json()["job_id"]
+
+        response = client.get(f"/jobs/{job_id}/events", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        assert [lines[0] for lines in events] == ["event: stage"] * 4 + ["event: result"]
+        assert json.loads(events[-1][1][len("data: "):])["result"]["passed"] is True
+
+    def test_jobs_are_private(self):
+        """Test that other users cannot read a job"""
+        headers = self._token("owner@example.com")
+        response = client.post(
+            "/challenges/1/submit?async=true",
+            json={"user_query": "SELECT * FROM products"},
+            headers=headers
+        )
+        job_id = response.json()["job_id"]
+        self._wait(job_id, headers)
+
+        other = self._token("other@example.com")
+        assert client.get(f"/jobs/{job_id}", headers=other).status_code == 404
+        assert client.get("/jobs/unknown", headers=headers).status_code == 404
+
+    def test_full_queue_returns_429(self, monkeypatch):
+        """Test that async submissions are turned away when the queue is full"""
+        import main
+        from submission_jobs import SubmissionJobQueue
+
+        headers = self._token("queuefull@example.com")
+        monkeypatch.setattr(main, "submission_job_queue", SubmissionJobQueue(workers=1, limit=0))
+        response = client.post(
+            "/challenges/1/submit?async=true",
+            json={"user_query": "SELECT * FROM products"},
+            headers=headers
+        )
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+class TestBatchGrading:
+    """Test the NDJSON batch grading endpoint"""
+
+    def _setup(self, monkeypatch):
+        monkeypatch.setenv("ADMIN_EMAILS", "grader@example.com")
+        admin = client.post("/auth/signup", json={"email": "grader@example.com", "password": "password123"})
+        headers = {"Authorization": f"Bearer {admin.json()['access_token']}"}
+        for email in ("student1@example.com", "student2@example.com"):
+            client.post("/auth/signup", json={"email": email, "password": "password123"})
+        conn = sqlite3.connect("test_users.db")
+        ids = dict(conn.execute("SELECT email, id FROM users").fetchall())
+        conn.close()
+        return headers, ids["student1@example.com"], ids["student2@example.com"]
+
+    def _grade(self, items, headers):
+        import json
+        response = client.post("/admin/batch-grade", json={"items": items}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        return {line["index"]: line for line in lines[:-1]}, lines[-1]["summary"]
+
+    def test_batch_grades_and_records(self, monkeypatch):
+        """Test per-item verdicts, rejected items and recording for a mixed batch"""
+        headers, student1, student2 = self._setup(monkeypatch)
+        items = [
+            {"user_id": student1, "challenge_id": 1, "query": "SELECT * FROM products"},
+            {"user_id": student2, "challenge_id": 1, "query": "SELECT name FROM products"},
+            {"user_id": student1, "challenge_id": 1, "query": "SELECT * FROM products", "engine": "duckdb"},
+            {"user_id": student2, "challenge_id": 1, "query": "SELECT * FROM missing_table"},
+            {"user_id": 999999, "challenge_id": 1, "query": "SELECT * FROM products"},
+            {"user_id": student1, "challenge_id": 9999, "query": "SELECT 1"},
+        ]
+        verdicts, summary = self._grade(items, headers)
+
+        assert sorted(verdicts) == list(range(6))
+        assert verdicts[0]["passed"] is True and verdicts[0]["engine"] == "sqlite"
+        assert verdicts[1]["success"] is True and verdicts[1]["passed"] is False
+        assert verdicts[2]["passed"] is True and verdicts[2]["engine"] == "duckdb"
+        assert verdicts[3]["success"] is False and "missing_table" in verdicts[3]["error"]
+        assert verdicts[4]["error"] == "User not found"
+        assert verdicts[5]["error"] == "Challenge not found"
+        assert summary["items"] == 6 and summary["graded"] == 4
+        assert summary["passed"] == 2 and summary["rejected"] == 2
+
+        conn = sqlite3.connect("test_users.db")
+        submissions = conn.execute("SELECT COUNT(*) FROM user_submissions").fetchone()[0]
+        progress = conn.execute("SELECT user_id, attempts, solved_at IS NOT NULL FROM user_progress "
+                                "ORDER BY user_id").fetchall()
+        conn.close()
+        assert submissions == 4
+        assert progress == [(student1, 2, 1), (student2, 2, 0)]
+
+    def test_groups_warm_once(self, monkeypatch):
+        """Test that each engine/challenge group is warmed once however many items it has"""
+        from engines import ExecutionEngine, ENGINE_REGISTRY
+
+        class CountingEngine(ExecutionEngine):
+            name = "counting"
+
+            def __init__(self):
+                self.warmed = []
+
+            def warm(self, challenge_id):
+                self.warmed.append(challenge_id)
+
+            def execute_challenge(self, challenge_id, user_id, user_query, timeout_s=None):
+                return {"success": True, "passed": True, "results": [], "columns": [], "row_count": 0}
+
+        engine = CountingEngine()
+        monkeypatch.setitem(ENGINE_REGISTRY, "counting", engine)
+        headers, student1, student2 = self._setup(monkeypatch)
+        items = [{"user_id": user_id, "challenge_id": challenge_id, "query": f"SELECT {n}", "engine": "counting"}
+                 for n in range(10) for user_id in (student1, student2) for challenge_id in (1, 2)]
+        verdicts, summary = self._grade(items, headers)
+
+        assert sorted(engine.warmed) == [1, 2]
+        assert summary["graded"] == 40 and summary["passed"] == 40
+
+    def test_batch_requires_admin_and_limit(self, monkeypatch):
+        """Test that batch grading is admin-only and bounded in size"""
+        import main
+
+        headers, student1, _ = self._setup(monkeypatch)
+        student = client.post("/auth/login", json={"email": "student1@example.com", "password": "password123"})
+        items = [{"user_id": student1, "challenge_id": 1, "query": "SELECT * FROM products"}] * 3
+        response = client.post("/admin/batch-grade", json={"items": items},
+                               headers={"Authorization": f"Bearer {student.json()['access_token']}"})
+        assert response.status_code == 403
+
+        monkeypatch.setattr(main, "BATCH_MAX_ITEMS", 2)
+        response = client.post("/admin/batch-grade", json={"items": items}, headers=headers)
+        assert response.status_code == 413
+
+    def test_disconnect_keeps_graded_items(self, monkeypatch):
+        """Test that items are recorded in chunks and that closing the stream early records the rest"""
+        import main
+
+        headers, student1, _ = self._setup(monkeypatch)
+        monkeypatch.setattr(main, "BATCH_RECORD_CHUNK", 2)
+        # Keep the generator itself, so the test can stop reading like a disconnecting client
+        monkeypatch.setattr(main, "StreamingResponse", lambda content, media_type: content)
+        items = [main.BatchGradeItem(user_id=student1, challenge_id=1, query=f"SELECT * FROM products LIMIT {n}")
+                 for n in range(5)]
+
+        def recorded():
+            conn = sqlite3.connect("test_users.db")
+            try:
+                return conn.execute("SELECT COUNT(*) FROM user_submissions WHERE user_id = ?", (student1,)).fetchone()[0]
+            finally:
+                conn.close()
+
+        stream = main.batch_grade(main.BatchGradeRequest(items=items), admin_email="grader@example.com")
+        next(stream)
+        next(stream)
+        assert recorded() == 2
+        next(stream)
+        stream.close()
+        assert recorded() == 3
+
+class TestRegrade:
+    """Test the offline regrading CLI"""
+
+    def _corrupted_database(self, tmp_path):
+        """A generated database whose challenge 1 verdicts are all wrong, plus the true state"""
+        from bench.generate_data import generate_database
+
+        db_path = str(tmp_path / "regrade.db")
+        generate_database(db_path, users=40, submissions=1500, seed=5)
+        conn = sqlite3.connect(db_path)
+        truth = (conn.execute("SELECT id, passed FROM user_submissions ORDER BY id").fetchall(),
+                 conn.execute("SELECT user_id, challenge_id, solved_at FROM user_progress ORDER BY 1, 2").fetchall())
+        conn.execute("UPDATE user_submissions SET passed = 1 - passed WHERE challenge_id = 1")
+        conn.execute("UPDATE user_progress SET solved_at = '2000-01-01 00:00:00' WHERE challenge_id = 1")
+        conn.commit()
+        conn.close()
+        return db_path, truth
+
+    def _state(self, db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            return (conn.execute("SELECT id, passed FROM user_submissions ORDER BY id").fetchall(),
+                    conn.execute("SELECT user_id, challenge_id, solved_at FROM user_progress ORDER BY 1, 2").fetchall())
+        finally:
+            conn.close()
+
+    def test_regrade_restores_verdicts_and_progress(self, tmp_path):
+        """Test that regrading recomputes passed and solved_at, executing each distinct query once"""
+        from regrade import Regrader
+
+        db_path, truth = self._corrupted_database(tmp_path)
+        summary = Regrader(db_path, [1, 2], workers=2, batch_size=100).run()
+
+        assert summary["complete"] is True
+        assert self._state(db_path) == truth
+        # Every submission is either the reference query or the reference query with LIMIT 0
+        assert summary["executed"] == 4
+        assert summary["changed"] > 0 and summary["submissions_per_s"] > 0
+
+    def test_regrade_resumes_from_checkpoint(self, tmp_path):
+        """Test that an interrupted run continues after the last committed batch"""
+        from regrade import Regrader
+
+        db_path, truth = self._corrupted_database(tmp_path)
+        first = Regrader(db_path, [1], workers=1, batch_size=20).run(max_batches=2)
+        assert first["complete"] is False and first["submissions"] == 40
+
+        second = Regrader(db_path, [1], workers=1, batch_size=20).run()
+        assert second["resumed_from"] == first["last_id"]
+        assert second["complete"] is True
+        assert self._state(db_path) == truth
+
+    def test_engine_errors_leave_the_database_untouched(self, tmp_path, monkeypatch):
+        """Test that an engine that raises aborts the run instead of failing every submission"""
+        from challenge_container import challenge_manager
+        from regrade import Regrader
+
+        db_path, _ = self._corrupted_database(tmp_path)
+        before = self._state(db_path)
+
+        def unreachable(*args, **kwargs):
+            raise ConnectionError("Connection refused")
+
+        # Workers are forked after the patch, so they inherit it
+        monkeypatch.setattr(challenge_manager, "execute_challenge", unreachable)
+        summary = Regrader(db_path, [1], workers=1, batch_size=100).run()
+        assert summary["aborted"] and summary["complete"] is False
+        assert summary["changed"] == 0 and summary["last_id"] == 0
+        assert self._state(db_path) == before
+
+        monkeypatch.setattr(challenge_manager, "warm", unreachable)
+        summary = Regrader(db_path, [1], workers=1, batch_size=100).run()
+        assert "could not be warmed" in summary["aborted"]
+        assert self._state(db_path) == before
+
+    def test_verdicts_separate_wrong_answers_from_engine_errors(self):
+        """Test that only the query's own failures count as wrong answers"""
+        from engines import timed_out_result
+        from regrade import verdict, PASS, FAIL, ERROR
+
+        assert verdict({"success": True, "passed": True}) == PASS
+        assert verdict({"success": True, "passed": False}) == FAIL
+        assert verdict({"success": False, "error": "no such table: prods"}) == FAIL
+        assert verdict(timed_out_result(1)) == ERROR
+        assert verdict({"success": False, "error": "Database connection failed: refused"}) == ERROR
+
+    def test_asynchronous_engines_reuse_one_event_loop(self, monkeypatch):
+        """Test that every async submission in a worker runs on the same loop its pools are bound to"""
+        import asyncio
+        from engines import ENGINE_REGISTRY, EngineCapabilities, ExecutionEngine
+        from regrade import grade_query, PASS
+
+        class LoopBoundEngine(ExecutionEngine):
+            name = "loop_bound"
+            capabilities = EngineCapabilities(asynchronous=True)
+            loop = None
+
+            async def execute_challenge(self, challenge_id, user_id, user_query, timeout_s=None):
+                loop = asyncio.get_running_loop()
+                if self.loop is not None and self.loop is not loop:
+                    raise RuntimeError("attached to a different loop")
+                self.loop = loop
+                return {"success": True, "passed": True}
+
+        monkeypatch.setitem(ENGINE_REGISTRY, "loop_bound", LoopBoundEngine())
+        assert [grade_query("loop_bound", 1, "SELECT 1") for _ in range(3)] == [PASS] * 3
+
+class TestResultValidation:
+    """Test precomputed, order-aware result validation"""
+
+    def test_top_level_order_by(self):
+        """Test that only the outermost ORDER BY makes a challenge order-sensitive"""
+        from result_validation import has_top_level_order_by
+
+        assert has_top_level_order_by("SELECT * FROM t ORDER BY id")
+        assert not has_top_level_order_by("SELECT SUM(x) OVER (ORDER BY id) FROM t")
+        assert not has_top_level_order_by("SELECT * FROM (SELECT * FROM t ORDER BY id LIMIT 2)")
+        assert not has_top_level_order_by("SELECT 'order by' FROM t -- ORDER BY id")
+
+    def test_matcher_stops_early(self):
+        """Test multiset matching and stopping at the first impossible or excess row"""
+        from result_validation import ExpectedResult
+
+        expected = ExpectedResult({"id": 0, "reference_query": "SELECT x FROM t",
+                                   "expected_output": [["a"], ["b"], ["a"]]})
+        matcher = expected.matcher()
+        assert matcher.feed_many([["a"], ["a"], ["b"]]) and matcher.finish()
+
+        matcher = expected.matcher()
+        assert matcher.feed(["a"]) and matcher.feed(["a"])
+        assert matcher.feed(["a"]) is False and matcher.rows == 3
+
+        matcher = expected.matcher()
+        assert matcher.feed_many([["b"], ["a"], ["a"]])
+        assert matcher.feed(["c"]) is False and matcher.finish() is False
+
+    def test_row_order_only_matters_when_the_reference_sorts(self):
+        """Test that unordered challenges accept any row order on SQLite and DuckDB"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+
+        for manager in (challenge_manager, duckdb_challenge_manager):
+            # Challenge 1's reference has no ORDER BY
+            result = manager.execute_challenge(1, "test", "SELECT * FROM products ORDER BY id DESC")
+            assert result["passed"] is True
+            # Challenge 7 sorts by price, so the order is part of the answer
+            result = manager.execute_challenge(7, "test", "SELECT * FROM products ORDER BY price ASC")
+            assert result["passed"] is False
+
+    def test_failed_large_result_is_truncated(self):
+        """Test that SQLite stops fetching a failing result after the preview rows"""
+        from challenge_container import challenge_manager
+        from result_validation import RESULT_PREVIEW_ROWS
+
+        query = "SELECT a.id FROM products a, products b, products c, products d, products e, products f"
+        result = challenge_manager.execute_challenge(1, "test", query)
+        assert result["passed"] is False
+        assert result["truncated"] is True
+        assert len(result["results"]) == RESULT_PREVIEW_ROWS
+        assert result["row_count"] < 5 ** 6
+
+    def test_numeric_cells_match_with_tolerance(self):
+        """Test that numeric columns compare values, not their spelling"""
+        from decimal import Decimal
+        from result_validation import ExpectedResult, NUMERIC, TEXT
+
+        expected = ExpectedResult({"id": 0, "reference_query": "SELECT name, total FROM t ORDER BY name",
+                                   "expected_output": [["a", "1200.0"], ["b", "None"], ["c", "0.1"]]})
+        assert expected.kinds == [TEXT, NUMERIC]
+
+        matcher = expected.matcher()
+        assert matcher.feed_many([("a", 1200), ("b", None), ("c", 0.1 + 1e-12)]) and matcher.finish()
+        matcher = expected.matcher()
+        assert matcher.feed_many([["a", "1200"], ["b", "None"], ["c", Decimal("0.10")]]) and matcher.finish()
+        # Text in a numeric column and values outside the tolerance do not match
+        assert expected.matcher().feed(("a", "twelve hundred")) is False
+        assert expected.matcher().feed(("a", 1200.01)) is False
+
+    def test_duckdb_compares_typed_columns(self):
+        """Test DuckDB's columnar comparison of raw values against the typed expected vectors"""
+        import pyarrow as pa
+        from duckdb_container import duckdb_challenge_manager
+        from result_validation import ExpectedResult
+
+        expected = ExpectedResult({"id": 0, "reference_query": "SELECT name, total FROM t",
+                                   "expected_output": [["a", "2.5"], ["b", "10"]]})
+        table = pa.table({"name": ["b", "a"], "total": pa.array([10.0, 2.5000000001], pa.float64())})
+        assert duckdb_challenge_manager._table_matches(table, expected) is True
+        table = pa.table({"name": ["b", "a"], "total": ["10", "x"]})
+        assert duckdb_challenge_manager._table_matches(table, expected) is False
+
+class TestResultDiff:
+    """Test the row-level diff returned for failed submissions"""
+
+    def test_unordered_diff_reports_missing_and_extra_rows(self):
+        """Test the hash-join diff of an order-insensitive challenge"""
+        from challenge_container import challenge_manager
+        from engines import find_challenge
+        from result_validation import diff_result
+
+        challenge = find_challenge(1)
+        result = challenge_manager.execute_challenge(
+            1, "test", "SELECT id, name, price * 2, category FROM products WHERE id > 3 ORDER BY id DESC")
+        diff = diff_result(challenge, result)
+        assert diff["ordered"] is False and diff["columns"]["count_matches"] is True
+        assert diff["missing_row_count"] == 5 and diff["extra_row_count"] == 2
+        assert diff["extra_rows"][0][0] == "5"
+
+        result = challenge_manager.execute_challenge(1, "test", "SELECT * FROM products WHERE id <> 2")
+        diff = diff_result(challenge, result)
+        assert diff["missing_rows"] == [challenge["expected_output"][1]] and diff["extra_row_count"] == 0
+
+    def test_ordered_diff_walks_rows_in_order(self):
+        """Test the merge diff of an ordered challenge"""
+        from challenge_container import challenge_manager
+        from engines import find_challenge
+        from result_validation import diff_result
+
+        challenge = find_challenge(7)
+        result = challenge_manager.execute_challenge(7, "test", "SELECT * FROM products ORDER BY price ASC")
+        diff = diff_result(challenge, result)
+        assert diff["ordered"] is True and diff["same_rows_wrong_order"] is True
+        assert diff["mismatched_row_count"] == 2
+        assert diff["mismatched_rows"][0]["row"] == 0
+
+        result = challenge_manager.execute_challenge(7, "test", "SELECT * FROM products ORDER BY price DESC LIMIT 1")
+        diff = diff_result(challenge, result, limit=1)
+        assert diff["mismatched_row_count"] == 0 and diff["same_rows_wrong_order"] is False
+        assert diff["missing_row_count"] == 2 and len(diff["missing_rows"]) == 1
+
+    def test_failure_response_is_truncated(self):
+        """Test that a failed submission returns previews, not whole result sets"""
+        from result_validation import DIFF_PREVIEW_ROWS
+
+        token = client.post("/auth/signup", json={"email": "diff@example.com", "password": "password123"}).json()["access_token"]
+        response = client.post("/challenges/1/submit",
+            json={"user_query": "SELECT a.* FROM products a, products b, products c"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        data = response.json()
+        assert data["passed"] is False
+        assert len(data["result"]) == DIFF_PREVIEW_ROWS
+        assert data["diff"]["row_count"] > DIFF_PREVIEW_ROWS
+        assert data["diff"]["extra_row_count"] > 0 and len(data["diff"]["extra_rows"]) <= DIFF_PREVIEW_ROWS
+
+class TestMutationChallenges:
+    """Test INSERT/UPDATE/DELETE challenges graded on table fingerprints"""
+
+    @pytest.fixture
+    def mutation_challenge(self):
+        from challenges import CHALLENGES
+
+        base = next(c for c in CHALLENGES if c["id"] == 1)
+        challenge = {
+            "id": 9001,
+            "title": "Raise Electronics Prices",
+            "schema_sql": base["schema_sql"],
+            "seed_sql": base["seed_sql"],
+            "mutation": True,
+            "reference_query": "UPDATE products SET price = price + 100 WHERE category = 'Electronics'",
+            "expected_output": [],
+        }
+        CHALLENGES.append(challenge)
+        yield challenge
+        CHALLENGES.remove(challenge)
+
+    def test_mutation_graded_on_table_state(self, mutation_challenge):
+        """Test that equivalent statements pass and wrong ones fail on SQLite and DuckDB"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+
+        for manager in (challenge_manager, duckdb_challenge_manager):
+            result = manager.execute_challenge(
+                9001, "test", "UPDATE products SET price = 100 + price WHERE category IN ('Electronics')")
+            assert result["passed"] is True, manager.name
+            assert result["tables"]["products"]["matches"] is True
+
+            result = manager.execute_challenge(9001, "test", "UPDATE products SET price = price + 100")
+            assert result["passed"] is False and result["tables"]["products"]["matches"] is False
+
+            result = manager.execute_challenge(9001, "test", "DELETE FROM products WHERE id = 1")
+            assert result["passed"] is False
+            assert result["tables"]["products"]["row_count"] == result["tables"]["products"]["expected_row_count"] - 1
+
+            # Returning rows is not a mutation
+            result = manager.execute_challenge(9001, "test", "SELECT * FROM products")
+            assert result["passed"] is False
+
+            result = manager.execute_challenge(9001, "test", "CREATE TABLE notes (id INTEGER)")
+            assert result["passed"] is False and result["tables"]["notes"]["expected_row_count"] is None
+
+    def test_fingerprint_ignores_row_order(self):
+        """Test that the SQLite aggregate is order-independent but counts duplicates"""
+        from mutation_validation import SQLiteTableFingerprint
+
+        def fingerprint(rows):
+            aggregate = SQLiteTableFingerprint()
+            for row in rows:
+                aggregate.step(*row)
+            return aggregate.finalize()
+
+        rows = [(1, "a", 1.5), (2, None, 2.0)]
+        assert fingerprint(rows) == fingerprint(rows[::-1])
+        assert fingerprint(rows) != fingerprint(rows + rows[:1])
+        assert fingerprint([(1, "2")]) != fingerprint([(1, 2)])
+
+    def test_postgres_rejects_mutation_challenges(self, mutation_challenge):
+        """Test that engines without fingerprints say so instead of failing every submission"""
+        from postgres_container import postgres_challenge_manager
+        from mutation_validation import MUTATION_ENGINE_ERROR
+
+        result = postgres_challenge_manager.execute_challenge(9001, "test", mutation_challenge["reference_query"])
+        assert result == {"success": False, "error": MUTATION_ENGINE_ERROR}
+
+class TestHiddenDatasets:
+    """Test grading on hidden datasets in parallel with the visible one"""
+
+    @pytest.fixture
+    def hidden_challenge(self):
+        from challenges import CHALLENGES
+
+        base = next(c for c in CHALLENGES if c["id"] == 3)
+        challenge = dict(base, id=9002, hidden_datasets=[
+            {"name": "no-electronics", "seed_sql": "INSERT INTO products VALUES (1, 'Chair', 150, 'Furniture');"},
+            {"name": "more-electronics", "seed_sql": """
+                INSERT INTO products VALUES (1, 'Phone', 800, 'Electronics');
+                INSERT INTO products VALUES (2, 'Tablet', 400, 'Electronics');
+                INSERT INTO products VALUES (3, 'Lamp', 40, 'Furniture');
+            """},
+        ])
+        CHALLENGES.append(challenge)
+        yield challenge
+        CHALLENGES.remove(challenge)
+
+    def test_variants_compute_expected_output(self, hidden_challenge):
+        """Test that each hidden dataset gets its own id and reference output"""
+        from hidden_datasets import hidden_dataset_grader
+
+        variants = hidden_dataset_grader.variants(hidden_challenge)
+        assert [v["id"] for v in variants] == ["9002-hidden-no-electronics", "9002-hidden-more-electronics"]
+        assert variants[0]["expected_output"] == []
+        assert variants[1]["expected_output"] == [["1", "Phone", "800", "Electronics"], ["2", "Tablet", "400", "Electronics"]]
+        assert hidden_dataset_grader.variants(hidden_challenge) is variants
+
+    def test_hardcoded_answers_fail_on_hidden_data(self, hidden_challenge):
+        """Test that a query must be right on every dataset, on SQLite and DuckDB"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+
+        for manager in (challenge_manager, duckdb_challenge_manager):
+            result = manager.execute_challenge(9002, "test", "SELECT * FROM products WHERE category = 'Electronics'")
+            assert result["passed"] is True, manager.name
+            assert result["hidden_datasets"] == {"total": 2, "passed": 2, "failed": None}
+
+            # Matches the visible seed rows only
+            result = manager.execute_challenge(9002, "test", "SELECT * FROM products WHERE id IN (1, 3)")
+            assert result["passed"] is False
+            assert result["hidden_datasets"]["failed"] is not None
+
+            # Wrong on the visible data: hidden datasets are not waited for
+            result = manager.execute_challenge(9002, "test", "SELECT * FROM products")
+            assert result["passed"] is False
+            assert result["hidden_datasets"]["passed"] == 0
+
+    def test_submit_response_reports_hidden_datasets(self, hidden_challenge):
+        """Test that the submit response says how many hidden datasets passed, without their rows"""
+        token = client.post("/auth/signup", json={"email": "hidden@example.com", "password": "password123"}).json()["access_token"]
+        response = client.post("/challenges/9002/submit",
+            json={"user_query": "SELECT * FROM products WHERE id IN (1, 3)"},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        data = response.json()
+        assert data["passed"] is False
+        assert data["hidden_datasets"]["total"] == 2
+        assert "Phone" not in response.text
+
+class TestRandomizedDatasets:
+    """Test per-user generated datasets and their cache"""
+
+    @pytest.fixture
+    def randomized_challenge(self):
+        from challenges import CHALLENGES
+
+        base = next(c for c in CHALLENGES if c["id"] == 3)
+        challenge = dict(base, id=9003, randomized={"buckets": 4, "columns": {
+            "products.price": {"min": 10, "max": 5000},
+            "products.category": {"choices": ["Electronics", "Furniture"]},
+        }})
+        CHALLENGES.append(challenge)
+        yield challenge
+        CHALLENGES.remove(challenge)
+
+    def test_generation_is_deterministic(self, randomized_challenge):
+        """Test that a bucket always gets the same data and buckets differ"""
+        from challenges import CHALLENGES
+        from randomized_datasets import generate_seed_sql, seed_bucket
+
+        assert generate_seed_sql(randomized_challenge, 1) == generate_seed_sql(randomized_challenge, 1)
+        assert len({generate_seed_sql(randomized_challenge, bucket) for bucket in range(4)}) > 1
+        assert seed_bucket(randomized_challenge, "42") == seed_bucket(randomized_challenge, "42")
+        assert seed_bucket(next(c for c in CHALLENGES if c["id"] == 3), "42") is None
+
+    def test_cache_generates_once_and_evicts_by_budget(self, randomized_challenge):
+        """Test single generation per bucket and LRU eviction with engine callbacks"""
+        from concurrent.futures import ThreadPoolExecutor
+        from randomized_datasets import RandomizedDatasetCache
+
+        cache = RandomizedDatasetCache(budget_bytes=10 ** 6)
+        with ThreadPoolExecutor(8) as pool:
+            variants = list(pool.map(lambda _: cache.variant(randomized_challenge, 2), range(16)))
+        assert cache.generated == 1 and all(v is variants[0] for v in variants)
+        assert variants[0]["id"] == "9003-bucket-2" and variants[0]["seed_bucket"] == 2
+
+        dropped = []
+        cache = RandomizedDatasetCache(budget_bytes=1)
+        cache.add_eviction_listener(lambda variant: dropped.append(variant["id"]))
+        cache.variant(randomized_challenge, 0)
+        cache.variant(randomized_challenge, 1)
+        assert dropped == ["9003-bucket-0"]
+        assert cache.snapshot()["entries"] == 1 and cache.evictions == 1
+
+    def test_each_user_graded_on_own_data(self, randomized_challenge):
+        """Test that a correct query passes for every bucket and a hardcoded one does not"""
+        from challenge_container import challenge_manager
+        from duckdb_container import duckdb_challenge_manager
+        from randomized_datasets import randomized_dataset_cache
+
+        query = "SELECT * FROM products WHERE category = 'Electronics'"
+        users = [str(user) for user in range(12)]
+        for manager in (challenge_manager, duckdb_challenge_manager):
+            for user in users:
+                result = manager.execute_challenge(9003, user, query)
+                assert result["passed"] is True, (manager.name, user)
+                assert result["seed_bucket"] == randomized_dataset_cache.for_user(randomized_challenge, user)["seed_bucket"]
+
+        # The visible catalog answer is wrong for at least some buckets
+        hardcoded = "SELECT * FROM products WHERE id IN (1, 3)"
+        verdicts = {challenge_manager.execute_challenge(9003, user, hardcoded)["passed"] for user in users}
+        assert False in verdicts
+
+    def test_evicted_databases_outlive_in_flight_environments(self, randomized_challenge, tmp_path):
+        """Test that an evicted variant's files are deleted only after the submissions using them"""
+        from challenge_container import ChallengeContainer
+        from duckdb_container import DuckDBContainer
+        from randomized_datasets import RandomizedDatasetCache
+
+        variant = RandomizedDatasetCache().variant(randomized_challenge, 0)
+        container = ChallengeContainer(shared_db_dir=str(tmp_path / "sqlite"))
+        environment = container.create_challenge_environment(variant["id"], "test", True, variant)
+        container.drop_shared_database(variant)
+        assert os.path.exists(environment["db_path"])
+        assert container.execute_query(environment, "SELECT COUNT(*) FROM products")["success"] is True
+        # Dropped while in use, then needed again: the file is taken back, not deleted
+        second = container.create_challenge_environment(variant["id"], "test", True, variant)
+        container.cleanup_environment(environment)
+        assert os.path.exists(second["db_path"])
+        container.drop_shared_database(variant)
+        container.cleanup_environment(second)
+        assert not os.path.exists(second["db_path"])
+
+        duckdb_container = DuckDBContainer(template_dir=str(tmp_path / "duckdb"))
+        template = duckdb_container._acquire_template_database(variant)
+        duckdb_container.drop_template_database(variant)
+        assert os.path.exists(template)
+        environment = duckdb_container.create_challenge_environment(variant["id"], "test", variant)
+        duckdb_container.cleanup_environment(environment)
+        duckdb_container.drop_template_database(variant)
+        duckdb_container._release_template_database(template)
+        assert not os.path.exists(template)
+
+class TestChallengeArtifacts:
+    """Test the build-time catalog compiler and the startup loader"""
+
+    def test_compile_and_load(self, tmp_path, monkeypatch):
+        """Test that compiled images are reused as is and the index loads"""
+        from challenge_artifacts import compile_catalog, ChallengeArtifacts, parse_table_schema
+        from challenge_container import ChallengeContainer
+        from duckdb_container import DuckDBContainer
+        from challenges import CHALLENGES
+
+        index = compile_catalog(str(tmp_path))
+        entry = index["challenges"]["1"]
+        assert entry["expected"]["row_count"] == 5 and entry["expected"]["ordered"] is False
+        assert index["challenges"]["201"]["images"] == {}
+        assert len(index["atomic_structure"]) > 0
+
+        # Containers pointed at the artifact directory find the images instead of seeding
+        monkeypatch.setenv("CHALLENGE_ARTIFACT_DIR", str(tmp_path))
+        monkeypatch.delenv("CHALLENGE_DB_DIR", raising=False)
+        challenge = next(c for c in CHALLENGES if c["id"] == 1)
+        sqlite_path = ChallengeContainer().get_shared_database(challenge)
+        assert sqlite_path == str(tmp_path / entry["images"]["sqlite"])
+        assert DuckDBContainer().get_template_database(challenge) == str(tmp_path / entry["images"]["duckdb"])
+
+        artifacts = ChallengeArtifacts(str(tmp_path))
+        assert artifacts.load() is True
+        assert artifacts.stale == []
+        assert artifacts.schema(challenge) == parse_table_schema(challenge["schema_sql"])
+
+    def test_stale_entries_and_wrong_references(self, tmp_path):
+        """Test that changed challenges are ignored at load and bad references fail the build"""
+        from challenge_artifacts import compile_catalog, ChallengeArtifacts
+        from challenges import CHALLENGES
+
+        compile_catalog(str(tmp_path), ["sqlite"])
+        challenge = next(c for c in CHALLENGES if c["id"] == 2)
+        original = challenge["expected_output"]
+        challenge["expected_output"] = original[:1]
+        try:
+            artifacts = ChallengeArtifacts(str(tmp_path))
+            artifacts.load()
+            assert artifacts.stale == ["2"] and "2" not in artifacts.schemas
+            with pytest.raises(ValueError, match=r"\[2\]"):
+                compile_catalog(str(tmp_path / "broken"), ["sqlite"])
+        finally:
+            challenge["expected_output"] = original
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file